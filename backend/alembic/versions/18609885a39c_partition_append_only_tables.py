@@ -0,0 +1,209 @@
+"""partition stock_movements / shipment_events / audit_log by month
+
+Revision ID: 18609885a39c
+Revises: c04b39d6b906
+Create Date: 2026-10-17
+
+Partitionnement RANGE mensuel :
+    stock_movements  -> happened_at
+    shipment_events  -> event_time
+    audit_log        -> created_at
+
+- PK (id, colonne de partition) ; ids toujours servis par la séquence existante
+- partition DEFAULT par table + ensure_monthly_partition(parent, mois) (SQL), appelée
+  ici pour l'historique et par le job backend.app.jobs.partitions pour les mois à venir
+- unicité globale de stock_movements.idempotency_key : table stock_movement_keys
+  (PK = clé) alimentée par trigger AFTER INSERT
+- la FK stock_reservations.reserve_movement_id -> stock_movements.id est supprimée
+  (la cible n'est plus unique sur id seul)
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "18609885a39c"
+down_revision: Union[str, Sequence[str], None] = "c04b39d6b906"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+TABLES = {
+    "stock_movements": {
+        "column": "happened_at",
+        "indexes": {
+            "ix_stock_movements_product_id": "btree (product_id)",
+            "ix_stock_movements_product_time": "btree (product_id, happened_at)",
+            "ix_stock_movements_happened_at_brin": "brin (happened_at)",
+        },
+        "fks": {
+            "stock_movements_created_by_fkey": "(created_by) REFERENCES users(id) ON DELETE RESTRICT",
+            "stock_movements_from_location_id_fkey": "(from_location_id) REFERENCES locations(id) ON DELETE RESTRICT",
+            "stock_movements_product_id_fkey": "(product_id) REFERENCES products(id) ON DELETE RESTRICT",
+            "stock_movements_to_location_id_fkey": "(to_location_id) REFERENCES locations(id) ON DELETE RESTRICT",
+        },
+    },
+    "shipment_events": {
+        "column": "event_time",
+        "indexes": {
+            "ix_shipment_events_shipment_id": "btree (shipment_id)",
+            "ix_shipment_events_ship_time": "btree (shipment_id, event_time)",
+        },
+        "fks": {
+            "shipment_events_shipment_id_fkey": "(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE",
+        },
+    },
+    "audit_log": {
+        "column": "created_at",
+        "indexes": {
+            "ix_audit_entity": "btree (entity_type, entity_id)",
+        },
+        "fks": {
+            "audit_log_actor_id_fkey": "(actor_id) REFERENCES users(id) ON DELETE SET NULL",
+        },
+    },
+}
+
+ENSURE_MONTHLY_PARTITION = """
+CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent text, month_start date) RETURNS boolean AS $$
+DECLARE
+    part text := parent || '_p' || to_char(month_start, 'YYYYMM');
+    lower_bound timestamptz := month_start::timestamp AT TIME ZONE 'UTC';
+    upper_bound timestamptz := (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+    col text;
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    SELECT a.attname INTO col
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent::regclass;
+
+    -- les lignes du mois déjà tombées dans la partition DEFAULT sont déplacées
+    -- avant l'ATTACH (sinon il échoue)
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, parent);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+        parent || '_default', col, lower_bound, col, upper_bound, part
+    );
+    EXECUTE format(
+        'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        parent, part, lower_bound, upper_bound
+    );
+    RETURN true;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+STOCK_MOVEMENT_KEYS_REGISTER = """
+CREATE OR REPLACE FUNCTION stock_movement_keys_register() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO stock_movement_keys (idempotency_key, movement_id, happened_at)
+    VALUES (NEW.idempotency_key, NEW.id, NEW.happened_at);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _partition(table: str, spec: dict) -> None:
+    col = spec["column"]
+    old = f"{table}_unpartitioned"
+
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({col})"
+    )
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+
+    # historique + mois à venir : ensure_monthly_partition vide la DEFAULT mois par mois
+    op.execute(
+        f"""
+        SELECT ensure_monthly_partition('{table}', m::date)
+        FROM (SELECT min({col}) AS first_at FROM {table}) s,
+             generate_series(
+                 date_trunc('month', coalesce(s.first_at, now()) AT TIME ZONE 'UTC'),
+                 date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MONTHS_AHEAD} months',
+                 interval '1 month'
+             ) AS m
+        """
+    )
+
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {col})")
+    for name, definition in spec["indexes"].items():
+        op.execute(f"CREATE INDEX {name} ON {table} USING {definition}")
+    for name, definition in spec["fks"].items():
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY {definition}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def _unpartition(table: str, spec: dict) -> None:
+    old = f"{table}_partitioned"
+
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    op.execute(f"DROP TABLE {old} CASCADE")
+
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)")
+    for name, definition in spec["indexes"].items():
+        op.execute(f"CREATE INDEX {name} ON {table} USING {definition}")
+    for name, definition in spec["fks"].items():
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY {definition}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def upgrade() -> None:
+    op.drop_constraint("stock_reservations_reserve_movement_id_fkey", "stock_reservations", type_="foreignkey")
+
+    op.execute(ENSURE_MONTHLY_PARTITION)
+    for table, spec in TABLES.items():
+        _partition(table, spec)
+
+    op.create_table(
+        "stock_movement_keys",
+        sa.Column("idempotency_key", sa.String(length=64), nullable=False),
+        sa.Column("movement_id", sa.BigInteger(), nullable=False),
+        sa.Column("happened_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("idempotency_key"),
+    )
+    op.execute(
+        "INSERT INTO stock_movement_keys (idempotency_key, movement_id, happened_at) "
+        "SELECT idempotency_key, id, happened_at FROM stock_movements"
+    )
+    op.execute(STOCK_MOVEMENT_KEYS_REGISTER)
+    op.execute(
+        "CREATE TRIGGER trg_stock_movement_keys AFTER INSERT ON stock_movements "
+        "FOR EACH ROW EXECUTE FUNCTION stock_movement_keys_register()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER trg_stock_movement_keys ON stock_movements")
+    op.execute("DROP FUNCTION stock_movement_keys_register()")
+    op.drop_table("stock_movement_keys")
+
+    for table, spec in TABLES.items():
+        _unpartition(table, spec)
+    op.execute("DROP FUNCTION ensure_monthly_partition(text, date)")
+
+    op.create_unique_constraint("stock_movements_idempotency_key_key", "stock_movements", ["idempotency_key"])
+    op.create_foreign_key(
+        "stock_reservations_reserve_movement_id_fkey",
+        "stock_reservations",
+        "stock_movements",
+        ["reserve_movement_id"],
+        ["id"],
+        ondelete="RESTRICT",
+    )
@@ -0,0 +1,37 @@
+"""replace BRIN on stock_movements.happened_at with btree (happened_at, id)
+
+Revision ID: 27d71b719ef0
+Revises: 18609885a39c
+Create Date: 2026-10-17
+
+L'historique paginé (GET /v1/stock-movements, curseur sur (happened_at, id)) sans
+filtre produit doit lire dans l'ordre de l'index : un BRIN ne sait pas trier.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "27d71b719ef0"
+down_revision: Union[str, Sequence[str], None] = "18609885a39c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_stock_movements_time_id", "stock_movements", ["happened_at", "id"], unique=False)
+    op.drop_index("ix_stock_movements_happened_at_brin", table_name="stock_movements")
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_stock_movements_happened_at_brin",
+        "stock_movements",
+        ["happened_at"],
+        unique=False,
+        postgresql_using="brin",
+    )
+    op.drop_index("ix_stock_movements_time_id", table_name="stock_movements")
@@ -0,0 +1,50 @@
+"""add goods receipt posting queue (draft receipts posted by workers)
+
+Revision ID: 3b9d2c71f0a4
+Revises: e6f335e87499
+Create Date: 2026-10-17
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9d2c71f0a4"
+down_revision: Union[str, Sequence[str], None] = "e6f335e87499"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("goods_receipts", sa.Column("to_location_id", sa.BigInteger(), nullable=True))
+    op.add_column("goods_receipts", sa.Column("post_attempts", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("goods_receipts", sa.Column("post_after", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("goods_receipts", sa.Column("post_error", sa.Text(), nullable=True))
+    op.create_foreign_key(
+        "goods_receipts_to_location_id_fkey",
+        "goods_receipts",
+        "locations",
+        ["to_location_id"],
+        ["id"],
+        ondelete="RESTRICT",
+    )
+    op.create_index(
+        "ix_goods_receipts_draft_queue",
+        "goods_receipts",
+        ["po_id", "id"],
+        unique=False,
+        postgresql_where=sa.text("status = 'draft'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_goods_receipts_draft_queue", table_name="goods_receipts")
+    op.drop_constraint("goods_receipts_to_location_id_fkey", "goods_receipts", type_="foreignkey")
+    op.drop_column("goods_receipts", "post_error")
+    op.drop_column("goods_receipts", "post_after")
+    op.drop_column("goods_receipts", "post_attempts")
+    op.drop_column("goods_receipts", "to_location_id")
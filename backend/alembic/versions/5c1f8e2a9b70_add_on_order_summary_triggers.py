@@ -0,0 +1,276 @@
+"""add on_order_summary (site, product) maintained by triggers
+
+Revision ID: 5c1f8e2a9b70
+Revises: 3b9d2c71f0a4
+Create Date: 2026-10-17
+
+ordered_qty / received_qty par (site, produit) sur les lignes des PO engagés
+(received borné au commandé de chaque ligne), tenus à jour par triggers par instruction
+sur purchase_order_lines, purchase_orders, goods_receipt_lines et goods_receipts.
+Backfill depuis les agrégats existants.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "5c1f8e2a9b70"
+down_revision: Union[str, Sequence[str], None] = "3b9d2c71f0a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ON_ORDER_SUMMARY_TRIGGERS = r"""
+CREATE OR REPLACE FUNCTION on_order_summary_apply(
+    p_po bigint[], p_product bigint[],
+    p_o_old int[], p_r_old int[], p_e_old boolean[],
+    p_o_new int[], p_r_new int[], p_e_new boolean[]
+) RETURNS void AS $$
+    -- état courant (visible) de chaque ligne (po, produit) +/- ajustements -> état avant / après
+    WITH chg AS (
+        SELECT c.po_id, c.product_id,
+               sum(c.o_old) AS o_old, sum(c.r_old) AS r_old, bool_or(c.e_old) AS e_old,
+               sum(c.o_new) AS o_new, sum(c.r_new) AS r_new, bool_or(c.e_new) AS e_new
+        FROM unnest(p_po, p_product, p_o_old, p_r_old, p_e_old, p_o_new, p_r_new, p_e_new)
+             AS c(po_id, product_id, o_old, r_old, e_old, o_new, r_new, e_new)
+        GROUP BY c.po_id, c.product_id
+    ),
+    received AS (
+        SELECT gr.po_id, grl.product_id, sum(greatest(grl.qty_received - grl.qty_damaged, 0)) AS qty
+        FROM goods_receipts gr
+        JOIN goods_receipt_lines grl ON grl.receipt_id = gr.id
+        WHERE gr.status = 'posted'
+          AND gr.po_id IN (SELECT po_id FROM chg)
+          AND grl.product_id IN (SELECT product_id FROM chg)
+        GROUP BY gr.po_id, grl.product_id
+    ),
+    states AS (
+        SELECT po.site_id, chg.product_id,
+               coalesce(chg.e_old, po.status IN ('approved', 'shipped', 'partial')) AS e0,
+               coalesce(pol.qty_ordered, 0) + chg.o_old AS o0,
+               coalesce(received.qty, 0) + chg.r_old AS r0,
+               coalesce(chg.e_new, po.status IN ('approved', 'shipped', 'partial')) AS e1,
+               coalesce(pol.qty_ordered, 0) + chg.o_new AS o1,
+               coalesce(received.qty, 0) + chg.r_new AS r1
+        FROM chg
+        JOIN purchase_orders po ON po.id = chg.po_id
+        LEFT JOIN purchase_order_lines pol ON pol.po_id = chg.po_id AND pol.product_id = chg.product_id
+        LEFT JOIN received ON received.po_id = chg.po_id AND received.product_id = chg.product_id
+    ),
+    delta AS (
+        SELECT site_id, product_id,
+               sum(CASE WHEN e1 THEN o1 ELSE 0 END - CASE WHEN e0 THEN o0 ELSE 0 END) AS d_ordered,
+               sum(CASE WHEN e1 THEN least(r1, o1) ELSE 0 END - CASE WHEN e0 THEN least(r0, o0) ELSE 0 END) AS d_received
+        FROM states
+        GROUP BY site_id, product_id
+    )
+    INSERT INTO on_order_summary AS s (site_id, product_id, ordered_qty, received_qty, updated_at)
+    SELECT site_id, product_id, d_ordered, d_received, now()
+    FROM delta
+    WHERE d_ordered <> 0 OR d_received <> 0
+    ORDER BY site_id, product_id
+    ON CONFLICT (site_id, product_id) DO UPDATE
+    SET ordered_qty = s.ordered_qty + excluded.ordered_qty,
+        received_qty = s.received_qty + excluded.received_qty,
+        updated_at = now();
+$$ LANGUAGE sql;
+
+-- lignes de PO : ordered de la ligne
+CREATE OR REPLACE FUNCTION on_order_summary_po_lines() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(-qty_ordered), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(qty_ordered), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM old_rows;
+    ELSE
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(d), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM (
+            SELECT po_id, product_id, -qty_ordered AS d FROM new_rows
+            UNION ALL
+            SELECT po_id, product_id, qty_ordered FROM old_rows
+        ) c;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- lignes de réception : reçu net, seulement pour les réceptions POSTED
+CREATE OR REPLACE FUNCTION on_order_summary_gr_lines() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(-greatest(c.qty_received - c.qty_damaged, 0)),
+            array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM new_rows c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(greatest(c.qty_received - c.qty_damaged, 0)),
+            array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM old_rows c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+    ELSE
+        PERFORM on_order_summary_apply(
+            array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(c.d),
+            array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM (
+            SELECT receipt_id, product_id, -greatest(qty_received - qty_damaged, 0) AS d FROM new_rows
+            UNION ALL
+            SELECT receipt_id, product_id, greatest(qty_received - qty_damaged, 0) FROM old_rows
+        ) c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- réceptions qui entrent dans / sortent de POSTED
+CREATE OR REPLACE FUNCTION on_order_summary_gr_status() RETURNS trigger AS $$
+BEGIN
+    PERFORM on_order_summary_apply(
+        array_agg(n.po_id), array_agg(grl.product_id), array_agg(0),
+        array_agg(CASE WHEN o.status = 'posted' THEN 1 ELSE -1 END * greatest(grl.qty_received - grl.qty_damaged, 0)),
+        array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    JOIN goods_receipt_lines grl ON grl.receipt_id = n.id
+    WHERE (o.status = 'posted') <> (n.status = 'posted');
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- PO qui entrent dans / sortent des statuts engagés
+CREATE OR REPLACE FUNCTION on_order_summary_po_status() RETURNS trigger AS $$
+BEGIN
+    PERFORM on_order_summary_apply(
+        array_agg(n.id), array_agg(pol.product_id), array_agg(0), array_agg(0),
+        array_agg(o.status IN ('approved', 'shipped', 'partial')), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    JOIN purchase_order_lines pol ON pol.po_id = n.id
+    WHERE (o.status IN ('approved', 'shipped', 'partial')) <> (n.status IN ('approved', 'shipped', 'partial'));
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- suppressions : retirées AVANT que les lignes partent en cascade (PO / réception alors invisibles)
+CREATE OR REPLACE FUNCTION on_order_summary_po_delete() RETURNS trigger AS $$
+BEGIN
+    PERFORM on_order_summary_apply(
+        array_agg(po_id), array_agg(product_id), array_agg(0), array_agg(0), array_agg(NULL::boolean),
+        array_agg(0), array_agg(0), array_agg(false))
+    FROM purchase_order_lines WHERE po_id = OLD.id;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION on_order_summary_gr_delete() RETURNS trigger AS $$
+BEGIN
+    IF OLD.status = 'posted' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(OLD.po_id), array_agg(product_id), array_agg(0), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(-greatest(qty_received - qty_damaged, 0)), array_agg(NULL::boolean))
+        FROM goods_receipt_lines WHERE receipt_id = OLD.id;
+    END IF;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_on_order_summary_po_lines_ins AFTER INSERT ON purchase_order_lines
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+CREATE TRIGGER trg_on_order_summary_po_lines_upd AFTER UPDATE ON purchase_order_lines
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+CREATE TRIGGER trg_on_order_summary_po_lines_del AFTER DELETE ON purchase_order_lines
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+CREATE TRIGGER trg_on_order_summary_gr_lines_ins AFTER INSERT ON goods_receipt_lines
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+CREATE TRIGGER trg_on_order_summary_gr_lines_upd AFTER UPDATE ON goods_receipt_lines
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+CREATE TRIGGER trg_on_order_summary_gr_lines_del AFTER DELETE ON goods_receipt_lines
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+CREATE TRIGGER trg_on_order_summary_gr_status AFTER UPDATE ON goods_receipts
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_status();
+CREATE TRIGGER trg_on_order_summary_po_status AFTER UPDATE ON purchase_orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_status();
+CREATE TRIGGER trg_on_order_summary_po_delete BEFORE DELETE ON purchase_orders
+    FOR EACH ROW EXECUTE FUNCTION on_order_summary_po_delete();
+CREATE TRIGGER trg_on_order_summary_gr_delete BEFORE DELETE ON goods_receipts
+    FOR EACH ROW EXECUTE FUNCTION on_order_summary_gr_delete();
+"""
+
+TRIGGERS = {
+    "trg_on_order_summary_po_lines_ins": "purchase_order_lines",
+    "trg_on_order_summary_po_lines_upd": "purchase_order_lines",
+    "trg_on_order_summary_po_lines_del": "purchase_order_lines",
+    "trg_on_order_summary_gr_lines_ins": "goods_receipt_lines",
+    "trg_on_order_summary_gr_lines_upd": "goods_receipt_lines",
+    "trg_on_order_summary_gr_lines_del": "goods_receipt_lines",
+    "trg_on_order_summary_gr_status": "goods_receipts",
+    "trg_on_order_summary_po_status": "purchase_orders",
+    "trg_on_order_summary_po_delete": "purchase_orders",
+    "trg_on_order_summary_gr_delete": "goods_receipts",
+}
+
+FUNCTIONS = (
+    "on_order_summary_po_lines()",
+    "on_order_summary_gr_lines()",
+    "on_order_summary_gr_status()",
+    "on_order_summary_po_status()",
+    "on_order_summary_po_delete()",
+    "on_order_summary_gr_delete()",
+    "on_order_summary_apply(bigint[], bigint[], int[], int[], boolean[], int[], int[], boolean[])",
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "on_order_summary",
+        sa.Column("site_id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("ordered_qty", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("received_qty", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["site_id"], ["sites.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("site_id", "product_id"),
+    )
+
+    # backfill AVANT les triggers, dans la même transaction
+    op.execute(
+        """
+        INSERT INTO on_order_summary (site_id, product_id, ordered_qty, received_qty, updated_at)
+        SELECT po.site_id, pol.product_id,
+               sum(pol.qty_ordered),
+               sum(least(coalesce(r.qty, 0), pol.qty_ordered)),
+               now()
+        FROM purchase_order_lines pol
+        JOIN purchase_orders po ON po.id = pol.po_id
+        LEFT JOIN (
+            SELECT gr.po_id, grl.product_id, sum(greatest(grl.qty_received - grl.qty_damaged, 0)) AS qty
+            FROM goods_receipts gr
+            JOIN goods_receipt_lines grl ON grl.receipt_id = gr.id
+            WHERE gr.status = 'posted'
+            GROUP BY gr.po_id, grl.product_id
+        ) r ON r.po_id = pol.po_id AND r.product_id = pol.product_id
+        WHERE po.status IN ('approved', 'shipped', 'partial')
+        GROUP BY po.site_id, pol.product_id
+        """
+    )
+    op.execute(ON_ORDER_SUMMARY_TRIGGERS)
+
+
+def downgrade() -> None:
+    for trigger, table in TRIGGERS.items():
+        op.execute(f"DROP TRIGGER {trigger} ON {table}")
+    for function in FUNCTIONS:
+        op.execute(f"DROP FUNCTION {function}")
+    op.drop_table("on_order_summary")
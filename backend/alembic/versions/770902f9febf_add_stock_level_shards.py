@@ -0,0 +1,52 @@
+"""add stock level shards (hot-row escrow)
+
+Revision ID: 770902f9febf
+Revises: c6dc61aaf5cb
+Create Date: 2026-10-17
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "770902f9febf"
+down_revision: Union[str, Sequence[str], None] = "c6dc61aaf5cb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "stock_levels",
+        sa.Column("shard_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_check_constraint("ck_stock_shard_count_nonneg", "stock_levels", "shard_count >= 0")
+
+    op.create_table(
+        "stock_level_shards",
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("location_id", sa.BigInteger(), nullable=False),
+        sa.Column("shard_no", sa.Integer(), nullable=False),
+        sa.Column("qty_quota", sa.Integer(), nullable=False),
+        sa.Column("qty_reserved", sa.Integer(), nullable=False),
+        sa.Column("qty_issued", sa.Integer(), nullable=False),
+        sa.CheckConstraint("qty_reserved >= 0", name="ck_stock_shard_reserved_nonneg"),
+        sa.CheckConstraint("qty_issued >= 0", name="ck_stock_shard_issued_nonneg"),
+        sa.CheckConstraint("qty_reserved <= qty_quota", name="ck_stock_shard_reserved_le_quota"),
+        sa.ForeignKeyConstraint(
+            ["product_id", "location_id"],
+            ["stock_levels.product_id", "stock_levels.location_id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("product_id", "location_id", "shard_no"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stock_level_shards")
+    op.drop_constraint("ck_stock_shard_count_nonneg", "stock_levels", type_="check")
+    op.drop_column("stock_levels", "shard_count")
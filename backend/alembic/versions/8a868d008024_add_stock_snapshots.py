@@ -0,0 +1,52 @@
+"""add stock snapshots (ledger projection)
+
+Revision ID: 8a868d008024
+Revises: 11dc41ad9497
+Create Date: 2026-10-17
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8a868d008024"
+down_revision: Union[str, Sequence[str], None] = "11dc41ad9497"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_snapshots",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("site_id", sa.BigInteger(), nullable=True),
+        sa.Column("as_of", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_movement_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["site_id"], ["sites.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_stock_snapshots_site_as_of", "stock_snapshots", ["site_id", "as_of"], unique=False)
+
+    op.create_table(
+        "stock_snapshot_lines",
+        sa.Column("snapshot_id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("location_id", sa.BigInteger(), nullable=False),
+        sa.Column("qty_on_hand", sa.Integer(), nullable=False),
+        sa.Column("qty_reserved", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["snapshot_id"], ["stock_snapshots.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="RESTRICT"),
+        sa.ForeignKeyConstraint(["location_id"], ["locations.id"], ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("snapshot_id", "product_id", "location_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stock_snapshot_lines")
+    op.drop_index("ix_stock_snapshots_site_as_of", table_name="stock_snapshots")
+    op.drop_table("stock_snapshots")
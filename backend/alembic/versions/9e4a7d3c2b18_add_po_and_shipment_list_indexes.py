@@ -0,0 +1,42 @@
+"""add purchase_orders / shipments indexes for keyset-paginated lists
+
+Revision ID: 9e4a7d3c2b18
+Revises: 5c1f8e2a9b70
+Create Date: 2026-10-17
+
+GET /v1/purchase-orders et GET /v1/shipments : curseur sur id, filtres statut / site /
+fournisseur / mode / plage d'ETA. Chaque filtre courant a un index (filtre, id) lu
+directement dans l'ordre de la page.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4a7d3c2b18"
+down_revision: Union[str, Sequence[str], None] = "5c1f8e2a9b70"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_purchase_orders_site_status_id", "purchase_orders", ["site_id", "status", "id"]),
+    ("ix_purchase_orders_status_id", "purchase_orders", ["status", "id"]),
+    ("ix_purchase_orders_supplier_id", "purchase_orders", ["supplier_id", "id"]),
+    ("ix_purchase_orders_expected_eta", "purchase_orders", ["expected_eta"]),
+    ("ix_shipments_status_id", "shipments", ["status", "id"]),
+    ("ix_shipments_mode_id", "shipments", ["mode", "id"]),
+    ("ix_shipments_eta_current", "shipments", ["eta_current"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
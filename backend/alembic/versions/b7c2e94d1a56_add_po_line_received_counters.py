@@ -0,0 +1,51 @@
+"""add qty_received / qty_damaged counters on purchase_order_lines
+
+Revision ID: b7c2e94d1a56
+Revises: 9e4a7d3c2b18
+Create Date: 2026-10-17
+
+Reste ouvert par ligne de PO lu par clé primaire (GET /v1/purchase-orders/{id}/open-lines)
+au lieu d'agréger les réceptions ; compteurs tenus par services.purchase_orders.receive_po_lines.
+Initialisés depuis les réceptions POSTED existantes.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b7c2e94d1a56"
+down_revision: Union[str, Sequence[str], None] = "9e4a7d3c2b18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("purchase_order_lines", sa.Column("qty_received", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("purchase_order_lines", sa.Column("qty_damaged", sa.Integer(), server_default="0", nullable=False))
+    op.execute(
+        """
+        UPDATE purchase_order_lines pol
+        SET qty_received = r.qty_received, qty_damaged = r.qty_damaged
+        FROM (
+            SELECT gr.po_id, grl.product_id, sum(grl.qty_received) AS qty_received, sum(grl.qty_damaged) AS qty_damaged
+            FROM goods_receipts gr
+            JOIN goods_receipt_lines grl ON grl.receipt_id = gr.id
+            WHERE gr.status = 'posted'
+            GROUP BY gr.po_id, grl.product_id
+        ) r
+        WHERE pol.po_id = r.po_id AND pol.product_id = r.product_id
+        """
+    )
+    op.create_check_constraint("ck_po_line_qty_received_nonneg", "purchase_order_lines", "qty_received >= 0")
+    op.create_check_constraint("ck_po_line_qty_damaged_nonneg", "purchase_order_lines", "qty_damaged >= 0")
+
+
+def downgrade() -> None:
+    op.drop_constraint("ck_po_line_qty_damaged_nonneg", "purchase_order_lines", type_="check")
+    op.drop_constraint("ck_po_line_qty_received_nonneg", "purchase_order_lines", type_="check")
+    op.drop_column("purchase_order_lines", "qty_damaged")
+    op.drop_column("purchase_order_lines", "qty_received")
@@ -0,0 +1,53 @@
+"""add stock reservations (TTL + expiry sweeper)
+
+Revision ID: c04b39d6b906
+Revises: 770902f9febf
+Create Date: 2026-10-17
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c04b39d6b906"
+down_revision: Union[str, Sequence[str], None] = "770902f9febf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("location_id", sa.BigInteger(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("status", sa.Enum("active", "closed", "expired", name="reservation_status"), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("reserve_movement_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("closed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.CheckConstraint("quantity >= 0", name="ck_stock_reservation_qty_nonneg"),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="RESTRICT"),
+        sa.ForeignKeyConstraint(["location_id"], ["locations.id"], ondelete="RESTRICT"),
+        sa.ForeignKeyConstraint(["reserve_movement_id"], ["stock_movements.id"], ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("reserve_movement_id"),
+    )
+    op.create_index(
+        "ix_stock_reservations_active_expiry",
+        "stock_reservations",
+        ["expires_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'active'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stock_reservations_active_expiry", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
+    sa.Enum(name="reservation_status").drop(op.get_bind(), checkfirst=True)
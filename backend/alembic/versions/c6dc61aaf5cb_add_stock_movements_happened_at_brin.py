@@ -0,0 +1,32 @@
+"""add BRIN index on stock_movements.happened_at (as-of stock queries)
+
+Revision ID: c6dc61aaf5cb
+Revises: 8a868d008024
+Create Date: 2026-10-17
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c6dc61aaf5cb"
+down_revision: Union[str, Sequence[str], None] = "8a868d008024"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_stock_movements_happened_at_brin",
+        "stock_movements",
+        ["happened_at"],
+        unique=False,
+        postgresql_using="brin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stock_movements_happened_at_brin", table_name="stock_movements")
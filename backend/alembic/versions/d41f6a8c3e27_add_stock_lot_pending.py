@@ -0,0 +1,53 @@
+"""add stock_lot_pending (deferred lot allocation on hot pairs)
+
+Revision ID: d41f6a8c3e27
+Revises: b7c2e94d1a56
+Create Date: 2026-10-17
+
+Couples chauds : un mouvement servi par les shards ne bloque plus sur le verrou de lot
+(SKIP LOCKED) ; le reste non alloué est noté ici et alloué par hot_stock.rebalance.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "d41f6a8c3e27"
+down_revision: Union[str, Sequence[str], None] = "b7c2e94d1a56"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_lot_pending",
+        sa.Column("movement_id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("location_id", sa.BigInteger(), nullable=False),
+        sa.Column("movement_type", postgresql.ENUM(name="movement_type", create_type=False), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint("quantity > 0", name="ck_stock_lot_pending_qty_pos"),
+        sa.ForeignKeyConstraint(
+            ["product_id", "location_id"],
+            ["stock_levels.product_id", "stock_levels.location_id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("movement_id"),
+    )
+    op.create_index(
+        "ix_stock_lot_pending_pair",
+        "stock_lot_pending",
+        ["product_id", "location_id", "movement_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_stock_lot_pending_pair", table_name="stock_lot_pending")
+    op.drop_table("stock_lot_pending")
@@ -0,0 +1,70 @@
+"""skip qty_received / qty_damaged updates in the on_order_summary po_lines trigger
+
+Revision ID: e5a09b4c7d12
+Revises: d41f6a8c3e27
+Create Date: 2026-10-17
+
+receive_po_lines met à jour qty_received / qty_damaged à chaque réception : le trigger
+AFTER UPDATE de purchase_order_lines réagrégeait alors les réceptions du PO pour un delta
+nul. Un trigger AFTER UPDATE OF <colonnes> ne peut pas porter de tables de transition
+(PostgreSQL) : la fonction sort d'emblée quand (po_id, product_id, qty_ordered) n'a changé
+sur aucune ligne.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e5a09b4c7d12"
+down_revision: Union[str, Sequence[str], None] = "d41f6a8c3e27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PO_LINES_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION on_order_summary_po_lines() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(-qty_ordered), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(qty_ordered), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM old_rows;
+    ELSE
+        {update_guard}PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(d), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM (
+            SELECT po_id, product_id, -qty_ordered AS d FROM new_rows
+            UNION ALL
+            SELECT po_id, product_id, qty_ordered FROM old_rows
+        ) c;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+UPDATE_GUARD = """IF NOT EXISTS (
+            SELECT po_id, product_id, qty_ordered FROM old_rows
+            EXCEPT ALL
+            SELECT po_id, product_id, qty_ordered FROM new_rows
+        ) THEN
+            RETURN NULL;
+        END IF;
+        """
+
+
+def upgrade() -> None:
+    op.execute(PO_LINES_FUNCTION.replace("{update_guard}", UPDATE_GUARD))
+
+
+def downgrade() -> None:
+    op.execute(PO_LINES_FUNCTION.replace("{update_guard}", ""))
@@ -0,0 +1,88 @@
+"""add stock lots (lot / expiry level stock, FEFO allocation)
+
+Revision ID: e6f335e87499
+Revises: 27d71b719ef0
+Create Date: 2026-10-17
+
+Le stock existant est repris en un lot "non suivi" (lot_code / expiration_date NULL)
+par StockLevel, valeurs réelles (shards des couples chauds déduits).
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e6f335e87499"
+down_revision: Union[str, Sequence[str], None] = "27d71b719ef0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stock_lots",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("location_id", sa.BigInteger(), nullable=False),
+        sa.Column("lot_code", sa.String(length=64), nullable=True),
+        sa.Column("expiration_date", sa.Date(), nullable=True),
+        sa.Column("qty_on_hand", sa.Integer(), nullable=False),
+        sa.Column("qty_reserved", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint("qty_on_hand >= 0", name="ck_stock_lot_on_hand_nonneg"),
+        sa.CheckConstraint("qty_reserved >= 0", name="ck_stock_lot_reserved_nonneg"),
+        sa.CheckConstraint("qty_reserved <= qty_on_hand", name="ck_stock_lot_reserved_le_on_hand"),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="RESTRICT"),
+        sa.ForeignKeyConstraint(["location_id"], ["locations.id"], ondelete="RESTRICT"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "product_id", "location_id", "lot_code", "expiration_date",
+            name="uq_stock_lot", postgresql_nulls_not_distinct=True,
+        ),
+    )
+    op.create_index(
+        "ix_stock_lots_fefo",
+        "stock_lots",
+        ["product_id", "location_id", "expiration_date", "id"],
+        unique=False,
+    )
+
+    op.create_table(
+        "stock_movement_lots",
+        sa.Column("movement_id", sa.BigInteger(), nullable=False),
+        sa.Column("lot_id", sa.BigInteger(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.CheckConstraint("quantity > 0", name="ck_stock_movement_lot_qty_pos"),
+        sa.ForeignKeyConstraint(["lot_id"], ["stock_lots.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("movement_id", "lot_id"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO stock_lots (product_id, location_id, lot_code, expiration_date, qty_on_hand, qty_reserved, updated_at)
+        SELECT sl.product_id, sl.location_id, NULL, NULL,
+               sl.qty_on_hand - coalesce(sh.issued, 0),
+               sl.qty_reserved - coalesce(sh.escrowed, 0) + coalesce(sh.reserved, 0),
+               now()
+        FROM stock_levels sl
+        LEFT JOIN (
+            SELECT product_id, location_id,
+                   sum(qty_issued) AS issued,
+                   sum(qty_quota + qty_issued) AS escrowed,
+                   sum(qty_reserved) AS reserved
+            FROM stock_level_shards
+            GROUP BY product_id, location_id
+        ) sh ON sh.product_id = sl.product_id AND sh.location_id = sl.location_id
+        WHERE sl.qty_on_hand - coalesce(sh.issued, 0) > 0
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stock_movement_lots")
+    op.drop_index("ix_stock_lots_fefo", table_name="stock_lots")
+    op.drop_table("stock_lots")
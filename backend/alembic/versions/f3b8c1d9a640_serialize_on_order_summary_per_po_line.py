@@ -0,0 +1,100 @@
+"""serialize on_order_summary maintenance per (po, product)
+
+Revision ID: f3b8c1d9a640
+Revises: e5a09b4c7d12
+Create Date: 2026-10-17
+
+on_order_summary_apply lisait les réceptions visibles dans le snapshot de l'instruction :
+deux réceptions concurrentes de la même ligne de PO (sur-réception bornée au commandé)
+comptaient chacune l'autre comme non reçue, received_qty dépassait le commandé et le
+qty_on_order synchronisé devenait négatif (ck_stock_on_order_nonneg). La fonction prend
+d'abord un verrou consultatif de transaction par (po, produit), puis calcule dans un
+nouveau snapshot (fonction VOLATILE) où la réception concurrente est commitée.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f3b8c1d9a640"
+down_revision: Union[str, Sequence[str], None] = "e5a09b4c7d12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+APPLY_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION on_order_summary_apply(
+    p_po bigint[], p_product bigint[],
+    p_o_old int[], p_r_old int[], p_e_old boolean[],
+    p_o_new int[], p_r_new int[], p_e_new boolean[]
+) RETURNS void AS $$
+{lock}    -- état courant (visible) de chaque ligne (po, produit) +/- ajustements -> état avant / après
+    WITH chg AS (
+        SELECT c.po_id, c.product_id,
+               sum(c.o_old) AS o_old, sum(c.r_old) AS r_old, bool_or(c.e_old) AS e_old,
+               sum(c.o_new) AS o_new, sum(c.r_new) AS r_new, bool_or(c.e_new) AS e_new
+        FROM unnest(p_po, p_product, p_o_old, p_r_old, p_e_old, p_o_new, p_r_new, p_e_new)
+             AS c(po_id, product_id, o_old, r_old, e_old, o_new, r_new, e_new)
+        GROUP BY c.po_id, c.product_id
+    ),
+    received AS (
+        SELECT gr.po_id, grl.product_id, sum(greatest(grl.qty_received - grl.qty_damaged, 0)) AS qty
+        FROM goods_receipts gr
+        JOIN goods_receipt_lines grl ON grl.receipt_id = gr.id
+        WHERE gr.status = 'posted'
+          AND gr.po_id IN (SELECT po_id FROM chg)
+          AND grl.product_id IN (SELECT product_id FROM chg)
+        GROUP BY gr.po_id, grl.product_id
+    ),
+    states AS (
+        SELECT po.site_id, chg.product_id,
+               coalesce(chg.e_old, po.status IN ('approved', 'shipped', 'partial')) AS e0,
+               coalesce(pol.qty_ordered, 0) + chg.o_old AS o0,
+               coalesce(received.qty, 0) + chg.r_old AS r0,
+               coalesce(chg.e_new, po.status IN ('approved', 'shipped', 'partial')) AS e1,
+               coalesce(pol.qty_ordered, 0) + chg.o_new AS o1,
+               coalesce(received.qty, 0) + chg.r_new AS r1
+        FROM chg
+        JOIN purchase_orders po ON po.id = chg.po_id
+        LEFT JOIN purchase_order_lines pol ON pol.po_id = chg.po_id AND pol.product_id = chg.product_id
+        LEFT JOIN received ON received.po_id = chg.po_id AND received.product_id = chg.product_id
+    ),
+    delta AS (
+        SELECT site_id, product_id,
+               sum(CASE WHEN e1 THEN o1 ELSE 0 END - CASE WHEN e0 THEN o0 ELSE 0 END) AS d_ordered,
+               sum(CASE WHEN e1 THEN least(r1, o1) ELSE 0 END - CASE WHEN e0 THEN least(r0, o0) ELSE 0 END) AS d_received
+        FROM states
+        GROUP BY site_id, product_id
+    )
+    INSERT INTO on_order_summary AS s (site_id, product_id, ordered_qty, received_qty, updated_at)
+    SELECT site_id, product_id, d_ordered, d_received, now()
+    FROM delta
+    WHERE d_ordered <> 0 OR d_received <> 0
+    ORDER BY site_id, product_id
+    ON CONFLICT (site_id, product_id) DO UPDATE
+    SET ordered_qty = s.ordered_qty + excluded.ordered_qty,
+        received_qty = s.received_qty + excluded.received_qty,
+        updated_at = now();
+$$ LANGUAGE sql;
+"""
+
+LOCK = """    -- sérialise par (po, produit) jusqu'au commit (ordre des clés : pas d'interblocage)
+    SELECT pg_advisory_xact_lock(k)
+    FROM (
+        SELECT DISTINCT hashtextextended('on_order_summary:' || po_id || ':' || product_id, 0) AS k
+        FROM unnest(p_po, p_product) AS c(po_id, product_id)
+    ) keys
+    ORDER BY k;
+
+"""
+
+
+def upgrade() -> None:
+    op.execute(APPLY_FUNCTION.replace("{lock}", LOCK))
+
+
+def downgrade() -> None:
+    op.execute(APPLY_FUNCTION.replace("{lock}", ""))
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
-from typing import Generator
-from backend.app.db.session import SessionLocal
+from typing import AsyncGenerator, Generator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.db.session import AsyncSessionLocal, SessionLocal
 
 def get_db() -> Generator:
     db = SessionLocal()
@@ -9,3 +12,12 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session async : l'attente DB ne bloque plus un thread du threadpool FastAPI.
+    Les services restent synchrones (Session) : les appeler via `await db.run_sync(fn, ...)`.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,47 @@
+"""
+Pagination keyset (curseur opaque) partagée par les endpoints de liste.
+
+Le curseur encode les valeurs de la clé de tri de la dernière ligne renvoyée
+(ex: (happened_at, id)) ; la page suivante repart de "> clé" au lieu d'un OFFSET :
+coût constant quelle que soit la profondeur dans l'historique.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def encode_cursor(*values) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """Décode un curseur et convertit chaque valeur (datetime / int / str). 400 si invalide."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(raw, list) or len(raw) != len(types):
+            raise ValueError(cursor)
+        return tuple(
+            datetime.fromisoformat(v) if t is datetime else t(v)
+            for v, t in zip(raw, types)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(rows: list, limit: int, key) -> dict:
+    """
+    rows lus avec LIMIT limit + 1 : page de limit lignes, next_cursor = clé de la dernière
+    (key(row) -> tuple) s'il reste des lignes, sinon None.
+    """
+    if len(rows) <= limit:
+        return {"items": rows, "next_cursor": None}
+    rows = rows[:limit]
+    return {"items": rows, "next_cursor": encode_cursor(*key(rows[-1]))}
@@ -1,26 +1,40 @@
 from __future__ import annotations
 
 import hashlib
-from datetime import datetime
+from datetime import date, datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from backend.app.api.deps import get_db
+from backend.app.api.deps import get_async_db
 from backend.app.db.models.models_v1 import (
+    Container,
     GoodsReceipt,
     GoodsReceiptLine,
     PurchaseOrder,
     PurchaseOrderLine,
-    StockLevel,
-    StockMovement,
-    Location,
 )
-from backend.app.db.models.core_types import MovementType, ReceiptStatus
-from backend.app.services.inventory import rebuild_qty_on_order
+from backend.app.db.models.core_types import ReceiptStatus
+from backend.app.services.locations import LocationRef, get_location
+from backend.app.services.manifests import (
+    MANIFEST_CHUNK_SIZE,
+    ManifestSplitter,
+    iter_lines,
+    iter_manifest_rows,
+    manifest_format,
+)
+from backend.app.services.receipt_queue import queue_state
+from backend.app.services.receiving import (
+    has_pending_drafts,
+    post_receipt,
+    post_receipt_lines,
+    record_receipt_lines,
+    shipment_po_products,
+)
 
 router = APIRouter(prefix="/goods-receipts")
 
@@ -28,6 +42,8 @@ router = APIRouter(prefix="/goods-receipts")
 class GRLineCreate(BaseModel):
     product_id: int
     qty_received: int = Field(gt=0)
+    lot_code: str | None = Field(default=None, max_length=64)
+    expiration_date: date | None = None
 
 
 class GRCreate(BaseModel):
@@ -37,8 +53,8 @@ class GRCreate(BaseModel):
     lines: list[GRLineCreate] = Field(default_factory=list)
 
 
-def _ensure_location(db: Session, location_id: int) -> Location:
-    loc = db.get(Location, location_id)
+def _ensure_location(db: Session, location_id: int) -> LocationRef:
+    loc = get_location(db, location_id)
     if not loc:
         raise HTTPException(status_code=400, detail="Invalid to_location_id")
     return loc
@@ -49,146 +65,241 @@ def _receipt_key(site_id: int, key: str) -> str:
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
 
-def _move_key(
-    receipt_key: str,
-    product_id: int,
-    to_location_id: int,
-    received_at: datetime,
-    qty: int,
-) -> str:
-    raw = f"GRMOVE:{receipt_key}:{product_id}:{to_location_id}:{received_at.isoformat()}:{qty}"
-    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+def _receipt_out(gr: GoodsReceipt) -> dict:
+    return {
+        "id": gr.id,
+        "po_id": gr.po_id,
+        "to_location_id": gr.to_location_id,
+        "idempotency_key": gr.idempotency_key,
+        "status": queue_state(gr),
+    }
+
+
+def _post_goods_receipt(db: Session, payload: GRCreate, idempotency_key: str, queue: bool = False) -> dict:
+    """
+    Corps synchrone de la réception (exécuté via run_sync). Ne commit pas.
+
+    queue=True : brouillon mis en file (services.receipt_queue), comptabilisé par les workers.
+    Un PO qui a déjà des brouillons en file est toujours mis en file (ordre par PO).
+    """
+    po = db.get(PurchaseOrder, payload.po_id)
+    if not po:
+        raise HTTPException(status_code=404, detail="PO not found")
+
+    loc = _ensure_location(db, payload.to_location_id)
+    if loc.site_id != po.site_id:
+        raise HTTPException(status_code=400, detail="to_location_id is not in the PO site")
+
+    po_lines = (
+        db.execute(select(PurchaseOrderLine).where(PurchaseOrderLine.po_id == po.id))
+        .scalars()
+        .all()
+    )
+    po_product_ids = {l.product_id for l in po_lines}
+    for ln in payload.lines:
+        if ln.product_id not in po_product_ids:
+            raise HTTPException(status_code=400, detail=f"product_id {ln.product_id} not in PO")
+
+    rkey = _receipt_key(site_id=int(po.site_id), key=idempotency_key)
+
+    existing = db.execute(
+        select(GoodsReceipt).where(GoodsReceipt.idempotency_key == rkey)
+    ).scalar_one_or_none()
+    if existing:
+        return _receipt_out(existing)
+
+    queue = queue or has_pending_drafts(db, int(po.id))
+    gr = GoodsReceipt(
+        po_id=po.id,
+        site_id=po.site_id,
+        status=ReceiptStatus.draft if queue else ReceiptStatus.posted,
+        received_at=payload.received_at,
+        received_by=1,
+        idempotency_key=rkey,
+        to_location_id=payload.to_location_id,
+        post_after=func.now() if queue else None,
+    )
+    db.add(gr)
+
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        existing = db.execute(
+            select(GoodsReceipt).where(GoodsReceipt.idempotency_key == rkey)
+        ).scalar_one()
+        return _receipt_out(existing)
+
+    lines = [(ln.product_id, ln.qty_received) for ln in payload.lines]
+    lots = {ln.product_id: (ln.lot_code, ln.expiration_date) for ln in payload.lines}
+    if queue:
+        # brouillon : lignes seulement, stock / mouvements / qty_on_order par les workers
+        record_receipt_lines(db, gr, lines, lots)
+        db.flush()
+        return _receipt_out(gr)
+
+    # comptabilisation set-based : upsert verrouillé des StockLevel, lignes et mouvements en masse
+    post_receipt_lines(
+        db,
+        gr,
+        to_location_id=payload.to_location_id,
+        lines=lines,
+        lots=lots,
+    )
+    return _receipt_out(gr)
 
 
 @router.post("")
-def create_goods_receipt(
+async def create_goods_receipt(
     payload: GRCreate,
-    db: Session = Depends(get_db),
+    response: Response,
+    post_async: bool = Query(default=False, alias="async"),
+    db: AsyncSession = Depends(get_async_db),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
+    """
+    ?async=true : la réception est enregistrée en brouillon et mise en file (202) ;
+    l'avancement se suit sur GET /goods-receipts/{id}.
+    """
     if not idempotency_key or not idempotency_key.strip():
         raise HTTPException(status_code=400, detail="Missing Idempotency-Key header")
 
     try:
-        po = db.get(PurchaseOrder, payload.po_id)
-        if not po:
-            raise HTTPException(status_code=404, detail="PO not found")
-
-        loc = _ensure_location(db, payload.to_location_id)
-        if loc.site_id != po.site_id:
-            raise HTTPException(status_code=400, detail="to_location_id is not in the PO site")
-
-        po_lines = (
-            db.execute(select(PurchaseOrderLine).where(PurchaseOrderLine.po_id == po.id))
-            .scalars()
-            .all()
-        )
-        po_product_ids = {l.product_id for l in po_lines}
-        for ln in payload.lines:
-            if ln.product_id not in po_product_ids:
-                raise HTTPException(status_code=400, detail=f"product_id {ln.product_id} not in PO")
+        result = await db.run_sync(_post_goods_receipt, payload, idempotency_key, post_async)
+        await db.commit()
+        if result["status"] != ReceiptStatus.posted.name:
+            response.status_code = 202
+        return result
 
-        rkey = _receipt_key(site_id=int(po.site_id), key=idempotency_key)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
 
-        existing = db.execute(
-            select(GoodsReceipt).where(GoodsReceipt.idempotency_key == rkey)
-        ).scalar_one_or_none()
-        if existing:
-            return {
-                "id": existing.id,
-                "po_id": existing.po_id,
-                "to_location_id": payload.to_location_id,
-                "idempotency_key": existing.idempotency_key,
-            }
 
-        gr = GoodsReceipt(
-            po_id=po.id,
-            site_id=po.site_id,
-            status=ReceiptStatus.posted,
-            received_at=payload.received_at,
-            received_by=1,
-            idempotency_key=rkey,
+@router.post("/manifest")
+async def receive_container_manifest(
+    request: Request,
+    response: Response,
+    container_id: int,
+    to_location_id: int,
+    received_at: datetime | None = None,
+    chunk_size: int = Query(default=MANIFEST_CHUNK_SIZE, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
+    """
+    Réception d'un conteneur depuis son manifeste (corps text/csv ou application/x-ndjson,
+    colonnes po_id, product_id, qty_received), lu en flux.
+
+    Les lignes sont regroupées par PO du shipment du conteneur ; chaque lot de chunk_size
+    produits devient une réception POSTED, commitée aussitôt ; sur un PO qui a des
+    brouillons en file, un brouillon mis en file à la suite (queued=true, réponse 202).
+    Rejeu avec la même Idempotency-Key : les lots déjà enregistrés sont ignorés (replayed=true).
+    En cas d'erreur, le détail de la 400 liste les réceptions déjà enregistrées.
+    """
+    if not idempotency_key or not idempotency_key.strip():
+        raise HTTPException(status_code=400, detail="Missing Idempotency-Key header")
+    fmt = manifest_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Manifest must be text/csv or application/x-ndjson")
+
+    container = await db.get(Container, container_id)
+    if not container:
+        raise HTTPException(status_code=404, detail="Container not found")
+    loc = await db.run_sync(_ensure_location, to_location_id)
+    site_id = int(loc.site_id)
+    shipment_id = int(container.shipment_id)
+    received_at = received_at or datetime.now(timezone.utc)
+    await db.rollback()
+
+    splitter = ManifestSplitter(chunk_size)
+    po_products: dict[int, frozenset[int]] = {}
+    receipts: list[dict] = []
+    rows = 0
+
+    async def post(po_id: int, chunk_no: int, lines: list[tuple[int, int]]) -> None:
+        receipt_id, created, queued = await db.run_sync(
+            post_receipt,
+            po_id=po_id,
+            site_id=site_id,
+            to_location_id=to_location_id,
+            received_at=received_at,
+            idempotency_key=_receipt_key(site_id, f"{idempotency_key}:{container_id}:{po_id}:{chunk_no}"),
+            lines=lines,
+            container_id=container_id,
         )
-        db.add(gr)
-
-        try:
-            db.flush()
-        except IntegrityError:
-            db.rollback()
-            existing = db.execute(
-                select(GoodsReceipt).where(GoodsReceipt.idempotency_key == rkey)
-            ).scalar_one()
-            return {
-                "id": existing.id,
-                "po_id": existing.po_id,
-                "to_location_id": payload.to_location_id,
-                "idempotency_key": existing.idempotency_key,
+        await db.commit()
+        receipts.append(
+            {
+                "po_id": po_id,
+                "chunk": chunk_no,
+                "receipt_id": receipt_id,
+                "lines": len(lines),
+                "replayed": not created,
+                "queued": queued,
             }
+        )
 
-        for ln in payload.lines:
-            db.add(
-                GoodsReceiptLine(
-                    receipt_id=gr.id,
-                    product_id=ln.product_id,
-                    qty_received=ln.qty_received,
-                    qty_damaged=0,
+    try:
+        async for line_no, po_id, product_id, qty in iter_manifest_rows(iter_lines(request.stream()), fmt):
+            if po_id not in po_products:
+                po_products[po_id] = await db.run_sync(
+                    shipment_po_products, po_id, shipment_id=shipment_id, site_id=site_id
                 )
-            )
+                await db.rollback()
+            if product_id not in po_products[po_id]:
+                raise ValueError(f"line {line_no}: product_id {product_id} not in PO {po_id}")
+            rows += 1
+            batch = splitter.add(po_id, product_id, qty)
+            if batch:
+                await post(*batch)
+        for batch in splitter.drain():
+            await post(*batch)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"error": str(e), "rows": rows, "receipts": receipts})
 
-            sl = db.execute(
-                select(StockLevel).where(
-                    StockLevel.product_id == ln.product_id,
-                    StockLevel.location_id == payload.to_location_id,
-                )
-            ).scalar_one_or_none()
-
-            if not sl:
-                sl = StockLevel(
-                    product_id=ln.product_id,
-                    location_id=payload.to_location_id,
-                    qty_on_hand=0,
-                    qty_reserved=0,
-                )
-                db.add(sl)
-                db.flush()
-
-            sl.qty_on_hand += ln.qty_received
-
-            mk = _move_key(
-                rkey,
-                ln.product_id,
-                payload.to_location_id,
-                payload.received_at,
-                ln.qty_received,
-            )
-            db.add(
-                StockMovement(
-                    product_id=ln.product_id,
-                    from_location_id=None,
-                    to_location_id=payload.to_location_id,
-                    movement_type=MovementType.receipt,
-                    quantity=ln.qty_received,
-                    reason="GOODS_RECEIPT",
-                    happened_at=payload.received_at,
-                    created_by=1,
-                    idempotency_key=mk,
-                )
-            )
+    if any(r["queued"] for r in receipts):
+        response.status_code = 202
+    return {
+        "container_id": container_id,
+        "rows": rows,
+        "lines": sum(r["lines"] for r in receipts),
+        "receipts": receipts,
+    }
 
-        product_ids = [ln.product_id for ln in payload.lines]
-        rebuild_qty_on_order(db, site_id=int(po.site_id), product_ids=product_ids)
 
-        db.commit()
-        return {
-            "id": gr.id,
-            "po_id": po.id,
-            "to_location_id": payload.to_location_id,
-            "idempotency_key": gr.idempotency_key,
-        }
+def _get_goods_receipt(db: Session, receipt_id: int) -> dict:
+    gr = db.get(GoodsReceipt, receipt_id)
+    if not gr:
+        raise HTTPException(status_code=404, detail="Goods receipt not found")
+    lines = db.execute(
+        select(
+            GoodsReceiptLine.product_id,
+            GoodsReceiptLine.qty_received,
+            GoodsReceiptLine.lot_code,
+            GoodsReceiptLine.expiration_date,
+        )
+        .where(GoodsReceiptLine.receipt_id == gr.id)
+        .order_by(GoodsReceiptLine.product_id)
+    ).all()
+    return {
+        **_receipt_out(gr),
+        "received_at": gr.received_at,
+        "post_attempts": gr.post_attempts,
+        "post_error": gr.post_error,
+        "next_attempt_at": gr.post_after if gr.status == ReceiptStatus.draft else None,
+        "lines": [
+            {"product_id": pid, "qty_received": qty, "lot_code": lot_code, "expiration_date": expiration_date}
+            for pid, qty, lot_code, expiration_date in lines
+        ],
+    }
 
-    except HTTPException:
-        db.rollback()
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{receipt_id}")
+async def get_goods_receipt(receipt_id: int, db: AsyncSession = Depends(get_async_db)):
+    """État d'une réception : posted / cancelled, ou en file (queued / retrying / failed)."""
+    return await db.run_sync(_get_goods_receipt, receipt_id)
@@ -1,11 +1,10 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends
-from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from backend.app.api.deps import get_db
-from backend.app.db.models.models_v1 import Location
+from backend.app.services.locations import location_registry
 
 router = APIRouter(prefix="/locations")
 
@@ -15,17 +14,17 @@ def list_locations(
     site_id: int | None = None,
     db: Session = Depends(get_db),
 ):
-    stmt = select(Location).order_by(Location.site_id, Location.id)
+    registry = location_registry(db)
     if site_id is not None:
-        stmt = stmt.where(Location.site_id == site_id)
-
-    rows = db.execute(stmt).scalars().all()
+        rows = registry.site_locations(site_id)
+    else:
+        rows = sorted(registry.by_id.values(), key=lambda l: (l.site_id, l.id))
     return [
         {
             "id": l.id,
             "site_id": l.site_id,
             "name": l.name,
-            "type": getattr(l, "type", None),
+            "type": l.type,
         }
         for l in rows
     ]
@@ -1,21 +1,26 @@
 from __future__ import annotations
 
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException
+from decimal import Decimal
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, Field
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from backend.app.api.deps import get_db
+from backend.app.api.deps import get_async_db, get_db
+from backend.app.api.pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, keyset_page
 from backend.app.db.models.models_v1 import (
     PurchaseOrder,
     PurchaseOrderLine,
-    Supplier,
-    Site,
-    Product,
-    Shipment,
 )
 from backend.app.db.models.core_types import POStatus
+from backend.app.services import purchase_orders as po_service
+from backend.app.services.po_csv import parse_po_csv
+
+MAX_PO_CSV_BYTES = 5 * 1024 * 1024
 
 router = APIRouter(prefix="/purchase-orders")
 
@@ -32,25 +37,66 @@ class POCreate(BaseModel):
     site_id: int = 1
     expected_eta: date | None = None
     shipment_id: int | None = None
-    lines: list[POLineCreate] = Field(default_factory=list)
+    lines: list[POLineCreate] = Field(default_factory=list, max_length=po_service.MAX_BATCH_LINES)
+
+
+class POBatchCreate(BaseModel):
+    pos: list[POCreate] = Field(min_length=1, max_length=500)
+
+
+class POBulkApprove(BaseModel):
+    po_ids: list[int] = Field(min_length=1, max_length=500)
+
+
+PO_LIST_COLUMNS = (
+    PurchaseOrder.id,
+    PurchaseOrder.po_number,
+    PurchaseOrder.supplier_id,
+    PurchaseOrder.site_id,
+    PurchaseOrder.status,
+    PurchaseOrder.expected_eta,
+    PurchaseOrder.shipment_id,
+    PurchaseOrder.created_at,
+)
 
 
 @router.get("")
-def list_pos(db: Session = Depends(get_db)):
-    rows = db.execute(select(PurchaseOrder).order_by(PurchaseOrder.id.desc())).scalars().all()
-    return [
-        {
-            "id": po.id,
-            "po_number": po.po_number,
-            "supplier_id": po.supplier_id,
-            "site_id": po.site_id,
-            "status": po.status,
-            "expected_eta": po.expected_eta,
-            "shipment_id": po.shipment_id,
-            "created_at": po.created_at,
-        }
-        for po in rows
-    ]
+def list_pos(
+    status: list[POStatus] | None = Query(default=None),
+    supplier_id: int | None = None,
+    site_id: int | None = None,
+    eta_from: date | None = None,
+    eta_to: date | None = None,
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    PO paginés par curseur sur id (plus récents d'abord par défaut), colonnes projetées.
+    - status (répétable), supplier_id, site_id : index (filtre, id)
+    - eta_from / eta_to : expected_eta inclus dans [eta_from, eta_to]
+    - next_cursor absent = fin de la liste
+    """
+    desc = order == "desc"
+    stmt = select(*PO_LIST_COLUMNS)
+    if status:
+        stmt = stmt.where(PurchaseOrder.status.in_(status))
+    if supplier_id is not None:
+        stmt = stmt.where(PurchaseOrder.supplier_id == supplier_id)
+    if site_id is not None:
+        stmt = stmt.where(PurchaseOrder.site_id == site_id)
+    if eta_from is not None:
+        stmt = stmt.where(PurchaseOrder.expected_eta >= eta_from)
+    if eta_to is not None:
+        stmt = stmt.where(PurchaseOrder.expected_eta <= eta_to)
+    if cursor is not None:
+        (after_id,) = decode_cursor(cursor, int)
+        stmt = stmt.where(PurchaseOrder.id < after_id if desc else PurchaseOrder.id > after_id)
+    stmt = stmt.order_by(PurchaseOrder.id.desc() if desc else PurchaseOrder.id)
+
+    rows = db.execute(stmt.limit(limit + 1)).mappings().all()
+    return keyset_page(rows, limit, lambda r: (r["id"],))
 
 
 @router.get("/{po_id}")
@@ -78,53 +124,156 @@ def get_po(po_id: int, db: Session = Depends(get_db)):
                 "product_id": l.product_id,
                 "qty_ordered": l.qty_ordered,
                 "unit_cost": float(l.unit_cost),
+                "qty_received": l.qty_received,
+                "qty_damaged": l.qty_damaged,
             }
             for l in lines
         ],
     }
 
 
+@router.get("/{po_id}/open-lines")
+def get_po_open_lines(po_id: int, db: Session = Depends(get_db)):
+    """
+    Reste ouvert par ligne (commandé, reçu, endommagé, ouvert), une requête par clé primaire :
+    compteurs tenus à chaque réception POSTED, sans agrégat sur les réceptions.
+    """
+    rows = db.execute(
+        select(
+            PurchaseOrder.status,
+            PurchaseOrderLine.product_id,
+            PurchaseOrderLine.qty_ordered,
+            PurchaseOrderLine.qty_received,
+            PurchaseOrderLine.qty_damaged,
+            po_service.po_line_open_qty().label("qty_open"),
+        )
+        .select_from(PurchaseOrder)
+        .outerjoin(PurchaseOrderLine, PurchaseOrderLine.po_id == PurchaseOrder.id)
+        .where(PurchaseOrder.id == po_id)
+        .order_by(PurchaseOrderLine.product_id)
+    ).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="PO not found")
+    lines = [
+        {
+            "product_id": r.product_id,
+            "qty_ordered": r.qty_ordered,
+            "qty_received": r.qty_received,
+            "qty_damaged": r.qty_damaged,
+            "qty_open": r.qty_open,
+        }
+        for r in rows
+        if r.product_id is not None
+    ]
+    return {
+        "id": po_id,
+        "status": rows[0].status,
+        "qty_open": sum(l["qty_open"] for l in lines),
+        "lines": lines,
+    }
+
+
+def _spec(payload: POCreate) -> po_service.POSpec:
+    return {
+        **payload.model_dump(exclude={"lines"}),
+        "lines": [(ln.product_id, ln.qty_ordered, Decimal(str(ln.unit_cost))) for ln in payload.lines],
+    }
+
+
+def _create(db: Session, specs: list[po_service.POSpec]) -> list[dict]:
+    """create_pos + commit ; 409 sur po_number déjà pris, 400 sur référence invalide."""
+    try:
+        created = po_service.create_pos(db, specs)
+    except po_service.PONumberConflict as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    return [
+        {"id": po_id, "po_number": po_number, "lines": len(spec["lines"])}
+        for (po_id, po_number), spec in zip(created, specs)
+    ]
+
+
 @router.post("")
 def create_po(payload: POCreate, db: Session = Depends(get_db)):
-    # Unique PO number
-    exists = db.execute(select(PurchaseOrder).where(PurchaseOrder.po_number == payload.po_number)).scalar_one_or_none()
-    if exists:
-        raise HTTPException(status_code=409, detail="PO number already exists")
-
-    # FK checks (fail fast, message clair)
-    if not db.get(Supplier, payload.supplier_id):
-        raise HTTPException(status_code=400, detail="Invalid supplier_id")
-    if not db.get(Site, payload.site_id):
-        raise HTTPException(status_code=400, detail="Invalid site_id")
-    if payload.shipment_id is not None and not db.get(Shipment, payload.shipment_id):
-        raise HTTPException(status_code=400, detail="Invalid shipment_id")
-
-    # Validate products in lines
-    for ln in payload.lines:
-        if not db.get(Product, ln.product_id):
-            raise HTTPException(status_code=400, detail=f"Invalid product_id {ln.product_id}")
-
-    po = PurchaseOrder(
-        po_number=payload.po_number,
-        supplier_id=payload.supplier_id,
-        site_id=payload.site_id,
-        status=POStatus.draft,
-        expected_eta=payload.expected_eta,
-        shipment_id=payload.shipment_id,
-    )
-    db.add(po)
-    db.flush()  # get po.id
-
-    for ln in payload.lines:
-        db.add(
-            PurchaseOrderLine(
-                po_id=po.id,
-                product_id=ln.product_id,
-                qty_ordered=ln.qty_ordered,
-                unit_cost=ln.unit_cost,
-            )
-        )
+    # validation set-based : une requête IN par table, lignes insérées en masse
+    created = _create(db, [_spec(payload)])[0]
+    return {"id": created["id"], "po_number": created["po_number"]}
+
+
+@router.post("/batch")
+def create_po_batch(payload: POBatchCreate, db: Session = Depends(get_db)):
+    """Plusieurs PO en une transaction, tout ou rien."""
+    return {"created": _create(db, [_spec(p) for p in payload.pos])}
+
+
+@router.post("/upload")
+async def upload_pos(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    PO depuis un CSV (text/csv, une ligne par ligne de PO, cf. services.po_csv),
+    une transaction, tout ou rien.
+    """
+    if (request.headers.get("content-type") or "").split(";")[0].strip().lower() != "text/csv":
+        raise HTTPException(status_code=415, detail="PO upload must be text/csv")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_PO_CSV_BYTES:
+            raise HTTPException(status_code=413, detail=f"CSV larger than {MAX_PO_CSV_BYTES} bytes")
+    try:
+        specs = parse_po_csv(body.decode("utf-8-sig").splitlines())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not specs:
+        raise HTTPException(status_code=400, detail="CSV has no PO lines")
+    return {"created": await db.run_sync(_create, specs)}
+
 
+def _change_status(db: Session, po_id: int, change) -> dict:
+    po = db.get(PurchaseOrder, po_id)
+    if not po:
+        raise HTTPException(status_code=404, detail="PO not found")
+    try:
+        changed = change(db, po)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+    db.commit()
+    return {"id": po.id, "status": po.status, "changed": changed}
+
+
+@router.post("/approve")
+def approve_pos(payload: POBulkApprove, db: Session = Depends(get_db)):
+    """
+    Approbation en masse (draft -> approved), une transaction, tout ou rien.
+    qty_on_order des DOCK resynchronisé une seule fois pour tous les produits des PO.
+    """
+    try:
+        changed = po_service.approve_pos(db, payload.po_ids)
+    except LookupError as e:
+        db.rollback()
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
     db.commit()
-    db.refresh(po)
-    return {"id": po.id, "po_number": po.po_number}
+    statuses = dict(db.execute(select(PurchaseOrder.id, PurchaseOrder.status).where(PurchaseOrder.id.in_(changed))).all())
+    return {
+        "approved": sum(changed.values()),
+        "results": [{"id": po_id, "status": statuses[po_id], "changed": c} for po_id, c in changed.items()],
+    }
+
+
+@router.post("/{po_id}/approve")
+def approve_po(po_id: int, db: Session = Depends(get_db)):
+    """draft -> approved ; ajoute le reste ouvert des lignes au qty_on_order du DOCK."""
+    return _change_status(db, po_id, po_service.approve_po)
+
+
+@router.post("/{po_id}/cancel")
+def cancel_po(po_id: int, db: Session = Depends(get_db)):
+    """-> cancelled ; retire du qty_on_order le reste ouvert si le PO était engagé."""
+    return _change_status(db, po_id, po_service.cancel_po)
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 from datetime import datetime, date
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.app.api.deps import get_db
+from backend.app.api.deps import get_async_db
+from backend.app.api.pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, keyset_page
 from backend.app.db.models.models_v1 import Shipment, ShipmentEvent
 from backend.app.db.models.core_types import ShipmentMode, ShipmentStatus
 
@@ -31,29 +34,59 @@ class ShipmentEventCreate(BaseModel):
     description: str | None = None
 
 
+SHIPMENT_LIST_COLUMNS = (
+    Shipment.id,
+    Shipment.mode,
+    Shipment.carrier,
+    Shipment.tracking_ref,
+    Shipment.origin,
+    Shipment.destination,
+    Shipment.status,
+    Shipment.eta_initial,
+    Shipment.eta_current,
+    Shipment.last_event_at,
+    Shipment.created_at,
+)
+
+
 @router.get("")
-def list_shipments(db: Session = Depends(get_db)):
-    rows = db.execute(select(Shipment).order_by(Shipment.id.desc())).scalars().all()
-    return [
-        {
-            "id": s.id,
-            "mode": s.mode,
-            "carrier": s.carrier,
-            "tracking_ref": s.tracking_ref,
-            "origin": s.origin,
-            "destination": s.destination,
-            "status": s.status,
-            "eta_initial": s.eta_initial,
-            "eta_current": s.eta_current,
-            "last_event_at": s.last_event_at,
-            "created_at": s.created_at,
-        }
-        for s in rows
-    ]
+async def list_shipments(
+    status: list[ShipmentStatus] | None = Query(default=None),
+    mode: ShipmentMode | None = None,
+    eta_from: date | None = None,
+    eta_to: date | None = None,
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Shipments paginés par curseur sur id (plus récents d'abord par défaut), colonnes projetées.
+    - status (répétable), mode : index (filtre, id)
+    - eta_from / eta_to : eta_current inclus dans [eta_from, eta_to]
+    - next_cursor absent = fin de la liste
+    """
+    desc = order == "desc"
+    stmt = select(*SHIPMENT_LIST_COLUMNS)
+    if status:
+        stmt = stmt.where(Shipment.status.in_(status))
+    if mode is not None:
+        stmt = stmt.where(Shipment.mode == mode)
+    if eta_from is not None:
+        stmt = stmt.where(Shipment.eta_current >= eta_from)
+    if eta_to is not None:
+        stmt = stmt.where(Shipment.eta_current <= eta_to)
+    if cursor is not None:
+        (after_id,) = decode_cursor(cursor, int)
+        stmt = stmt.where(Shipment.id < after_id if desc else Shipment.id > after_id)
+    stmt = stmt.order_by(Shipment.id.desc() if desc else Shipment.id)
+
+    rows = (await db.execute(stmt.limit(limit + 1))).mappings().all()
+    return keyset_page(rows, limit, lambda r: (r["id"],))
 
 
 @router.post("")
-def create_shipment(payload: ShipmentCreate, db: Session = Depends(get_db)):
+async def create_shipment(payload: ShipmentCreate, db: AsyncSession = Depends(get_async_db)):
     s = Shipment(
         mode=payload.mode,
         carrier=payload.carrier,
@@ -65,26 +98,30 @@ def create_shipment(payload: ShipmentCreate, db: Session = Depends(get_db)):
         eta_current=payload.eta_current,
     )
     db.add(s)
-    db.commit()
-    db.refresh(s)
+    await db.commit()
     return {"id": s.id}
 
 
 @router.get("/{shipment_id}/events")
-def list_events(shipment_id: int, db: Session = Depends(get_db)):
-    ship = db.get(Shipment, shipment_id)
+async def list_events(
+    shipment_id: int,
+    since: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    ship = await db.get(Shipment, shipment_id)
     if not ship:
         raise HTTPException(status_code=404, detail="Shipment not found")
 
-    rows = (
-        db.execute(
-            select(ShipmentEvent)
-            .where(ShipmentEvent.shipment_id == shipment_id)
-            .order_by(ShipmentEvent.event_time.desc())
-        )
-        .scalars()
-        .all()
+    stmt = (
+        select(ShipmentEvent)
+        .where(ShipmentEvent.shipment_id == shipment_id)
+        .order_by(ShipmentEvent.event_time.desc())
     )
+    # shipment_events est partitionnée par mois sur event_time : since élague les partitions
+    if since is not None:
+        stmt = stmt.where(ShipmentEvent.event_time >= since)
+
+    rows = (await db.execute(stmt)).scalars().all()
     return [
         {
             "id": e.id,
@@ -99,8 +136,8 @@ def list_events(shipment_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/{shipment_id}/events")
-def add_event(shipment_id: int, payload: ShipmentEventCreate, db: Session = Depends(get_db)):
-    ship = db.get(Shipment, shipment_id)
+async def add_event(shipment_id: int, payload: ShipmentEventCreate, db: AsyncSession = Depends(get_async_db)):
+    ship = await db.get(Shipment, shipment_id)
     if not ship:
         raise HTTPException(status_code=404, detail="Shipment not found")
 
@@ -131,5 +168,5 @@ def add_event(shipment_id: int, payload: ShipmentEventCreate, db: Session = Depe
     elif code in {"DELIVERED"}:
         ship.status = ShipmentStatus.delivered
 
-    db.commit()
+    await db.commit()
     return {"ok": True}
@@ -1,36 +1,91 @@
 from __future__ import annotations
 
+from datetime import date, datetime, timezone
+
 from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from backend.app.api.deps import get_db
-from backend.app.db.models.models_v1 import StockLevel, Location, Product
-from backend.app.schemas.stock_level import StockLevelRead
+from backend.app.api.deps import get_async_db
+from backend.app.db.models.models_v1 import StockLevel, StockLot, Location, Product
+from backend.app.schemas.stock_level import StockLevelAsOfRead, StockLevelRead, StockLotRead
+from backend.app.services.hot_stock import shard_totals
+from backend.app.services.ledger import project_balances
+from backend.app.services.lots import FEFO_ORDER
 
 router = APIRouter(prefix="/stock")
 
 
+def _stock_as_of(
+    db: Session,
+    as_of: datetime,
+    site_id: int | None,
+    location_id: int | None,
+    product_id: int | None,
+) -> list[dict]:
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=timezone.utc)
+
+    balances = project_balances(
+        db,
+        site_id=site_id,
+        location_id=location_id,
+        product_ids=[product_id] if product_id is not None else None,
+        as_of=as_of,
+    )
+    return [
+        {
+            "product_id": pid,
+            "location_id": lid,
+            "as_of": as_of,
+            "qty_on_hand": on_hand,
+            "qty_reserved": reserved,
+        }
+        for (pid, lid), (on_hand, reserved) in sorted(balances.items(), key=lambda kv: (kv[0][1], kv[0][0]))
+        if on_hand or reserved
+    ]
+
+
 @router.get(
     "",
-    response_model=list[StockLevelRead],
+    response_model=list[StockLevelRead] | list[StockLevelAsOfRead],
 )
-def get_stock(
+async def get_stock(
     site_id: int | None = None,
     location_id: int | None = None,
     product_id: int | None = None,
-    db: Session = Depends(get_db),
+    as_of: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Stock (READ ONLY)
     - qty_on_order est calculé, jamais modifiable
     - exposition sécurisée via schema Pydantic
+    - as_of : soldes on_hand / reserved à un instant passé, reconstruits depuis la
+      dernière photo antérieure (stock_snapshots) + les mouvements suivants
     """
+    if as_of is not None:
+        return await db.run_sync(_stock_as_of, as_of, site_id, location_id, product_id)
 
+    # couples chauds : StockLevel compte l'escrow des shards, on expose le réel
+    t = shard_totals().subquery()
     stmt = (
-        select(StockLevel)
+        select(
+            StockLevel.product_id,
+            StockLevel.location_id,
+            (StockLevel.qty_on_hand - func.coalesce(t.c.issued, 0)).label("qty_on_hand"),
+            (StockLevel.qty_reserved - func.coalesce(t.c.escrowed, 0) + func.coalesce(t.c.reserved, 0)).label(
+                "qty_reserved"
+            ),
+            StockLevel.qty_on_order,
+        )
         .join(Location, Location.id == StockLevel.location_id)
         .join(Product, Product.id == StockLevel.product_id)
+        .outerjoin(
+            t,
+            (t.c.product_id == StockLevel.product_id) & (t.c.location_id == StockLevel.location_id),
+        )
         .order_by(Location.site_id, StockLevel.location_id, Product.sku)
     )
 
@@ -43,5 +98,33 @@ def get_stock(
     if product_id is not None:
         stmt = stmt.where(StockLevel.product_id == product_id)
 
-    stock_levels = db.execute(stmt).scalars().all()
+    stock_levels = (await db.execute(stmt)).mappings().all()
     return stock_levels
+
+
+@router.get("/lots", response_model=list[StockLotRead])
+async def get_stock_lots(
+    product_id: int,
+    location_id: int | None = None,
+    site_id: int | None = None,
+    expiring_before: date | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Stock par lot d'un produit (READ ONLY), dans l'ordre de prélèvement FEFO
+    (péremption la plus proche d'abord, lots sans date en dernier).
+    """
+    stmt = (
+        select(StockLot)
+        .where(StockLot.product_id == product_id)
+        .where(StockLot.qty_on_hand > 0)
+        .order_by(StockLot.location_id, *FEFO_ORDER)
+    )
+    if location_id is not None:
+        stmt = stmt.where(StockLot.location_id == location_id)
+    if site_id is not None:
+        stmt = stmt.where(StockLot.location_id.in_(select(Location.id).where(Location.site_id == site_id)))
+    if expiring_before is not None:
+        stmt = stmt.where(StockLot.expiration_date < expiring_before)
+
+    return (await db.execute(stmt)).scalars().all()
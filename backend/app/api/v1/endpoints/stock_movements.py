@@ -2,14 +2,22 @@ from __future__ import annotations
 
 import hashlib
 from datetime import datetime
-from fastapi import APIRouter, Depends, Header, HTTPException
-from pydantic import BaseModel, Field
-from sqlalchemy import select
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from pydantic import BaseModel, Field, StringConstraints
+from sqlalchemy import or_, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from backend.app.api.deps import get_db
-from backend.app.db.models.models_v1 import StockLevel, StockMovement, Location
+from backend.app.api.deps import get_async_db
+from backend.app.api.pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, keyset_page
+from backend.app.db.models.models_v1 import StockLevel, StockMovement, StockMovementKey, Location
 from backend.app.db.models.core_types import MovementType
+from backend.app.schemas.stock_movement import StockMovementPage
+from backend.app.services import lots, movements, reservations
+from backend.app.services.stock_levels import lock_stock_levels
 
 router = APIRouter(prefix="/stock-movements")
 
@@ -30,6 +38,16 @@ class ReserveCreate(BaseModel):
     quantity: int = Field(gt=0)
     happened_at: datetime
     reason: str | None = None
+    ttl_seconds: int | None = Field(default=None, gt=0)  # libérée automatiquement à échéance
+
+
+class UnreserveCreate(BaseModel):
+    product_id: int
+    location_id: int
+    quantity: int = Field(gt=0)
+    happened_at: datetime
+    reason: str | None = None
+    reservation_id: int | None = None  # réservation à TTL à décrémenter
 
 
 class IssueCreate(BaseModel):
@@ -38,6 +56,26 @@ class IssueCreate(BaseModel):
     quantity: int = Field(gt=0)
     happened_at: datetime
     reason: str | None = None
+    reservation_id: int | None = None
+
+
+class BatchMovementItem(BaseModel):
+    # même règle que l'en-tête Idempotency-Key : espaces retirés, vide refusé (422)
+    idempotency_key: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=64)]
+    movement_type: MovementType
+    product_id: int
+    # RESERVE / UNRESERVE / ISSUE
+    location_id: int | None = None
+    # TRANSFER
+    from_location_id: int | None = None
+    to_location_id: int | None = None
+    quantity: int = Field(gt=0)
+    happened_at: datetime
+    reason: str | None = None
+
+
+class BatchCreate(BaseModel):
+    items: list[BatchMovementItem] = Field(min_length=1, max_length=1000)
 
 
 # ---------- Helpers ----------
@@ -47,40 +85,188 @@ def _require_idempotency_key(idempotency_key: str | None) -> str:
     return idempotency_key.strip()
 
 
-def _get_or_create_stock_level(db: Session, product_id: int, location_id: int) -> StockLevel:
-    sl = (
-        db.execute(
-            select(StockLevel)
-            .where(StockLevel.product_id == product_id)
-            .where(StockLevel.location_id == location_id)
-            .with_for_update()
+async def _find_existing_movement(db: AsyncSession, idem: str) -> StockMovementKey | None:
+    # registre global des clés : une lecture de PK, sans parcourir les partitions
+    return await db.get(StockMovementKey, idem)
+
+
+# ---------- Règles de stock (batch, objets ORM verrouillés) ----------
+def _apply_transfer(src: StockLevel, dst: StockLevel, quantity: int) -> None:
+    available = src.qty_on_hand - src.qty_reserved
+    if available < quantity:
+        raise HTTPException(status_code=400, detail=f"Insufficient available stock (available={available})")
+
+    src.qty_on_hand -= quantity
+    dst.qty_on_hand += quantity
+
+
+def _apply_reserve(sl: StockLevel, quantity: int) -> None:
+    available = sl.qty_on_hand - sl.qty_reserved
+    if available < quantity:
+        raise HTTPException(status_code=400, detail=f"Insufficient available stock (available={available})")
+
+    sl.qty_reserved += quantity
+
+
+def _apply_unreserve(sl: StockLevel, quantity: int) -> None:
+    if sl.qty_reserved < quantity:
+        raise HTTPException(status_code=400, detail=f"Insufficient reserved stock (reserved={sl.qty_reserved})")
+
+    sl.qty_reserved -= quantity
+
+
+def _apply_issue(sl: StockLevel, quantity: int) -> None:
+    # règle simple: on consomme d'abord le réservé (picking)
+    if sl.qty_reserved < quantity:
+        raise HTTPException(status_code=400, detail=f"Not enough reserved to issue (reserved={sl.qty_reserved})")
+    if sl.qty_on_hand < quantity:
+        raise HTTPException(status_code=400, detail=f"Not enough on hand to issue (on_hand={sl.qty_on_hand})")
+
+    sl.qty_reserved -= quantity
+    sl.qty_on_hand -= quantity
+
+
+BATCH_MOVEMENT_TYPES = {
+    MovementType.transfer,
+    MovementType.reserve,
+    MovementType.unreserve,
+    MovementType.issue,
+}
+
+
+def _batch_item_stock_keys(item: BatchMovementItem) -> list[tuple[int, int]]:
+    """Valide la forme d'un item et retourne les StockLevel qu'il touche."""
+    if item.movement_type not in BATCH_MOVEMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported movement_type {item.movement_type.value}")
+
+    if item.movement_type == MovementType.transfer:
+        if item.from_location_id is None or item.to_location_id is None:
+            raise HTTPException(status_code=400, detail="from_location_id and to_location_id are required")
+        if item.from_location_id == item.to_location_id:
+            raise HTTPException(status_code=400, detail="from_location_id and to_location_id must differ")
+        return [
+            (item.product_id, item.from_location_id),
+            (item.product_id, item.to_location_id),
+        ]
+
+    if item.location_id is None:
+        raise HTTPException(status_code=400, detail="location_id is required")
+    return [(item.product_id, item.location_id)]
+
+
+def _apply_batch_item(
+    levels: dict[tuple[int, int], StockLevel],
+    item: BatchMovementItem,
+    idem: str,
+) -> StockMovement:
+    if item.movement_type == MovementType.transfer:
+        _apply_transfer(
+            levels[(item.product_id, item.from_location_id)],
+            levels[(item.product_id, item.to_location_id)],
+            item.quantity,
         )
-        .scalar_one_or_none()
-    )
-    if sl:
-        return sl
-
-    sl = StockLevel(
-        product_id=product_id,
-        location_id=location_id,
-        qty_on_hand=0,
-        qty_reserved=0,
-        qty_on_order=0,
+        from_location_id, to_location_id = item.from_location_id, item.to_location_id
+    else:
+        sl = levels[(item.product_id, item.location_id)]
+        if item.movement_type == MovementType.reserve:
+            _apply_reserve(sl, item.quantity)
+        elif item.movement_type == MovementType.unreserve:
+            _apply_unreserve(sl, item.quantity)
+        else:
+            _apply_issue(sl, item.quantity)
+        from_location_id, to_location_id = item.location_id, None
+
+    return StockMovement(
+        product_id=item.product_id,
+        from_location_id=from_location_id,
+        to_location_id=to_location_id,
+        movement_type=item.movement_type,
+        quantity=item.quantity,
+        reason=item.reason,
+        happened_at=item.happened_at,
+        created_by=1,
+        idempotency_key=idem,
     )
-    db.add(sl)
-    db.flush()
-    return sl
 
 
-def _find_existing_movement(db: Session, idem: str) -> StockMovement | None:
-    return db.execute(select(StockMovement).where(StockMovement.idempotency_key == idem)).scalar_one_or_none()
+# ---------- Endpoints ----------
+@router.get("", response_model=StockMovementPage)
+async def list_stock_movements(
+    product_id: int | None = None,
+    location_id: int | None = None,
+    movement_type: MovementType | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Historique du ledger, paginé par curseur sur (happened_at, id).
+    - product_id : ix_stock_movements_product_time ; since / until : élagage des partitions
+    - location_id : source OU destination
+    - next_cursor absent = fin de l'historique
+    """
+    desc = order == "desc"
+    stmt = select(StockMovement)
+
+    if product_id is not None:
+        stmt = stmt.where(StockMovement.product_id == product_id)
+    if location_id is not None:
+        stmt = stmt.where(
+            or_(StockMovement.from_location_id == location_id, StockMovement.to_location_id == location_id)
+        )
+    if movement_type is not None:
+        stmt = stmt.where(StockMovement.movement_type == movement_type)
+    if since is not None:
+        stmt = stmt.where(StockMovement.happened_at >= since)
+    if until is not None:
+        stmt = stmt.where(StockMovement.happened_at < until)
+
+    if cursor is not None:
+        after_at, after_id = decode_cursor(cursor, datetime, int)
+        key = tuple_(StockMovement.happened_at, StockMovement.id)
+        # borne simple sur happened_at en plus de la comparaison de tuple : utilisable par l'index
+        if desc:
+            stmt = stmt.where(StockMovement.happened_at <= after_at, key < tuple_(after_at, after_id))
+        else:
+            stmt = stmt.where(StockMovement.happened_at >= after_at, key > tuple_(after_at, after_id))
+
+    if desc:
+        stmt = stmt.order_by(StockMovement.happened_at.desc(), StockMovement.id.desc())
+    else:
+        stmt = stmt.order_by(StockMovement.happened_at, StockMovement.id)
+
+    rows = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+    return keyset_page(rows, limit, lambda r: (r.happened_at, r.id))
+
+
+async def _run_fast_path(db: AsyncSession, idem: str, apply, **kwargs) -> dict:
+    """
+    Exécute un mouvement du fast path SQL (services.movements) puis commit.
+    - ValueError (stock insuffisant) -> 400
+    - IntegrityError sur la même Idempotency-Key (requête concurrente) -> replay
+    """
+    try:
+        mv_id = await db.run_sync(apply, idempotency_key=idem, **kwargs)
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        await db.rollback()
+        existing = await _find_existing_movement(db, idem)
+        if existing:
+            return {"id": int(existing.movement_id), "idempotency_key": existing.idempotency_key}
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    return {"id": mv_id, "idempotency_key": idem}
 
 
-# ---------- Endpoints ----------
 @router.post("/transfer")
-def transfer_stock(
+async def transfer_stock(
     payload: TransferCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     idem = _require_idempotency_key(idempotency_key)
@@ -89,140 +275,212 @@ def transfer_stock(
         raise HTTPException(status_code=400, detail="from_location_id and to_location_id must differ")
 
     # idempotent replay
-    existing = _find_existing_movement(db, idem)
+    existing = await _find_existing_movement(db, idem)
     if existing:
-        return {"id": int(existing.id), "idempotency_key": existing.idempotency_key}
-
-    # lock stock levels
-    src = _get_or_create_stock_level(db, payload.product_id, payload.from_location_id)
-    dst = _get_or_create_stock_level(db, payload.product_id, payload.to_location_id)
-
-    available = src.qty_on_hand - src.qty_reserved
-    if available < payload.quantity:
-        raise HTTPException(status_code=400, detail=f"Insufficient available stock (available={available})")
-
-    src.qty_on_hand -= payload.quantity
-    dst.qty_on_hand += payload.quantity
+        return {"id": int(existing.movement_id), "idempotency_key": existing.idempotency_key}
 
-    mv = StockMovement(
+    return await _run_fast_path(
+        db,
+        idem,
+        movements.transfer,
         product_id=payload.product_id,
         from_location_id=payload.from_location_id,
         to_location_id=payload.to_location_id,
-        movement_type=MovementType.transfer,
         quantity=payload.quantity,
-        reason=payload.reason,
         happened_at=payload.happened_at,
-        created_by=1,
-        idempotency_key=idem,
+        reason=payload.reason,
     )
-    db.add(mv)
-    db.commit()
-    return {"id": int(mv.id), "idempotency_key": mv.idempotency_key}
+
+
+async def _with_reservation_id(db: AsyncSession, result: dict) -> dict:
+    reservation_id = await db.run_sync(reservations.reservation_for_movement, result["id"])
+    if reservation_id is not None:
+        result["reservation_id"] = int(reservation_id)
+    return result
+
+
+async def _with_lots(db: AsyncSession, result: dict) -> dict:
+    """Lots alloués (FEFO) au mouvement : ce que le préparateur doit prendre."""
+    result["lots"] = await db.run_sync(lots.movement_lots, result["id"])
+    return result
 
 
 @router.post("/reserve")
-def reserve_stock(
+async def reserve_stock(
     payload: ReserveCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     idem = _require_idempotency_key(idempotency_key)
 
-    existing = _find_existing_movement(db, idem)
+    existing = await _find_existing_movement(db, idem)
     if existing:
-        return {"id": int(existing.id), "idempotency_key": existing.idempotency_key}
-
-    sl = _get_or_create_stock_level(db, payload.product_id, payload.location_id)
-    available = sl.qty_on_hand - sl.qty_reserved
-    if available < payload.quantity:
-        raise HTTPException(status_code=400, detail=f"Insufficient available stock (available={available})")
+        result = {"id": int(existing.movement_id), "idempotency_key": existing.idempotency_key}
+        if payload.ttl_seconds:
+            result = await _with_reservation_id(db, result)
+        return await _with_lots(db, result)
 
-    sl.qty_reserved += payload.quantity
-
-    mv = StockMovement(
+    fields = dict(
         product_id=payload.product_id,
-        from_location_id=payload.location_id,
-        to_location_id=None,
-        movement_type=MovementType.reserve,
+        location_id=payload.location_id,
         quantity=payload.quantity,
-        reason=payload.reason,
         happened_at=payload.happened_at,
-        created_by=1,
-        idempotency_key=idem,
+        reason=payload.reason,
     )
-    db.add(mv)
-    db.commit()
-    return {"id": int(mv.id), "idempotency_key": mv.idempotency_key}
+    if payload.ttl_seconds is None:
+        return await _with_lots(db, await _run_fast_path(db, idem, movements.reserve, **fields))
+
+    result = await _run_fast_path(db, idem, reservations.reserve, ttl_seconds=payload.ttl_seconds, **fields)
+    return await _with_lots(db, await _with_reservation_id(db, result))
 
 
 @router.post("/unreserve")
-def unreserve_stock(
-    payload: ReserveCreate,
-    db: Session = Depends(get_db),
+async def unreserve_stock(
+    payload: UnreserveCreate,
+    db: AsyncSession = Depends(get_async_db),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     idem = _require_idempotency_key(idempotency_key)
 
-    existing = _find_existing_movement(db, idem)
+    existing = await _find_existing_movement(db, idem)
     if existing:
-        return {"id": int(existing.id), "idempotency_key": existing.idempotency_key}
-
-    sl = _get_or_create_stock_level(db, payload.product_id, payload.location_id)
-    if sl.qty_reserved < payload.quantity:
-        raise HTTPException(status_code=400, detail=f"Insufficient reserved stock (reserved={sl.qty_reserved})")
-
-    sl.qty_reserved -= payload.quantity
+        return {"id": int(existing.movement_id), "idempotency_key": existing.idempotency_key}
 
-    mv = StockMovement(
+    fields = dict(
         product_id=payload.product_id,
-        from_location_id=payload.location_id,
-        to_location_id=None,
-        movement_type=MovementType.unreserve,
+        location_id=payload.location_id,
         quantity=payload.quantity,
-        reason=payload.reason,
         happened_at=payload.happened_at,
-        created_by=1,
-        idempotency_key=idem,
+        reason=payload.reason,
     )
-    db.add(mv)
-    db.commit()
-    return {"id": int(mv.id), "idempotency_key": mv.idempotency_key}
+    if payload.reservation_id is None:
+        return await _run_fast_path(db, idem, movements.unreserve, **fields)
+    return await _run_fast_path(db, idem, reservations.unreserve, reservation_id=payload.reservation_id, **fields)
 
 
 @router.post("/issue")
-def issue_stock(
+async def issue_stock(
     payload: IssueCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     idem = _require_idempotency_key(idempotency_key)
 
-    existing = _find_existing_movement(db, idem)
+    existing = await _find_existing_movement(db, idem)
     if existing:
-        return {"id": int(existing.id), "idempotency_key": existing.idempotency_key}
+        return await _with_lots(db, {"id": int(existing.movement_id), "idempotency_key": existing.idempotency_key})
 
-    sl = _get_or_create_stock_level(db, payload.product_id, payload.location_id)
-
-    # règle simple: on consomme d'abord le réservé (picking)
-    if sl.qty_reserved < payload.quantity:
-        raise HTTPException(status_code=400, detail=f"Not enough reserved to issue (reserved={sl.qty_reserved})")
-    if sl.qty_on_hand < payload.quantity:
-        raise HTTPException(status_code=400, detail=f"Not enough on hand to issue (on_hand={sl.qty_on_hand})")
-
-    sl.qty_reserved -= payload.quantity
-    sl.qty_on_hand -= payload.quantity
-
-    mv = StockMovement(
+    fields = dict(
         product_id=payload.product_id,
-        from_location_id=payload.location_id,
-        to_location_id=None,
-        movement_type=MovementType.issue,
+        location_id=payload.location_id,
         quantity=payload.quantity,
-        reason=payload.reason,
         happened_at=payload.happened_at,
-        created_by=1,
-        idempotency_key=idem,
+        reason=payload.reason,
     )
-    db.add(mv)
-    db.commit()
-    return {"id": int(mv.id), "idempotency_key": mv.idempotency_key}
+    if payload.reservation_id is None:
+        result = await _run_fast_path(db, idem, movements.issue, **fields)
+    else:
+        result = await _run_fast_path(db, idem, reservations.issue, reservation_id=payload.reservation_id, **fields)
+    return await _with_lots(db, result)
+
+
+def _existing_keys(db: Session, idems: list[str]) -> dict[str, int]:
+    # idempotent replay: une seule requête pour tout le batch
+    return {
+        k.idempotency_key: int(k.movement_id)
+        for k in db.execute(
+            select(StockMovementKey).where(StockMovementKey.idempotency_key.in_(set(idems)))
+        ).scalars()
+    }
+
+
+def _apply_batch(db: Session, payload: BatchCreate) -> dict:
+    """
+    Corps synchrone du batch (exécuté via run_sync). Ne commit pas.
+
+    Une requête concurrente qui enregistre la clé d'un item entre la lecture des clés et
+    le flush lève une IntegrityError : le batch est annulé (SAVEPOINT) puis rejoué, l'item
+    sort alors en "replayed". Toute autre IntegrityError remonte.
+    """
+    idems = [item.idempotency_key for item in payload.items]
+    existing = _existing_keys(db, idems)
+    while True:
+        try:
+            with db.begin_nested():
+                return _apply_batch_once(db, payload, idems, existing)
+        except IntegrityError:
+            known, existing = existing, _existing_keys(db, idems)
+            if existing.keys() <= known.keys():
+                raise
+
+
+def _apply_batch_once(db: Session, payload: BatchCreate, idems: list[str], existing: dict[str, int]) -> dict:
+    # validation + collecte des StockLevel à verrouiller
+    errors: dict[int, str] = {}
+    lock_keys: set[tuple[int, int]] = set()
+    for i, (item, idem) in enumerate(zip(payload.items, idems)):
+        if idem in existing:
+            continue
+        try:
+            lock_keys.update(_batch_item_stock_keys(item))
+        except HTTPException as e:
+            errors[i] = e.detail
+
+    levels = lock_stock_levels(db, lock_keys)
+
+    created: dict[str, StockMovement] = {}
+    outcomes: list[tuple[str, str, str | None]] = []  # (idem, status, detail)
+    for i, (item, idem) in enumerate(zip(payload.items, idems)):
+        if idem in existing or idem in created:
+            outcomes.append((idem, "replayed", None))
+            continue
+        if i in errors:
+            outcomes.append((idem, "rejected", errors[i]))
+            continue
+        try:
+            mv = _apply_batch_item(levels, item, idem)
+        except HTTPException as e:
+            outcomes.append((idem, "rejected", e.detail))
+            continue
+        db.add(mv)
+        created[idem] = mv
+        outcomes.append((idem, "created", None))
+
+    db.flush()
+    for mv in created.values():
+        lots.apply_movement(db, mv)
+    ids = {**existing, **{idem: int(mv.id) for idem, mv in created.items()}}
+
+    results = []
+    for idem, status, detail in outcomes:
+        res = {"idempotency_key": idem, "status": status, "id": ids.get(idem)}
+        if detail is not None:
+            res["detail"] = detail
+        results.append(res)
+
+    return {
+        "created": sum(1 for _, status, _ in outcomes if status == "created"),
+        "replayed": sum(1 for _, status, _ in outcomes if status == "replayed"),
+        "rejected": sum(1 for _, status, _ in outcomes if status == "rejected"),
+        "results": results,
+    }
+
+
+@router.post("/batch")
+async def batch_stock_movements(payload: BatchCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Applique jusqu'à 1000 mouvements (TRANSFER / RESERVE / UNRESERVE / ISSUE) en UNE transaction.
+
+    - Idempotency-Key par item (champ idempotency_key) : un item déjà connu est rejoué, pas réappliqué
+    - tous les StockLevel concernés sont verrouillés en un seul SELECT ... FOR UPDATE, en ordre trié
+      (cf. services.stock_levels)
+    - un item refusé (stock insuffisant, item invalide) n'empêche pas les autres d'être appliqués
+    - un résultat par item, dans l'ordre de la requête
+    """
+    try:
+        result = await db.run_sync(_apply_batch, payload)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig))
+    return result
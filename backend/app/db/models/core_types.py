@@ -47,3 +47,8 @@ class ReceiptStatus(str, enum.Enum):
     draft = "DRAFT"
     posted = "POSTED"
     cancelled = "CANCELLED"
+
+class ReservationStatus(str, enum.Enum):
+    active = "ACTIVE"
+    closed = "CLOSED"
+    expired = "EXPIRED"
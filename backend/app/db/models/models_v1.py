@@ -17,6 +17,10 @@ from sqlalchemy import (
     UniqueConstraint,
     Index,
     CheckConstraint,
+    ForeignKeyConstraint,
+    DDL,
+    event,
+    text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -29,6 +33,7 @@ from backend.app.db.models.core_types import (
     ShipmentMode,
     ShipmentStatus,
     ReceiptStatus,
+    ReservationStatus,
 )
 
 # ---------- MASTER DATA ----------
@@ -111,8 +116,16 @@ class Shipment(Base):
     events: Mapped[list["ShipmentEvent"]] = relationship(back_populates="shipment", cascade="all, delete-orphan")
     containers: Mapped[list["Container"]] = relationship(back_populates="shipment", cascade="all, delete-orphan")
 
+    # listes paginées (GET /v1/shipments) : filtre + tri par id
+    __table_args__ = (
+        Index("ix_shipments_status_id", "status", "id"),
+        Index("ix_shipments_mode_id", "mode", "id"),
+        Index("ix_shipments_eta_current", "eta_current"),
+    )
+
 
 class ShipmentEvent(Base):
+    # partitionnée par mois sur event_time en base (migration 18609885a39c, jobs.partitions)
     __tablename__ = "shipment_events"
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     shipment_id: Mapped[int] = mapped_column(
@@ -164,6 +177,14 @@ class PurchaseOrder(Base):
     site: Mapped[Site] = relationship()
     lines: Mapped[list["PurchaseOrderLine"]] = relationship(back_populates="po", cascade="all, delete-orphan")
 
+    # listes paginées (GET /v1/purchase-orders) : filtre + tri par id
+    __table_args__ = (
+        Index("ix_purchase_orders_site_status_id", "site_id", "status", "id"),
+        Index("ix_purchase_orders_status_id", "status", "id"),
+        Index("ix_purchase_orders_supplier_id", "supplier_id", "id"),
+        Index("ix_purchase_orders_expected_eta", "expected_eta"),
+    )
+
 
 class PurchaseOrderLine(Base):
     __tablename__ = "purchase_order_lines"
@@ -171,6 +192,9 @@ class PurchaseOrderLine(Base):
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="RESTRICT"), primary_key=True)
     qty_ordered: Mapped[int] = mapped_column(Integer, nullable=False)
     unit_cost: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    # cumul des lignes de réceptions POSTED de ce PO / produit (services.purchase_orders.receive_po_lines)
+    qty_received: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    qty_damaged: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     po: Mapped[PurchaseOrder] = relationship(back_populates="lines")
     product: Mapped[Product] = relationship()
@@ -178,6 +202,8 @@ class PurchaseOrderLine(Base):
     __table_args__ = (
         CheckConstraint("qty_ordered > 0", name="ck_po_line_qty_pos"),
         CheckConstraint("unit_cost >= 0", name="ck_po_line_unit_cost_nonneg"),
+        CheckConstraint("qty_received >= 0", name="ck_po_line_qty_received_nonneg"),
+        CheckConstraint("qty_damaged >= 0", name="ck_po_line_qty_damaged_nonneg"),
     )
 
 
@@ -215,9 +241,20 @@ class GoodsReceipt(Base):
     # Idempotence receipt (clé unique, nullable OK)
     idempotency_key: Mapped[str | None] = mapped_column(String(64), unique=True)
 
+    to_location_id: Mapped[int | None] = mapped_column(ForeignKey("locations.id", ondelete="RESTRICT"))
+    # file de comptabilisation des brouillons (services.receipt_queue)
+    post_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    post_after: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))  # NULL = hors file
+    post_error: Mapped[str | None] = mapped_column(Text)
+
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
     lines: Mapped[list["GoodsReceiptLine"]] = relationship(back_populates="receipt", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # workers : brouillons à comptabiliser, plus ancien d'abord par PO
+        Index("ix_goods_receipts_draft_queue", "po_id", "id", postgresql_where=text("status = 'draft'")),
+    )
+
 
 class GoodsReceiptLine(Base):
     __tablename__ = "goods_receipt_lines"
@@ -239,6 +276,7 @@ class GoodsReceiptLine(Base):
 
 # ---------- INVENTORY ----------
 class StockMovement(Base):
+    # partitionnée par mois sur happened_at en base (migration 18609885a39c, jobs.partitions)
     __tablename__ = "stock_movements"
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
 
@@ -257,15 +295,33 @@ class StockMovement(Base):
     happened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     created_by: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="RESTRICT"), nullable=False)
 
-    idempotency_key: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    # unicité globale : PK de stock_movement_keys (cf. StockMovementKey), pas d'index ici
+    idempotency_key: Mapped[str] = mapped_column(String(64), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
 
     __table_args__ = (
         CheckConstraint("quantity > 0", name="ck_stock_movement_qty_pos"),
         Index("ix_stock_movements_product_time", "product_id", "happened_at"),
+        # requêtes "as of" et historique paginé (happened_at, id) sans filtre produit
+        Index("ix_stock_movements_time_id", "happened_at", "id"),
     )
 
 
+class StockMovementKey(Base):
+    """
+    Registre global des clés d'idempotence de stock_movements (alimenté par trigger).
+
+    stock_movements est partitionnée par mois sur happened_at : un index UNIQUE y doit
+    contenir happened_at, il ne garantit donc plus l'unicité globale de idempotency_key.
+    La PK de cette table, si : un doublon lève la même IntegrityError qu'avant.
+    Sert aussi au replay idempotent (id du mouvement sans parcourir les partitions).
+    """
+    __tablename__ = "stock_movement_keys"
+    idempotency_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    movement_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    happened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
 class StockLevel(Base):
     __tablename__ = "stock_levels"
     product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="RESTRICT"), primary_key=True)
@@ -275,6 +331,9 @@ class StockLevel(Base):
     qty_reserved: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     qty_on_order: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
 
+    # > 0 : couple "chaud", réservations servies par stock_level_shards (services.hot_stock)
+    shard_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=datetime.utcnow,
@@ -287,11 +346,188 @@ class StockLevel(Base):
         CheckConstraint("qty_reserved >= 0", name="ck_stock_reserved_nonneg"),
         CheckConstraint("qty_on_order >= 0", name="ck_stock_on_order_nonneg"),
         CheckConstraint("qty_reserved <= qty_on_hand", name="ck_stock_reserved_le_on_hand"),
+        CheckConstraint("shard_count >= 0", name="ck_stock_shard_count_nonneg"),
+    )
+
+
+class OnOrderSummary(Base):
+    """
+    Totaux on_order par (site, produit), tenus à jour par triggers (cf. ON_ORDER_SUMMARY_TRIGGERS).
+
+    ordered_qty  : Σ qty_ordered des lignes de PO engagés
+    received_qty : Σ LEAST(reçu POSTED net de la ligne, qty_ordered) sur ces mêmes lignes
+    => qty_on_order = ordered_qty - received_qty
+    """
+
+    __tablename__ = "on_order_summary"
+    site_id: Mapped[int] = mapped_column(ForeignKey("sites.id", ondelete="CASCADE"), primary_key=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    ordered_qty: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    received_qty: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow, server_default=text("now()"), nullable=False
+    )
+
+
+class StockLevelShard(Base):
+    """
+    Sous-compteur escrow d'un StockLevel chaud.
+
+    qty_quota   : disponible prélevé sur le StockLevel (déjà compté dans son qty_reserved)
+    qty_reserved: part du quota effectivement réservée
+    qty_issued  : sorties servies par le shard, pas encore repliées dans le StockLevel
+    """
+    __tablename__ = "stock_level_shards"
+    product_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    location_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    shard_no: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    qty_quota: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    qty_reserved: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    qty_issued: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["product_id", "location_id"],
+            ["stock_levels.product_id", "stock_levels.location_id"],
+            ondelete="CASCADE",
+        ),
+        CheckConstraint("qty_reserved >= 0", name="ck_stock_shard_reserved_nonneg"),
+        CheckConstraint("qty_issued >= 0", name="ck_stock_shard_issued_nonneg"),
+        CheckConstraint("qty_reserved <= qty_quota", name="ck_stock_shard_reserved_le_quota"),
+    )
+
+
+class StockReservation(Base):
+    """
+    Réservation à durée de vie (RESERVE avec ttl_seconds).
+    quantity = reste réservé ; à expires_at, le sweeper la libère (mouvement UNRESERVE).
+    """
+    __tablename__ = "stock_reservations"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="RESTRICT"), nullable=False)
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id", ondelete="RESTRICT"), nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    status: Mapped[ReservationStatus] = mapped_column(
+        Enum(ReservationStatus, name="reservation_status"),
+        default=ReservationStatus.active,
+        nullable=False,
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # pas de FK : stock_movements est partitionnée (PK = id, happened_at)
+    reserve_movement_id: Mapped[int] = mapped_column(BigInteger, nullable=False, unique=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    closed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    __table_args__ = (
+        CheckConstraint("quantity >= 0", name="ck_stock_reservation_qty_nonneg"),
+        # le sweeper ne lit que les réservations actives, par échéance
+        Index("ix_stock_reservations_active_expiry", "expires_at", postgresql_where=text("status = 'active'")),
+    )
+
+
+class StockLot(Base):
+    """
+    Stock par lot / date de péremption d'un couple (produit, location), alimenté par les
+    réceptions et les mouvements (services.lots). StockLevel reste la référence de
+    disponibilité ; lot_code / expiration_date NULL = stock non suivi par lot.
+    """
+    __tablename__ = "stock_lots"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="RESTRICT"), nullable=False)
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id", ondelete="RESTRICT"), nullable=False)
+    lot_code: Mapped[str | None] = mapped_column(String(64))
+    expiration_date: Mapped[date | None] = mapped_column(Date)
+
+    qty_on_hand: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    qty_reserved: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "product_id", "location_id", "lot_code", "expiration_date",
+            name="uq_stock_lot", postgresql_nulls_not_distinct=True,
+        ),
+        CheckConstraint("qty_on_hand >= 0", name="ck_stock_lot_on_hand_nonneg"),
+        CheckConstraint("qty_reserved >= 0", name="ck_stock_lot_reserved_nonneg"),
+        CheckConstraint("qty_reserved <= qty_on_hand", name="ck_stock_lot_reserved_le_on_hand"),
+        # allocation FEFO : lots d'un couple parcourus par péremption croissante
+        Index("ix_stock_lots_fefo", "product_id", "location_id", "expiration_date", "id"),
+    )
+
+
+class StockMovementLot(Base):
+    """Lots prélevés par un mouvement (allocation FEFO) ; relu au rejeu idempotent."""
+    __tablename__ = "stock_movement_lots"
+    # pas de FK : stock_movements est partitionnée (PK = id, happened_at)
+    movement_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    lot_id: Mapped[int] = mapped_column(ForeignKey("stock_lots.id", ondelete="CASCADE"), primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (CheckConstraint("quantity > 0", name="ck_stock_movement_lot_qty_pos"),)
+
+
+class StockLotPending(Base):
+    """
+    Reste d'un mouvement servi par les shards d'un couple chaud, non alloué par lot faute
+    de lot libre (tous verrouillés par d'autres transactions) ; alloué au rebalance.
+    """
+    __tablename__ = "stock_lot_pending"
+    movement_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    product_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    location_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    movement_type: Mapped[MovementType] = mapped_column(Enum(MovementType, name="movement_type"), nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["product_id", "location_id"],
+            ["stock_levels.product_id", "stock_levels.location_id"],
+            ondelete="CASCADE",
+        ),
+        CheckConstraint("quantity > 0", name="ck_stock_lot_pending_qty_pos"),
+        Index("ix_stock_lot_pending_pair", "product_id", "location_id", "movement_id"),
     )
 
 
+class StockSnapshot(Base):
+    """
+    Photo des soldes (on_hand / reserved) dérivée du ledger stock_movements.
+
+    Couvre exactement les mouvements: happened_at <= as_of ET id <= last_movement_id.
+    site_id NULL = tous les sites.
+    """
+    __tablename__ = "stock_snapshots"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    site_id: Mapped[int | None] = mapped_column(ForeignKey("sites.id", ondelete="CASCADE"))
+    as_of: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_movement_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_stock_snapshots_site_as_of", "site_id", "as_of"),)
+
+
+class StockSnapshotLine(Base):
+    __tablename__ = "stock_snapshot_lines"
+    snapshot_id: Mapped[int] = mapped_column(ForeignKey("stock_snapshots.id", ondelete="CASCADE"), primary_key=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="RESTRICT"), primary_key=True)
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id", ondelete="RESTRICT"), primary_key=True)
+    qty_on_hand: Mapped[int] = mapped_column(Integer, nullable=False)
+    qty_reserved: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 # ---------- AUDIT ----------
 class AuditLog(Base):
+    # partitionnée par mois sur created_at en base (migration 18609885a39c, jobs.partitions)
     __tablename__ = "audit_log"
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     actor_id: Mapped[int | None] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"))
@@ -302,3 +538,241 @@ class AuditLog(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
 
     __table_args__ = (Index("ix_audit_entity", "entity_type", "entity_id"),)
+
+
+# ---------- DDL ----------
+# Trigger du registre d'idempotence : créé aussi par create_all (tests / dev),
+# pour que les bases non migrées se comportent comme la base partitionnée.
+STOCK_MOVEMENT_KEYS_TRIGGER = DDL(
+    """
+    CREATE OR REPLACE FUNCTION stock_movement_keys_register() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO stock_movement_keys (idempotency_key, movement_id, happened_at)
+        VALUES (NEW.idempotency_key, NEW.id, NEW.happened_at);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER trg_stock_movement_keys
+    AFTER INSERT ON stock_movements
+    FOR EACH ROW EXECUTE FUNCTION stock_movement_keys_register();
+    """
+)
+event.listen(StockMovement.__table__, "after_create", STOCK_MOVEMENT_KEYS_TRIGGER.execute_if(dialect="postgresql"))
+
+
+# Maintenance de on_order_summary : triggers par instruction (tables de transition), un
+# seul appel à on_order_summary_apply() par instruction quel que soit le nombre de lignes.
+# Chaque ligne (po, produit) touchée est relue dans son état courant ; les ajustements
+# passés donnent l'état avant / après, la différence des contributions est appliquée.
+# po_id / site_id sont supposés immuables (sinon : services.inventory.rebuild_on_order_summary).
+ON_ORDER_SUMMARY_TRIGGERS = DDL(
+    """
+    CREATE OR REPLACE FUNCTION on_order_summary_apply(
+        p_po bigint[], p_product bigint[],
+        p_o_old int[], p_r_old int[], p_e_old boolean[],
+        p_o_new int[], p_r_new int[], p_e_new boolean[]
+    ) RETURNS void AS $$
+        -- sérialise par (po, produit) jusqu'au commit (ordre des clés : pas d'interblocage) ;
+        -- la requête suivante (fonction VOLATILE) prend un nouveau snapshot : une réception
+        -- concurrente du même (po, produit) est alors commitée et visible, jamais comptée deux fois
+        SELECT pg_advisory_xact_lock(k)
+        FROM (
+            SELECT DISTINCT hashtextextended('on_order_summary:' || po_id || ':' || product_id, 0) AS k
+            FROM unnest(p_po, p_product) AS c(po_id, product_id)
+        ) keys
+        ORDER BY k;
+
+        -- état courant (visible) de chaque ligne (po, produit) +/- ajustements -> état avant / après
+        WITH chg AS (
+            SELECT c.po_id, c.product_id,
+                   sum(c.o_old) AS o_old, sum(c.r_old) AS r_old, bool_or(c.e_old) AS e_old,
+                   sum(c.o_new) AS o_new, sum(c.r_new) AS r_new, bool_or(c.e_new) AS e_new
+            FROM unnest(p_po, p_product, p_o_old, p_r_old, p_e_old, p_o_new, p_r_new, p_e_new)
+                 AS c(po_id, product_id, o_old, r_old, e_old, o_new, r_new, e_new)
+            GROUP BY c.po_id, c.product_id
+        ),
+        received AS (
+            SELECT gr.po_id, grl.product_id, sum(greatest(grl.qty_received - grl.qty_damaged, 0)) AS qty
+            FROM goods_receipts gr
+            JOIN goods_receipt_lines grl ON grl.receipt_id = gr.id
+            WHERE gr.status = 'posted'
+              AND gr.po_id IN (SELECT po_id FROM chg)
+              AND grl.product_id IN (SELECT product_id FROM chg)
+            GROUP BY gr.po_id, grl.product_id
+        ),
+        states AS (
+            SELECT po.site_id, chg.product_id,
+                   coalesce(chg.e_old, po.status IN ('approved', 'shipped', 'partial')) AS e0,
+                   coalesce(pol.qty_ordered, 0) + chg.o_old AS o0,
+                   coalesce(received.qty, 0) + chg.r_old AS r0,
+                   coalesce(chg.e_new, po.status IN ('approved', 'shipped', 'partial')) AS e1,
+                   coalesce(pol.qty_ordered, 0) + chg.o_new AS o1,
+                   coalesce(received.qty, 0) + chg.r_new AS r1
+            FROM chg
+            JOIN purchase_orders po ON po.id = chg.po_id
+            LEFT JOIN purchase_order_lines pol ON pol.po_id = chg.po_id AND pol.product_id = chg.product_id
+            LEFT JOIN received ON received.po_id = chg.po_id AND received.product_id = chg.product_id
+        ),
+        delta AS (
+            SELECT site_id, product_id,
+                   sum(CASE WHEN e1 THEN o1 ELSE 0 END - CASE WHEN e0 THEN o0 ELSE 0 END) AS d_ordered,
+                   sum(CASE WHEN e1 THEN least(r1, o1) ELSE 0 END - CASE WHEN e0 THEN least(r0, o0) ELSE 0 END) AS d_received
+            FROM states
+            GROUP BY site_id, product_id
+        )
+        INSERT INTO on_order_summary AS s (site_id, product_id, ordered_qty, received_qty, updated_at)
+        SELECT site_id, product_id, d_ordered, d_received, now()
+        FROM delta
+        WHERE d_ordered <> 0 OR d_received <> 0
+        ORDER BY site_id, product_id
+        ON CONFLICT (site_id, product_id) DO UPDATE
+        SET ordered_qty = s.ordered_qty + excluded.ordered_qty,
+            received_qty = s.received_qty + excluded.received_qty,
+            updated_at = now();
+    $$ LANGUAGE sql;
+
+    -- lignes de PO : ordered de la ligne
+    CREATE OR REPLACE FUNCTION on_order_summary_po_lines() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM on_order_summary_apply(
+                array_agg(po_id), array_agg(product_id), array_agg(-qty_ordered), array_agg(0), array_agg(NULL::boolean),
+                array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM on_order_summary_apply(
+                array_agg(po_id), array_agg(product_id), array_agg(qty_ordered), array_agg(0), array_agg(NULL::boolean),
+                array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM old_rows;
+        ELSE
+            -- UPDATE OF ... impossible avec des tables de transition : les UPDATE qui ne
+            -- touchent ni qty_ordered ni la clé (compteurs de réception) sortent ici
+            IF NOT EXISTS (
+                SELECT po_id, product_id, qty_ordered FROM old_rows
+                EXCEPT ALL
+                SELECT po_id, product_id, qty_ordered FROM new_rows
+            ) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM on_order_summary_apply(
+                array_agg(po_id), array_agg(product_id), array_agg(d), array_agg(0), array_agg(NULL::boolean),
+                array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM (
+                SELECT po_id, product_id, -qty_ordered AS d FROM new_rows
+                UNION ALL
+                SELECT po_id, product_id, qty_ordered FROM old_rows
+            ) c;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    -- lignes de réception : reçu net, seulement pour les réceptions POSTED
+    CREATE OR REPLACE FUNCTION on_order_summary_gr_lines() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM on_order_summary_apply(
+                array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(-greatest(c.qty_received - c.qty_damaged, 0)),
+                array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM new_rows c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM on_order_summary_apply(
+                array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(greatest(c.qty_received - c.qty_damaged, 0)),
+                array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM old_rows c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+        ELSE
+            PERFORM on_order_summary_apply(
+                array_agg(gr.po_id), array_agg(c.product_id), array_agg(0), array_agg(c.d),
+                array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+            FROM (
+                SELECT receipt_id, product_id, -greatest(qty_received - qty_damaged, 0) AS d FROM new_rows
+                UNION ALL
+                SELECT receipt_id, product_id, greatest(qty_received - qty_damaged, 0) FROM old_rows
+            ) c JOIN goods_receipts gr ON gr.id = c.receipt_id AND gr.status = 'posted';
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    -- réceptions qui entrent dans / sortent de POSTED
+    CREATE OR REPLACE FUNCTION on_order_summary_gr_status() RETURNS trigger AS $$
+    BEGIN
+        PERFORM on_order_summary_apply(
+            array_agg(n.po_id), array_agg(grl.product_id), array_agg(0),
+            array_agg(CASE WHEN o.status = 'posted' THEN 1 ELSE -1 END * greatest(grl.qty_received - grl.qty_damaged, 0)),
+            array_agg(NULL::boolean), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN goods_receipt_lines grl ON grl.receipt_id = n.id
+        WHERE (o.status = 'posted') <> (n.status = 'posted');
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    -- PO qui entrent dans / sortent des statuts engagés
+    CREATE OR REPLACE FUNCTION on_order_summary_po_status() RETURNS trigger AS $$
+    BEGIN
+        PERFORM on_order_summary_apply(
+            array_agg(n.id), array_agg(pol.product_id), array_agg(0), array_agg(0),
+            array_agg(o.status IN ('approved', 'shipped', 'partial')), array_agg(0), array_agg(0), array_agg(NULL::boolean))
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        JOIN purchase_order_lines pol ON pol.po_id = n.id
+        WHERE (o.status IN ('approved', 'shipped', 'partial')) <> (n.status IN ('approved', 'shipped', 'partial'));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    -- suppressions : retirées AVANT que les lignes partent en cascade (PO / réception alors invisibles)
+    CREATE OR REPLACE FUNCTION on_order_summary_po_delete() RETURNS trigger AS $$
+    BEGIN
+        PERFORM on_order_summary_apply(
+            array_agg(po_id), array_agg(product_id), array_agg(0), array_agg(0), array_agg(NULL::boolean),
+            array_agg(0), array_agg(0), array_agg(false))
+        FROM purchase_order_lines WHERE po_id = OLD.id;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION on_order_summary_gr_delete() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.status = 'posted' THEN
+            PERFORM on_order_summary_apply(
+                array_agg(OLD.po_id), array_agg(product_id), array_agg(0), array_agg(0), array_agg(NULL::boolean),
+                array_agg(0), array_agg(-greatest(qty_received - qty_damaged, 0)), array_agg(NULL::boolean))
+            FROM goods_receipt_lines WHERE receipt_id = OLD.id;
+        END IF;
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER trg_on_order_summary_po_lines_ins AFTER INSERT ON purchase_order_lines
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+    CREATE TRIGGER trg_on_order_summary_po_lines_upd AFTER UPDATE ON purchase_order_lines
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+    CREATE TRIGGER trg_on_order_summary_po_lines_del AFTER DELETE ON purchase_order_lines
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_lines();
+    CREATE TRIGGER trg_on_order_summary_gr_lines_ins AFTER INSERT ON goods_receipt_lines
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+    CREATE TRIGGER trg_on_order_summary_gr_lines_upd AFTER UPDATE ON goods_receipt_lines
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+    CREATE TRIGGER trg_on_order_summary_gr_lines_del AFTER DELETE ON goods_receipt_lines
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_lines();
+    CREATE TRIGGER trg_on_order_summary_gr_status AFTER UPDATE ON goods_receipts
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_gr_status();
+    CREATE TRIGGER trg_on_order_summary_po_status AFTER UPDATE ON purchase_orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION on_order_summary_po_status();
+    CREATE TRIGGER trg_on_order_summary_po_delete BEFORE DELETE ON purchase_orders
+        FOR EACH ROW EXECUTE FUNCTION on_order_summary_po_delete();
+    CREATE TRIGGER trg_on_order_summary_gr_delete BEFORE DELETE ON goods_receipts
+        FOR EACH ROW EXECUTE FUNCTION on_order_summary_gr_delete();
+    """
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_on_order_summary_triggers(target, connection, tables=(), **kw) -> None:
+    # après TOUTES les tables (les triggers portent sur PO / réceptions), une seule fois
+    if connection.dialect.name == "postgresql" and OnOrderSummary.__table__ in tables:
+        connection.execute(ON_ORDER_SUMMARY_TRIGGERS)
@@ -0,0 +1,60 @@
+"""
+Couples (produit, location) chauds : mode escrow / shards.
+
+    python -m backend.app.jobs.hot_stock enable --product-id 12 --location-id 3 --shards 8
+    python -m backend.app.jobs.hot_stock disable --product-id 12 --location-id 3
+    python -m backend.app.jobs.hot_stock rebalance [--every 5]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from backend.app.db.session import SessionLocal
+from backend.app.services.hot_stock import ESCROW_RATIO, disable_sharding, enable_sharding, rebalance_all
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    en = sub.add_parser("enable", help="passe un couple en mode escrow")
+    en.add_argument("--product-id", type=int, required=True)
+    en.add_argument("--location-id", type=int, required=True)
+    en.add_argument("--shards", type=int, default=8)
+
+    dis = sub.add_parser("disable", help="replie et supprime les shards d'un couple")
+    dis.add_argument("--product-id", type=int, required=True)
+    dis.add_argument("--location-id", type=int, required=True)
+
+    reb = sub.add_parser("rebalance", help="replie puis redistribue le quota de tous les couples chauds")
+    reb.add_argument("--escrow-ratio", type=float, default=ESCROW_RATIO)
+    reb.add_argument("--every", type=float, default=None, help="boucle toutes les N secondes")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "rebalance":
+        while True:
+            n = rebalance_all(escrow_ratio=args.escrow_ratio)
+            print(f"REBALANCE OK: pairs={n}")
+            if args.every is None:
+                return
+            time.sleep(args.every)
+
+    db = SessionLocal()
+    try:
+        if args.command == "enable":
+            sl = enable_sharding(db, args.product_id, args.location_id, args.shards)
+        else:
+            sl = disable_sharding(db, args.product_id, args.location_id)
+        db.commit()
+        print(
+            f"{args.command.upper()} OK: product_id={sl.product_id} location_id={sl.location_id} "
+            f"shards={sl.shard_count} on_hand={sl.qty_on_hand} reserved={sl.qty_reserved}"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Ledger stock : photos périodiques et rebuild des StockLevel depuis l'historique.
+
+    python -m backend.app.jobs.ledger snapshot [--site-id 1]
+    python -m backend.app.jobs.ledger rebuild [--partitions 8] [--workers 8]
+    python -m backend.app.jobs.ledger rebuild --product-id 12 --product-id 13
+    python -m backend.app.jobs.ledger reconcile [--site-id 1] [--workers 8] [--chunk-size 500] [--repair]
+"""
+from __future__ import annotations
+
+import argparse
+
+from sqlalchemy import func, select
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import StockSnapshotLine
+from backend.app.services.ledger import reconcile_all, rebuild_all, rebuild_stock_levels, take_snapshot
+
+
+def _print_invalid(invalid: list[dict]) -> None:
+    for row in invalid[:50]:
+        print(f"  INVALID {row}")
+    if len(invalid) > 50:
+        print(f"  ... {len(invalid) - 50} autres")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="prend une photo des soldes")
+    snap.add_argument("--site-id", type=int, default=None)
+
+    reb = sub.add_parser("rebuild", help="recalcule qty_on_hand / qty_reserved depuis le ledger")
+    reb.add_argument("--partitions", type=int, default=4)
+    reb.add_argument("--workers", type=int, default=None)
+    reb.add_argument("--product-id", type=int, action="append", default=None)
+
+    rec = sub.add_parser("reconcile", help="compare StockLevel au ledger, écarts par (produit, location)")
+    rec.add_argument("--site-id", type=int, default=None)
+    rec.add_argument("--workers", type=int, default=4)
+    rec.add_argument("--chunk-size", type=int, default=500)
+    rec.add_argument("--repair", action="store_true", help="recalcule les produits en écart")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        db = SessionLocal()
+        try:
+            s = take_snapshot(db, site_id=args.site_id)
+            db.commit()
+            lines = db.scalar(select(func.count()).where(StockSnapshotLine.snapshot_id == s.id))
+            print(f"SNAPSHOT OK: id={s.id} as_of={s.as_of.isoformat()} watermark={s.last_movement_id} lines={lines}")
+        finally:
+            db.close()
+        return
+
+    if args.command == "reconcile":
+        res = reconcile_all(
+            site_id=args.site_id,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            repair=args.repair,
+        )
+        for d in res["drift"][:50]:
+            print(
+                f"  DRIFT product={d['product_id']} location={d['location_id']} "
+                f"on_hand={d['qty_on_hand']} (ledger {d['expected_on_hand']}) "
+                f"reserved={d['qty_reserved']} (ledger {d['expected_reserved']})"
+            )
+        if len(res["drift"]) > 50:
+            print(f"  ... {len(res['drift']) - 50} autres")
+        print(
+            f"RECONCILE OK: products={res['products']} chunks={res['chunks']} "
+            f"drift={len(res['drift'])} repaired={res['repaired']} invalid={len(res['invalid'])}"
+        )
+        _print_invalid(res["invalid"])
+        return
+
+    if args.product_id:
+        db = SessionLocal()
+        try:
+            res = rebuild_stock_levels(db, args.product_id)
+            db.commit()
+        finally:
+            db.close()
+        print(f"REBUILD OK: products={len(set(args.product_id))} changed={res['changed']} invalid={len(res['invalid'])}")
+        _print_invalid(res["invalid"])
+        return
+
+    reports = rebuild_all(partitions=args.partitions, workers=args.workers)
+    for r in reports:
+        print(f"  partition={r['partition']} products={r['products']} changed={r['changed']} invalid={len(r['invalid'])}")
+    invalid = [row for r in reports for row in r["invalid"]]
+    print(f"REBUILD OK: changed={sum(r['changed'] for r in reports)} invalid={len(invalid)}")
+    _print_invalid(invalid)
+
+
+if __name__ == "__main__":
+    main()
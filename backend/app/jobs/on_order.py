@@ -0,0 +1,88 @@
+"""
+Recalcul (vérification / réparation) de qty_on_order, tous les produits d'un site.
+
+    python -m backend.app.jobs.on_order rebuild [--site-id 1] [--site-id 2]
+    python -m backend.app.jobs.on_order rebuild --dry-run
+    python -m backend.app.jobs.on_order summary [--repair]
+    python -m backend.app.jobs.on_order received [--po-id 12] [--dry-run]
+
+Sans --site-id : tous les sites. --dry-run : compte les lignes en écart puis annule.
+summary : compare on_order_summary (tenu par triggers) aux agrégats PO / réceptions ;
+--repair le reconstruit entièrement.
+received : recalcule qty_received / qty_damaged des lignes de PO depuis les réceptions.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from sqlalchemy import select
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import Site
+from backend.app.services.inventory import on_order_summary_drift, rebuild_on_order_summary, rebuild_qty_on_order
+from backend.app.services.purchase_orders import rebuild_po_line_received
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    reb = sub.add_parser("rebuild", help="recalcule qty_on_order depuis les PO engagés")
+    reb.add_argument("--site-id", type=int, action="append", default=None)
+    reb.add_argument("--dry-run", action="store_true", help="rapporte les écarts sans les corriger")
+
+    sm = sub.add_parser("summary", help="vérifie on_order_summary contre les agrégats")
+    sm.add_argument("--repair", action="store_true", help="reconstruit le résumé s'il y a des écarts")
+
+    rcv = sub.add_parser("received", help="recalcule les compteurs reçus des lignes de PO")
+    rcv.add_argument("--po-id", type=int, action="append", default=None)
+    rcv.add_argument("--dry-run", action="store_true", help="compte les lignes en écart sans les corriger")
+
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "summary":
+            drift = on_order_summary_drift(db)
+            for row in drift[:20]:
+                print(f"  {row}")
+            rebuilt = 0
+            if drift and args.repair:
+                rebuilt = rebuild_on_order_summary(db)
+                db.commit()
+            print(f"SUMMARY OK: drift={len(drift)}{f' rebuilt={rebuilt}' if args.repair else ''}")
+            return
+
+        if args.command == "received":
+            changed = rebuild_po_line_received(db, args.po_id)
+            if args.dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            print(f"RECEIVED OK: lines={changed}{' (dry run)' if args.dry_run else ''}")
+            return
+
+        site_ids = args.site_id or db.scalars(select(Site.id).order_by(Site.id)).all()
+        total = 0
+        for site_id in site_ids:
+            t0 = time.perf_counter()
+            try:
+                changed = rebuild_qty_on_order(db, site_id)
+            except ValueError as e:
+                db.rollback()
+                print(f"  site={site_id} SKIPPED: {e}")
+                continue
+            if args.dry_run:
+                db.rollback()
+            else:
+                db.commit()
+            total += len(changed)
+            print(f"  site={site_id} changed={len(changed)} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        print(f"REBUILD OK: sites={len(site_ids)} changed={total}{' (dry run)' if args.dry_run else ''}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
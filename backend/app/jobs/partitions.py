@@ -0,0 +1,35 @@
+"""
+Partitions mensuelles : création à l'avance des mois à venir (à lancer chaque jour).
+
+    python -m backend.app.jobs.partitions ensure [--months-ahead 3]
+"""
+from __future__ import annotations
+
+import argparse
+
+from backend.app.db.session import SessionLocal
+from backend.app.services.partitions import MONTHS_AHEAD, ensure_partitions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ens = sub.add_parser("ensure", help="crée les partitions manquantes")
+    ens.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        created = ensure_partitions(db, months_ahead=args.months_ahead)
+        db.commit()
+    finally:
+        db.close()
+    for name in created:
+        print(f"  CREATED {name}")
+    print(f"PARTITIONS OK: created={len(created)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+File de comptabilisation des réceptions (brouillons des scanners de quai).
+
+    python -m backend.app.jobs.receipts work [--workers 4] [--poll 1.0]
+    python -m backend.app.jobs.receipts drain [--max-receipts 1000]
+    python -m backend.app.jobs.receipts retry RECEIPT_ID
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+
+from backend.app.db.session import SessionLocal
+from backend.app.services.receipt_queue import drain, retry, run_workers
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    wk = sub.add_parser("work", help="pool de workers, tourne jusqu'à Ctrl-C")
+    wk.add_argument("--workers", type=int, default=4)
+    wk.add_argument("--poll", type=float, default=1.0, help="attente (s) quand la file est vide")
+
+    dr = sub.add_parser("drain", help="comptabilise les brouillons éligibles puis s'arrête")
+    dr.add_argument("--max-receipts", type=int, default=None)
+
+    rt = sub.add_parser("retry", help="remet en file un brouillon en échec")
+    rt.add_argument("receipt_id", type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "work":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        run_workers(workers=args.workers, poll_seconds=args.poll)
+        return
+
+    if args.command == "drain":
+        print(f"DRAIN OK: posted_or_failed={drain(max_receipts=args.max_receipts)}")
+        return
+
+    db = SessionLocal()
+    try:
+        if not retry(db, args.receipt_id):
+            raise SystemExit(f"receipt {args.receipt_id} is not a draft")
+        db.commit()
+        print(f"RETRY OK: receipt={args.receipt_id}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Réapprovisionnement automatique : besoins de tous les (site, produit), brouillons de PO.
+
+    python -m backend.app.jobs.replenishment plan [--site-id 1] [--history-days 56]
+    python -m backend.app.jobs.replenishment plan --review-days 14 --service-z 2.0
+    python -m backend.app.jobs.replenishment plan --draft
+
+Sans --draft : affiche le plan sans rien écrire. --draft : un PO draft par
+(site, fournisseur), à approuver par les acheteurs (POST /v1/purchase-orders/approve).
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from backend.app.db.session import SessionLocal
+from backend.app.services.replenishment import (
+    HISTORY_DAYS,
+    REVIEW_DAYS,
+    SERVICE_Z,
+    compute_reorders,
+    draft_replenishment_pos,
+    load_inputs,
+)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pl = sub.add_parser("plan", help="calcule les besoins (et rédige les PO avec --draft)")
+    pl.add_argument("--site-id", type=int, action="append", default=None)
+    pl.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    pl.add_argument("--review-days", type=int, default=REVIEW_DAYS)
+    pl.add_argument("--service-z", type=float, default=SERVICE_Z)
+    pl.add_argument("--draft", action="store_true", help="écrit les PO draft")
+
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        frame = load_inputs(db, site_ids=args.site_id, history_days=args.history_days)
+        t_load = time.perf_counter()
+        plan = compute_reorders(frame, review_days=args.review_days, service_z=args.service_z)
+        t_plan = time.perf_counter()
+
+        for row in plan.head(50).itertuples(index=False):
+            print(
+                f"  site={row.site_id} supplier={row.supplier_id} product={row.product_id} qty={row.qty} "
+                f"(position {row.position:.0f}, reorder point {row.reorder_point:.1f}, {row.demand_per_day:.2f}/day)"
+            )
+        if len(plan) > 50:
+            print(f"  ... {len(plan) - 50} autres")
+
+        created = skipped = []
+        if args.draft and not plan.empty:
+            res = draft_replenishment_pos(db, plan)
+            db.commit()
+            created, skipped = res["created"], res["skipped"]
+            for po_id, po_number in created:
+                print(f"  DRAFTED po={po_id} {po_number}")
+            for po_number in skipped:
+                print(f"  SKIPPED {po_number} (déjà rédigé aujourd'hui)")
+        else:
+            db.rollback()
+
+        print(
+            f"REPLENISH OK: skus={len(frame)} to_order={len(plan)} "
+            f"suppliers={plan[['site_id', 'supplier_id']].drop_duplicates().shape[0]} "
+            f"pos_created={len(created)} load={(t_load - t0) * 1000:.0f} ms plan={(t_plan - t_load) * 1000:.0f} ms"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Expiration des réservations à TTL (sweeper par lots).
+
+    python -m backend.app.jobs.reservations sweep [--batch-size 500] [--every 10]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from backend.app.services.reservations import SWEEP_BATCH_SIZE, sweep
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sw = sub.add_parser("sweep", help="libère les réservations échues")
+    sw.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+    sw.add_argument("--max-batches", type=int, default=None)
+    sw.add_argument("--every", type=float, default=None, help="boucle toutes les N secondes")
+
+    args = parser.parse_args(argv)
+
+    while True:
+        res = sweep(batch_size=args.batch_size, max_batches=args.max_batches)
+        print(f"SWEEP OK: batches={res['batches']} expired={res['expired']} released={res['released']}")
+        if args.every is None:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
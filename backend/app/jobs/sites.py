@@ -0,0 +1,82 @@
+"""
+Recalculs lourds de tous les sites en parallèle (un process par site).
+
+    python -m backend.app.jobs.sites recompute [--workers 4] [--site-id 1] [--site-id 2]
+    python -m backend.app.jobs.sites recompute --task on_order --task snapshot
+    python -m backend.app.jobs.sites recompute --repair
+    python -m backend.app.jobs.sites recompute --dry-run
+
+Tâches (toutes par défaut, dans cet ordre) : on_order, reconcile, snapshot.
+--repair : corrige les écarts de la réconciliation. --dry-run : calcule puis annule.
+Code retour 1 si au moins un site a une tâche en échec.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from backend.app.services.site_jobs import SITE_TASKS, run_sites
+
+
+def _format_task(name: str, res: dict) -> str:
+    details = " ".join(f"{k}={v}" for k, v in res.items() if k not in ("ms", "error"))
+    if "error" in res:
+        return f"{name}: FAILED ({res['error']})"
+    return f"{name}: {details} ({res['ms']} ms)"
+
+
+def _print_site(report: dict) -> None:
+    status = "FAILED" if report["failed"] else "ok"
+    print(f"  site={report['site_id']} {status} ({report['ms']} ms)")
+    for name, res in report["tasks"].items():
+        print(f"    {_format_task(name, res)}")
+    if "error" in report:
+        print(f"    process: FAILED ({report['error']})")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rc = sub.add_parser("recompute", help="on_order / réconciliation / photos, un process par site")
+    rc.add_argument("--site-id", type=int, action="append", default=None)
+    rc.add_argument("--task", choices=SITE_TASKS, action="append", default=None)
+    rc.add_argument("--workers", type=int, default=4, help="sites traités en même temps (= connexions)")
+    rc.add_argument("--repair", action="store_true", help="corrige les écarts de la réconciliation")
+    rc.add_argument("--dry-run", action="store_true", help="calcule sans rien écrire")
+
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+
+    t0 = time.perf_counter()
+    reports = run_sites(
+        args.site_id,
+        tasks=args.task or SITE_TASKS,
+        workers=args.workers,
+        repair=args.repair,
+        dry_run=args.dry_run,
+        on_done=_print_site,
+    )
+    failed = [r["site_id"] for r in reports if r["failed"]]
+
+    print("  --- résumé")
+    for name in args.task or SITE_TASKS:
+        done = [r["tasks"][name] for r in reports if name in r["tasks"]]
+        ms = sorted(res["ms"] for res in done)
+        print(
+            f"  {name:<10} sites={len(done)} failed={sum('error' in res for res in done)}"
+            f" skipped={sum('skipped' in res for res in done)} max={ms[-1] if ms else 0} ms"
+        )
+    summary = (
+        f"sites={len(reports)} failed={len(failed)} workers={args.workers} "
+        f"elapsed={time.perf_counter() - t0:.1f}s{' (dry run)' if args.dry_run else ''}"
+    )
+    if failed:
+        print(f"RECOMPUTE FAILED: {summary} failed_sites={failed}")
+        raise SystemExit(1)
+    print(f"RECOMPUTE OK: {summary}")
+
+
+if __name__ == "__main__":
+    main()
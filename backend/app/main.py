@@ -1,5 +1,21 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from backend.app.api.v1.router import router as v1_router
+from backend.app.db.session import SessionLocal
+from backend.app.services.locations import location_registry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # topologie des locations chargée une fois au démarrage (cf. services.locations)
+    db = SessionLocal()
+    try:
+        location_registry(db)
+    finally:
+        db.close()
+    yield
+
 
-app = FastAPI(title="MOANA WMS", version="0.1.0")
+app = FastAPI(title="MOANA WMS", version="0.1.0", lifespan=lifespan)
 app.include_router(v1_router, prefix="/v1")
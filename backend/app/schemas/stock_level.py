@@ -1,3 +1,5 @@
+from datetime import date, datetime
+
 from pydantic import BaseModel
 
 
@@ -11,3 +13,27 @@ class StockLevelRead(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class StockLevelAsOfRead(BaseModel):
+    """Solde historique reconstruit depuis le ledger (qty_on_order non historisé)."""
+    product_id: int
+    location_id: int
+    as_of: datetime
+
+    qty_on_hand: int
+    qty_reserved: int
+
+
+class StockLotRead(BaseModel):
+    """Stock d'un lot ; lot_code / expiration_date NULL = stock non suivi par lot."""
+    product_id: int
+    location_id: int
+    lot_code: str | None
+    expiration_date: date | None
+
+    qty_on_hand: int
+    qty_reserved: int
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from backend.app.db.models.core_types import MovementType
+
+
+class StockMovementRead(BaseModel):
+    id: int
+    product_id: int
+    from_location_id: int | None
+    to_location_id: int | None
+    movement_type: MovementType
+    quantity: int
+    reason: str | None
+    happened_at: datetime
+    created_by: int
+    idempotency_key: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class StockMovementPage(BaseModel):
+    items: list[StockMovementRead]
+    next_cursor: str | None = None
@@ -0,0 +1,273 @@
+"""
+Mode escrow pour les couples (produit, location) très sollicités (riz, farine, huile...).
+
+Sans ce mode, chaque RESERVE / UNRESERVE / ISSUE verrouille LA ligne stock_levels du
+couple : toutes les transactions du magasin se sérialisent dessus.
+
+Couple chaud (StockLevel.shard_count = N > 0) :
+- une partie du disponible est prélevée en escrow : StockLevel.qty_reserved += quota,
+  réparti sur N lignes stock_level_shards (qty_quota)
+- RESERVE  : shard.qty_reserved += q           (garde : qty_quota - qty_reserved >= q)
+- UNRESERVE: shard.qty_reserved -= q           (garde : qty_reserved >= q)
+- ISSUE    : shard.qty_reserved/qty_quota -= q, shard.qty_issued += q
+  => AUCUN verrou sur le StockLevel ; le shard est choisi au hasard (SKIP LOCKED)
+- rebalance() (job de fond, ou repli synchrone quand les shards sont épuisés)
+  replie les shards dans le StockLevel puis redistribue un nouveau quota
+
+ck_stock_reserved_le_on_hand tient à tout instant : StockLevel.qty_reserved couvre
+Σ(quota + issued), et le réservé réel Σ shard.qty_reserved <= Σ quota.
+
+Tout écrivain qui passe par lock_stock_levels() reçoit un StockLevel exact (drain).
+"""
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import ColumnElement, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import StockLevel, StockLevelShard
+from backend.app.services import lots
+from backend.app.services.stock_levels import lock_stock_levels
+
+# part du disponible placée en escrow à chaque rebalance (le reste sert les transferts)
+ESCROW_RATIO = 0.8
+MAX_SHARDS = 64
+HOT_KEYS_TTL_SECONDS = 30
+
+_hot_keys: frozenset[tuple[int, int]] = frozenset()
+_hot_keys_loaded_at = float("-inf")
+
+
+def is_hot(db: Session, product_id: int, location_id: int) -> bool:
+    """
+    Couple chaud ? Cache process rafraîchi toutes les HOT_KEYS_TTL_SECONDS.
+    Un cache périmé ne coûte qu'une instruction : la garde du StockLevel porte shard_count = 0.
+    """
+    global _hot_keys, _hot_keys_loaded_at
+    if time.monotonic() - _hot_keys_loaded_at > HOT_KEYS_TTL_SECONDS:
+        rows = db.execute(
+            select(StockLevel.product_id, StockLevel.location_id).where(StockLevel.shard_count > 0)
+        ).all()
+        _hot_keys = frozenset((int(p), int(l)) for p, l in rows)
+        _hot_keys_loaded_at = time.monotonic()
+    return (product_id, location_id) in _hot_keys
+
+
+def invalidate_hot_keys() -> None:
+    global _hot_keys_loaded_at
+    _hot_keys_loaded_at = float("-inf")
+
+
+def shard_update(
+    product_id: int,
+    location_id: int,
+    guard: ColumnElement[bool],
+    *,
+    skip_locked: bool = True,
+    **values,
+):
+    """
+    UPDATE d'UN shard du couple satisfaisant la garde, choisi au hasard parmi les
+    shards non verrouillés (FOR UPDATE SKIP LOCKED). RETURNING (product_id, location_id).
+    skip_locked=False : attend un shard éligible (tous pris par d'autres transactions).
+    """
+    pick = (
+        select(StockLevelShard.shard_no)
+        .where(StockLevelShard.product_id == product_id)
+        .where(StockLevelShard.location_id == location_id)
+        .where(guard)
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=skip_locked)
+        .scalar_subquery()
+    )
+    return (
+        update(StockLevelShard)
+        .where(StockLevelShard.product_id == product_id)
+        .where(StockLevelShard.location_id == location_id)
+        .where(StockLevelShard.shard_no == pick)
+        .where(guard)
+        .values(**values)
+        .returning(StockLevelShard.product_id, StockLevelShard.location_id)
+    )
+
+
+def reserve_update(product_id: int, location_id: int, quantity: int, *, skip_locked: bool = True):
+    return shard_update(
+        product_id,
+        location_id,
+        StockLevelShard.qty_quota - StockLevelShard.qty_reserved >= quantity,
+        skip_locked=skip_locked,
+        qty_reserved=StockLevelShard.qty_reserved + quantity,
+    )
+
+
+def unreserve_update(product_id: int, location_id: int, quantity: int, *, skip_locked: bool = True):
+    return shard_update(
+        product_id,
+        location_id,
+        StockLevelShard.qty_reserved >= quantity,
+        skip_locked=skip_locked,
+        qty_reserved=StockLevelShard.qty_reserved - quantity,
+    )
+
+
+def issue_update(product_id: int, location_id: int, quantity: int, *, skip_locked: bool = True):
+    return shard_update(
+        product_id,
+        location_id,
+        StockLevelShard.qty_reserved >= quantity,
+        skip_locked=skip_locked,
+        qty_reserved=StockLevelShard.qty_reserved - quantity,
+        qty_quota=StockLevelShard.qty_quota - quantity,
+        qty_issued=StockLevelShard.qty_issued + quantity,
+    )
+
+
+def effective_levels(db: Session, product_id: int, location_id: int) -> tuple[int, int]:
+    """(on_hand, reserved) réels d'un couple, shards compris, sans verrou."""
+    t = shard_totals().subquery()
+    row = db.execute(
+        select(
+            StockLevel.qty_on_hand - func.coalesce(t.c.issued, 0),
+            StockLevel.qty_reserved - func.coalesce(t.c.escrowed, 0) + func.coalesce(t.c.reserved, 0),
+        )
+        .outerjoin(
+            t,
+            (t.c.product_id == StockLevel.product_id) & (t.c.location_id == StockLevel.location_id),
+        )
+        .where(StockLevel.product_id == product_id)
+        .where(StockLevel.location_id == location_id)
+    ).first()
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
+
+def shard_totals():
+    """Agrégats par couple : issued, escrowed (Σ quota + issued), reserved (réel)."""
+    return select(
+        StockLevelShard.product_id,
+        StockLevelShard.location_id,
+        func.sum(StockLevelShard.qty_issued).label("issued"),
+        func.sum(StockLevelShard.qty_quota + StockLevelShard.qty_issued).label("escrowed"),
+        func.sum(StockLevelShard.qty_reserved).label("reserved"),
+    ).group_by(StockLevelShard.product_id, StockLevelShard.location_id)
+
+
+# ---------- Administration ----------
+def rebalance(
+    db: Session,
+    product_id: int,
+    location_id: int,
+    *,
+    escrow_ratio: float = ESCROW_RATIO,
+) -> StockLevel:
+    """
+    Replie les shards (via lock_stock_levels) puis redistribue :
+    - le réservé direct du StockLevel passe dans le shard 0 (quota = réservé)
+    - escrow_ratio du disponible est réparti en quotas égaux sur les N shards
+    Alloue aussi par lot les restes différés (lots.allocate_pending, sans attente).
+    Verrouille StockLevel + shards jusqu'au commit de l'appelant.
+    """
+    key = (product_id, location_id)
+    sl = lock_stock_levels(db, [key])[key]
+    lots.allocate_pending(db, product_id, location_id)
+    n = sl.shard_count
+    if not n:
+        return sl
+
+    shards = (
+        db.execute(
+            select(StockLevelShard)
+            .where(StockLevelShard.product_id == product_id)
+            .where(StockLevelShard.location_id == location_id)
+            .order_by(StockLevelShard.shard_no)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        .scalars()
+        .all()
+    )
+
+    available = sl.qty_on_hand - sl.qty_reserved
+    escrow = int(available * escrow_ratio)
+    share, extra = divmod(escrow, n)
+
+    for sh in shards:
+        sh.qty_quota = share + (extra if sh.shard_no == 0 else 0)
+        sh.qty_reserved = 0
+        sh.qty_issued = 0
+        if sh.shard_no == 0:
+            sh.qty_reserved = sl.qty_reserved
+            sh.qty_quota += sl.qty_reserved
+
+    sl.qty_reserved += escrow
+    db.flush()
+    return sl
+
+
+def enable_sharding(db: Session, product_id: int, location_id: int, shards: int) -> StockLevel:
+    """Passe un couple en mode escrow avec `shards` sous-compteurs (idempotent, redimensionne)."""
+    if not 1 <= shards <= MAX_SHARDS:
+        raise ValueError(f"shards must be between 1 and {MAX_SHARDS}")
+
+    key = (product_id, location_id)
+    sl = lock_stock_levels(db, [key])[key]  # drain des éventuels shards existants
+
+    db.execute(
+        delete(StockLevelShard)
+        .where(StockLevelShard.product_id == product_id)
+        .where(StockLevelShard.location_id == location_id)
+        .where(StockLevelShard.shard_no >= shards)
+    )
+    db.execute(
+        pg_insert(StockLevelShard)
+        .values(
+            [
+                {"product_id": product_id, "location_id": location_id, "shard_no": i, "qty_quota": 0, "qty_reserved": 0, "qty_issued": 0}
+                for i in range(shards)
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["product_id", "location_id", "shard_no"])
+    )
+    sl.shard_count = shards
+    db.flush()
+    invalidate_hot_keys()
+    return rebalance(db, product_id, location_id)
+
+
+def disable_sharding(db: Session, product_id: int, location_id: int) -> StockLevel:
+    """Repli définitif : shards vidés dans le StockLevel puis supprimés."""
+    key = (product_id, location_id)
+    sl = lock_stock_levels(db, [key])[key]
+    # plus de rebalance pour ce couple : les restes différés sont alloués maintenant
+    lots.allocate_pending(db, product_id, location_id, wait=True)
+    db.execute(
+        delete(StockLevelShard)
+        .where(StockLevelShard.product_id == product_id)
+        .where(StockLevelShard.location_id == location_id)
+    )
+    sl.shard_count = 0
+    db.flush()
+    invalidate_hot_keys()
+    return sl
+
+
+def rebalance_all(*, escrow_ratio: float = ESCROW_RATIO) -> int:
+    """Rebalance de tous les couples chauds, une transaction courte par couple."""
+    db = SessionLocal()
+    try:
+        keys = db.execute(
+            select(StockLevel.product_id, StockLevel.location_id)
+            .where(StockLevel.shard_count > 0)
+            .order_by(StockLevel.product_id, StockLevel.location_id)
+        ).all()
+        db.rollback()
+        for pid, lid in keys:
+            rebalance(db, int(pid), int(lid), escrow_ratio=escrow_ratio)
+            db.commit()
+        return len(keys)
+    finally:
+        db.close()
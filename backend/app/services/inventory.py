@@ -1,133 +1,346 @@
+"""
+qty_on_order : quantités commandées pas encore reçues, portées par la location DOCK inbound du site.
+
+    qty_on_order(site, produit) = Σ sur les lignes des PO engagés du site
+                                  GREATEST(qty_ordered - reçu POSTED de cette ligne, 0)
+                                = on_order_summary.ordered_qty - on_order_summary.received_qty
+
+on_order_summary (site, produit) est tenu à jour par des triggers PostgreSQL sur
+purchase_order_lines, purchase_orders.status, goods_receipt_lines et goods_receipts.status
+(cf. models_v1.ON_ORDER_SUMMARY_TRIGGERS) : lire le on_order d'un produit est une
+recherche par clé primaire, sans agrégat sur l'historique.
+
+Écritures de qty_on_order (StockLevel DOCK), après flush des PO / réceptions :
+- PO qui entre dans / sort des statuts engagés (approve / cancel)  -> sync_po_qty_on_order
+- réception POSTED                                                   -> apply_receipt_on_order
+
+Le reçu au-delà du commandé d'une ligne n'entame pas les autres PO : chaque ligne est
+bornée à 0. Les agrégats d'origine (_open_lines) ne servent plus qu'à vérifier / réparer
+le résumé (on_order_summary_drift / rebuild_on_order_summary).
+"""
 from __future__ import annotations
 
-from typing import Iterable, Sequence
+from typing import Iterable
 
-from sqlalchemy import select, func
+from sqlalchemy import delete, func, literal, select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from backend.app.db.models.models_v1 import (
-    Location,
-    StockLevel,
+    OnOrderSummary,
     PurchaseOrder,
     PurchaseOrderLine,
     GoodsReceipt,
     GoodsReceiptLine,
+    StockLevel,
 )
-from backend.app.db.models.core_types import LocationType, POStatus, ReceiptStatus
+from backend.app.db.models.core_types import POStatus, ReceiptStatus
+from backend.app.services.locations import inbound_dock_location_id
+from backend.app.services.stock_levels import lock_stock_levels
 
 
-# PO "engagés" = ceux qui génèrent du on_order
+# PO "engagés" = ceux qui génèrent du on_order (repris tel quel par les triggers de on_order_summary)
 ENGAGED_PO_STATUSES = {POStatus.approved, POStatus.shipped, POStatus.partial}
 # Optionnel si tu veux inclure closed :
 # ENGAGED_PO_STATUSES = {POStatus.approved, POStatus.shipped, POStatus.partial, POStatus.closed}
 
+SiteProduct = tuple[int, int]  # (site_id, product_id)
+
 
 def get_inbound_dock_location_id(db: Session, site_id: int) -> int:
     """
-    Retourne la location inbound DOCK du site.
+    Retourne la location inbound DOCK du site (registre services.locations, sans requête).
     Priorité au nom "TAH-DOCK" si présent, sinon première DOCK trouvée.
     """
-    loc = (
-        db.execute(
-            select(Location)
-            .where(Location.site_id == site_id)
-            .where(Location.type == LocationType.dock)
-            .where(Location.name == "TAH-DOCK")
-        )
-        .scalars()
-        .first()
-    )
-    if loc:
-        return int(loc.id)
+    return inbound_dock_location_id(db, site_id)
 
-    loc = (
-        db.execute(
-            select(Location)
-            .where(Location.site_id == site_id)
-            .where(Location.type == LocationType.dock)
-            .order_by(Location.id.asc())
-        )
-        .scalars()
-        .first()
-    )
-    if not loc:
-        raise ValueError("No DOCK location found for this site (LocationType.dock)")
-    return int(loc.id)
 
+# ---------- résumé (lecture par clé) ----------
 
-def rebuild_qty_on_order(db: Session, site_id: int, product_ids: Iterable[int]) -> None:
-    """
-    Recalcule qty_on_order pour une liste de produits, sur la location DOCK inbound du site.
 
-    qty_on_order = SUM(qty_ordered sur PO engagés) - SUM(qty_received - qty_damaged sur GR POSTED)
-    Clamp à 0.
+def _summary_on_order():
+    return OnOrderSummary.ordered_qty - OnOrderSummary.received_qty
+
+
+def summary_qty_on_order(db: Session, keys: Iterable[SiteProduct]) -> dict[SiteProduct, int]:
+    """qty_on_order attendu par (site, produit), lu dans on_order_summary (clés absentes = 0)."""
+    keys = sorted({(int(s), int(p)) for s, p in keys})
+    if not keys:
+        return {}
+    found = {
+        (int(s), int(p)): int(q)
+        for s, p, q in db.execute(
+            select(OnOrderSummary.site_id, OnOrderSummary.product_id, _summary_on_order())
+            .where(tuple_(OnOrderSummary.site_id, OnOrderSummary.product_id).in_(keys))
+        ).all()
+    }
+    return {key: found.get(key, 0) for key in keys}
+
 
-    Note: on clamp aussi chaque ligne reçue à >= 0 via GREATEST(qty_received - qty_damaged, 0)
-    pour éviter qu'une saisie (ou future logique) ne rende le total "received" négatif.
+def sync_qty_on_order(db: Session, keys: Iterable[SiteProduct]) -> None:
     """
-    product_ids = sorted({int(x) for x in product_ids if x is not None})
-    if not product_ids:
+    qty_on_order de la DOCK inbound = valeur du résumé, pour les (site, produit) donnés.
+    Un seul lock_stock_levels pour toutes les clés (ordre canonique partagé). Ne commit pas.
+    """
+    # les triggers du résumé ne voient que ce qui est flushé (autoflush=False)
+    db.flush()
+    expected = summary_qty_on_order(db, keys)
+    if not expected:
         return
 
-    dock_location_id = get_inbound_dock_location_id(db, site_id)
+    docks = {site_id: get_inbound_dock_location_id(db, site_id) for site_id in sorted({s for s, _ in expected})}
+    levels = lock_stock_levels(db, [(pid, docks[site_id]) for site_id, pid in expected])
+    for (site_id, pid), qty in expected.items():
+        levels[(pid, docks[site_id])].qty_on_order = qty
+    db.flush()
 
-    # Total commandé sur PO engagés
-    ordered_rows = db.execute(
-        select(
-            PurchaseOrderLine.product_id,
-            func.coalesce(func.sum(PurchaseOrderLine.qty_ordered), 0).label("ordered_qty"),
-        )
+
+def sync_po_qty_on_order(db: Session, po_ids: Iterable[int]) -> None:
+    """PO entrés dans / sortis des statuts engagés : resynchronise les produits de leurs lignes."""
+    po_ids = sorted({int(x) for x in po_ids})
+    if not po_ids:
+        return
+    db.flush()
+    keys = db.execute(
+        select(PurchaseOrder.site_id, PurchaseOrderLine.product_id)
         .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.po_id)
-        .where(PurchaseOrder.site_id == site_id)
-        .where(PurchaseOrder.status.in_(ENGAGED_PO_STATUSES))
-        .where(PurchaseOrderLine.product_id.in_(product_ids))
-        .group_by(PurchaseOrderLine.product_id)
+        .where(PurchaseOrderLine.po_id.in_(po_ids))
     ).all()
+    sync_qty_on_order(db, keys)
+
+
+def apply_receipt_on_order(db: Session, receipt: GoodsReceipt) -> None:
+    """Réception POSTED (lignes écrites) : resynchronise les produits reçus, site du PO."""
+    db.flush()
+    keys = db.execute(
+        select(PurchaseOrder.site_id, GoodsReceiptLine.product_id)
+        .join(GoodsReceipt, GoodsReceipt.id == GoodsReceiptLine.receipt_id)
+        .join(PurchaseOrder, PurchaseOrder.id == GoodsReceipt.po_id)
+        .where(GoodsReceiptLine.receipt_id == receipt.id)
+    ).all()
+    sync_qty_on_order(db, keys)
+
+
+# ---------- agrégats d'origine (vérification / réparation du résumé) ----------
 
-    # Total reçu sur GR POSTED (sécurisé industriel)
-    received_rows = db.execute(
+
+def _net_received():
+    # on clamp chaque ligne reçue à >= 0 pour qu'une saisie ne rende pas le "reçu" négatif
+    return func.greatest(GoodsReceiptLine.qty_received - GoodsReceiptLine.qty_damaged, 0)
+
+
+def _open_lines(po_filter, line_filter=()):
+    """
+    Par ligne de PO : (site_id, product_id, ordered, received, open_qty), received borné à ordered.
+    po_filter : conditions sur PurchaseOrder (les réceptions sont restreintes aux mêmes PO) ;
+    line_filter : conditions sur PurchaseOrderLine.
+    """
+    received = (
         select(
+            GoodsReceipt.po_id,
             GoodsReceiptLine.product_id,
-            func.coalesce(
-                func.sum(func.greatest(GoodsReceiptLine.qty_received - GoodsReceiptLine.qty_damaged, 0)),
-                0,
-            ).label("received_qty"),
+            func.sum(_net_received()).label("qty"),
         )
         .join(GoodsReceipt, GoodsReceipt.id == GoodsReceiptLine.receipt_id)
         .join(PurchaseOrder, PurchaseOrder.id == GoodsReceipt.po_id)
-        .where(PurchaseOrder.site_id == site_id)
         .where(GoodsReceipt.status == ReceiptStatus.posted)
-        .where(GoodsReceiptLine.product_id.in_(product_ids))
-        .group_by(GoodsReceiptLine.product_id)
-    ).all()
+        .where(*po_filter)
+        .group_by(GoodsReceipt.po_id, GoodsReceiptLine.product_id)
+        .subquery("received")
+    )
+    line_received = func.least(func.coalesce(received.c.qty, 0), PurchaseOrderLine.qty_ordered)
+    return (
+        select(
+            PurchaseOrder.site_id,
+            PurchaseOrderLine.product_id,
+            PurchaseOrderLine.qty_ordered.label("ordered"),
+            line_received.label("received"),
+            (PurchaseOrderLine.qty_ordered - line_received).label("open_qty"),
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.po_id)
+        .outerjoin(
+            received,
+            (received.c.po_id == PurchaseOrderLine.po_id) & (received.c.product_id == PurchaseOrderLine.product_id),
+        )
+        .where(*po_filter)
+        .where(*line_filter)
+    )
+
+
+def _engaged(site_id: int | None) -> list:
+    po_filter = [PurchaseOrder.status.in_(ENGAGED_PO_STATUSES)]
+    if site_id is not None:
+        po_filter.append(PurchaseOrder.site_id == site_id)
+    return po_filter
+
 
-    ordered = {int(pid): int(qty) for pid, qty in ordered_rows}
-    received = {int(pid): int(qty) for pid, qty in received_rows}
+def _summary_source(site_id: int | None):
+    """Contenu attendu de on_order_summary, recalculé depuis l'historique (site_id=None : tous)."""
+    lines = _open_lines(_engaged(site_id)).subquery("open_lines")
+    return select(
+        lines.c.site_id,
+        lines.c.product_id,
+        func.sum(lines.c.ordered).label("ordered_qty"),
+        func.sum(lines.c.received).label("received_qty"),
+    ).group_by(lines.c.site_id, lines.c.product_id)
+
+
+def aggregate_qty_on_order(db: Session, site_id: int, product_ids: Iterable[int]) -> dict[int, int]:
+    """qty_on_order recalculé par agrégats sur l'historique des PO engagés (vérification)."""
+    product_ids = sorted({int(x) for x in product_ids if x is not None})
+    if not product_ids:
+        return {}
+    lines = _open_lines(_engaged(site_id), [PurchaseOrderLine.product_id.in_(product_ids)]).subquery("open_lines")
+    found = dict(
+        db.execute(select(lines.c.product_id, func.sum(lines.c.open_qty)).group_by(lines.c.product_id)).all()
+    )
+    return {pid: int(found.get(pid, 0)) for pid in product_ids}
 
-    for pid in product_ids:
-        outstanding = ordered.get(pid, 0) - received.get(pid, 0)
-        if outstanding < 0:
-            outstanding = 0
 
-        sl = (
-            db.execute(
-                select(StockLevel)
-                .where(StockLevel.product_id == pid)
-                .where(StockLevel.location_id == dock_location_id)
-                .with_for_update()
+def on_order_summary_drift(db: Session, site_id: int | None = None) -> list[dict]:
+    """Cohérence : lignes de on_order_summary qui diffèrent des agrégats d'origine."""
+    db.flush()
+    src = _summary_source(site_id).subquery("src")
+    s = OnOrderSummary.__table__
+    summary = select(s).where((s.c.ordered_qty != 0) | (s.c.received_qty != 0))
+    if site_id is not None:
+        summary = summary.where(s.c.site_id == site_id)
+    summary = summary.subquery("summary")
+
+    site = func.coalesce(src.c.site_id, summary.c.site_id)
+    product = func.coalesce(src.c.product_id, summary.c.product_id)
+    expected_ordered = func.coalesce(src.c.ordered_qty, 0)
+    expected_received = func.coalesce(src.c.received_qty, 0)
+    ordered = func.coalesce(summary.c.ordered_qty, 0)
+    received = func.coalesce(summary.c.received_qty, 0)
+    rows = db.execute(
+        select(
+            site.label("site_id"),
+            product.label("product_id"),
+            expected_ordered.label("expected_ordered"),
+            expected_received.label("expected_received"),
+            ordered.label("ordered_qty"),
+            received.label("received_qty"),
+        )
+        .select_from(
+            src.join(
+                summary,
+                (summary.c.site_id == src.c.site_id) & (summary.c.product_id == src.c.product_id),
+                full=True,
             )
-            .scalar_one_or_none()
         )
+        .where((expected_ordered != ordered) | (expected_received != received))
+        .order_by(site, product)
+    ).mappings().all()
+    return [{k: int(v) for k, v in row.items()} for row in rows]
 
-        if not sl:
-            sl = StockLevel(
-                product_id=pid,
-                location_id=dock_location_id,
-                qty_on_hand=0,
-                qty_reserved=0,
-                qty_on_order=0,
-            )
-            db.add(sl)
-            db.flush()
 
-        sl.qty_on_order = outstanding
+def rebuild_on_order_summary(db: Session, site_id: int | None = None) -> int:
+    """Réparation : réécrit on_order_summary depuis les agrégats (site_id=None : tous). Ne commit pas."""
+    db.flush()
+    s = OnOrderSummary.__table__
+    stmt = delete(s)
+    if site_id is not None:
+        stmt = stmt.where(s.c.site_id == site_id)
+    db.execute(stmt)
+    src = _summary_source(site_id).subquery("src")
+    rows = db.execute(
+        pg_insert(s)
+        .from_select(
+            ["site_id", "product_id", "ordered_qty", "received_qty", "updated_at"],
+            select(src.c.site_id, src.c.product_id, src.c.ordered_qty, src.c.received_qty, func.now())
+            .order_by(src.c.site_id, src.c.product_id),
+        )
+        .returning(s.c.product_id)
+    ).all()
+    return len(rows)
+
+
+# ---------- StockLevel DOCK (vérification / réparation) ----------
+
+
+def qty_on_order_drift(db: Session, site_id: int, product_ids: Iterable[int]) -> list[dict]:
+    """Vérification : produits dont le qty_on_order de la DOCK diffère du résumé."""
+    db.flush()
+    product_ids = sorted({int(x) for x in product_ids if x is not None})
+    if not product_ids:
+        return []
+    expected = summary_qty_on_order(db, [(site_id, pid) for pid in product_ids])
+    dock_location_id = get_inbound_dock_location_id(db, site_id)
+    stored = dict(
+        db.execute(
+            select(StockLevel.product_id, StockLevel.qty_on_order)
+            .where(StockLevel.location_id == dock_location_id)
+            .where(StockLevel.product_id.in_(product_ids))
+        ).all()
+    )
+    return [
+        {"product_id": pid, "qty_on_order": int(stored.get(pid, 0)), "expected": qty}
+        for (_, pid), qty in expected.items()
+        if int(stored.get(pid, 0)) != qty
+    ]
+
+
+def rebuild_qty_on_order(db: Session, site_id: int, product_ids: Iterable[int] | None = None) -> list[int]:
+    """
+    Réparation : réaligne qty_on_order de la DOCK inbound du site sur on_order_summary.
+    product_ids=None : tous les produits du site.
+
+    Une seule instruction, quel que soit le nombre de produits :
+    INSERT ... SELECT (lignes du résumé du site + qty_on_order non nuls de la DOCK absents
+    du résumé, triés par product_id = ordre canonique de lock_stock_levels)
+    ON CONFLICT DO UPDATE, limité aux lignes qui changent.
+    Retourne les product_id corrigés. Ne commit pas.
+    """
+    if product_ids is not None:
+        product_ids = sorted({int(x) for x in product_ids if x is not None})
+        if not product_ids:
+            return []
+
+    # les PO / réceptions en attente doivent être visibles du résumé (autoflush=False)
+    db.flush()
+
+    dock_location_id = get_inbound_dock_location_id(db, site_id)
+
+    summary = select(OnOrderSummary.product_id, _summary_on_order().label("qty")).where(
+        OnOrderSummary.site_id == site_id
+    )
+    stale = (
+        select(StockLevel.product_id, literal(0).label("qty"))
+        .where(StockLevel.location_id == dock_location_id)
+        .where(StockLevel.qty_on_order != 0)
+    )
+    if product_ids is not None:
+        summary = summary.where(OnOrderSummary.product_id.in_(product_ids))
+        stale = stale.where(StockLevel.product_id.in_(product_ids))
+    both = union_all(summary, stale).subquery("both")
+    expected = (
+        select(both.c.product_id, func.max(both.c.qty).label("qty")).group_by(both.c.product_id).subquery("src")
+    )
+
+    sl = StockLevel.__table__
+    upsert = pg_insert(sl).from_select(
+        ["product_id", "location_id", "qty_on_hand", "qty_reserved", "qty_on_order", "updated_at"],
+        select(
+            expected.c.product_id,
+            literal(dock_location_id),
+            literal(0),
+            literal(0),
+            expected.c.qty,
+            func.now(),
+        ).order_by(expected.c.product_id),
+    )
+    changed = db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[sl.c.product_id, sl.c.location_id],
+            set_={"qty_on_order": upsert.excluded.qty_on_order, "updated_at": func.now()},
+            where=sl.c.qty_on_order.is_distinct_from(upsert.excluded.qty_on_order),
+        ).returning(sl.c.product_id)
+    ).scalars().all()
+
+    # StockLevel déjà en session : périmés après l'UPSERT Core
+    changed_set = set(changed)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, StockLevel) and obj.location_id == dock_location_id and obj.product_id in changed_set:
+            db.expire(obj)
+    return sorted(int(pid) for pid in changed)
@@ -0,0 +1,429 @@
+"""
+Projection du ledger stock_movements -> soldes (qty_on_hand / qty_reserved).
+
+stock_movements est append-only (clé d'idempotence unique) : c'est la source de vérité.
+StockLevel reste mis à jour en place par les endpoints (lecture rapide), mais peut
+être recalculé à tout moment depuis l'historique :
+
+    solde = dernière photo (stock_snapshots) + mouvements non couverts par la photo
+
+Effet de chaque mouvement (quantity toujours > 0) :
+    from_location_id : TRANSFER / ISSUE / SCRAP / ADJUSTMENT -> on_hand  -q
+                       RESERVE -> reserved +q ; UNRESERVE / ISSUE -> reserved -q
+    to_location_id   : RECEIPT / TRANSFER / ADJUSTMENT -> on_hand +q
+
+Hypothèse : le ledger est complet (les soldes d'ouverture sont des ADJUSTMENT vers la location).
+"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import case, func, insert, literal, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+from backend.app.db.session import SessionLocal, engine
+from backend.app.db.models.models_v1 import (
+    Location,
+    Product,
+    StockLevel,
+    StockMovement,
+    StockSnapshot,
+    StockSnapshotLine,
+)
+from backend.app.db.models.core_types import MovementType
+from backend.app.services.hot_stock import shard_totals
+from backend.app.services.stock_levels import StockKey, lock_stock_levels
+
+ON_HAND_OUT = {MovementType.transfer, MovementType.issue, MovementType.scrap, MovementType.adjustment}
+ON_HAND_IN = {MovementType.receipt, MovementType.transfer, MovementType.adjustment}
+RESERVED_OUT = {MovementType.unreserve, MovementType.issue}
+
+
+# ---------- Briques SQL ----------
+def _movement_deltas(*conditions, location_id: int | None = None) -> list:
+    """
+    Deux SELECT (côté source / côté destination) : (product_id, location_id, d_on_hand, d_reserved).
+    location_id : chaque côté filtré sur sa propre colonne (from / to), avant l'UNION.
+    """
+    t = StockMovement.movement_type
+    q = StockMovement.quantity
+
+    out_side = select(
+        StockMovement.product_id.label("product_id"),
+        StockMovement.from_location_id.label("location_id"),
+        case((t.in_(ON_HAND_OUT), -q), else_=0).label("d_on_hand"),
+        case((t == MovementType.reserve, q), (t.in_(RESERVED_OUT), -q), else_=0).label("d_reserved"),
+    ).where(StockMovement.from_location_id.is_not(None), *conditions)
+    if location_id is not None:
+        out_side = out_side.where(StockMovement.from_location_id == location_id)
+
+    in_side = select(
+        StockMovement.product_id,
+        StockMovement.to_location_id,
+        case((t.in_(ON_HAND_IN), q), else_=0),
+        literal(0),
+    ).where(StockMovement.to_location_id.is_not(None), *conditions)
+    if location_id is not None:
+        in_side = in_side.where(StockMovement.to_location_id == location_id)
+
+    return [out_side, in_side]
+
+
+def _snapshot_lines(snapshot_id: int, product_ids: list[int] | None = None, location_id: int | None = None):
+    stmt = select(
+        StockSnapshotLine.product_id,
+        StockSnapshotLine.location_id,
+        StockSnapshotLine.qty_on_hand.label("d_on_hand"),
+        StockSnapshotLine.qty_reserved.label("d_reserved"),
+    ).where(StockSnapshotLine.snapshot_id == snapshot_id)
+    if product_ids is not None:
+        stmt = stmt.where(StockSnapshotLine.product_id.in_(product_ids))
+    if location_id is not None:
+        stmt = stmt.where(StockSnapshotLine.location_id == location_id)
+    return stmt
+
+
+def _not_covered_by(snap: StockSnapshot):
+    """Mouvements absents de la photo : postérieurs, ou arrivés en retard (id > watermark)."""
+    return or_(StockMovement.happened_at > snap.as_of, StockMovement.id > snap.last_movement_id)
+
+
+def _site_locations(site_id: int):
+    return select(Location.id).where(Location.site_id == site_id)
+
+
+# ---------- Photos ----------
+def latest_snapshot(
+    db: Session,
+    *,
+    site_id: int | None = None,
+    as_of: datetime | None = None,
+) -> StockSnapshot | None:
+    """
+    Dernière photo utilisable pour ce périmètre.
+    site_id=None -> photos globales uniquement ; sinon photo du site OU photo globale.
+    """
+    stmt = select(StockSnapshot).order_by(StockSnapshot.as_of.desc(), StockSnapshot.id.desc()).limit(1)
+    if site_id is None:
+        stmt = stmt.where(StockSnapshot.site_id.is_(None))
+    else:
+        stmt = stmt.where(or_(StockSnapshot.site_id == site_id, StockSnapshot.site_id.is_(None)))
+    if as_of is not None:
+        stmt = stmt.where(StockSnapshot.as_of <= as_of)
+    return db.execute(stmt).scalars().first()
+
+
+def take_snapshot(db: Session, *, site_id: int | None = None) -> StockSnapshot:
+    """
+    Nouvelle photo = photo précédente + mouvements entre les deux (incrémental, set-based).
+
+    LOCK SHARE sur stock_movements : attend les transactions d'écriture en cours et bloque
+    les nouvelles le temps de la photo -> tout mouvement d'id <= watermark est commité
+    (pas de "trou" laissé par une transaction lente). À lancer hors pointe.
+    """
+    db.execute(text("LOCK TABLE stock_movements IN SHARE MODE"))
+    watermark = int(db.scalar(select(func.coalesce(func.max(StockMovement.id), 0))))
+    as_of = db.scalar(select(func.now()))
+
+    prev = latest_snapshot(db, site_id=site_id)
+
+    snap = StockSnapshot(site_id=site_id, as_of=as_of, last_movement_id=watermark)
+    db.add(snap)
+    db.flush()
+
+    conditions = [StockMovement.happened_at <= as_of, StockMovement.id <= watermark]
+    parts = []
+    if prev is not None:
+        conditions.append(_not_covered_by(prev))
+        parts.append(_snapshot_lines(prev.id))
+    parts.extend(_movement_deltas(*conditions))
+
+    u = union_all(*parts).subquery()
+    agg = (
+        select(
+            literal(snap.id),
+            u.c.product_id,
+            u.c.location_id,
+            func.sum(u.c.d_on_hand),
+            func.sum(u.c.d_reserved),
+        )
+        .group_by(u.c.product_id, u.c.location_id)
+        .having(or_(func.sum(u.c.d_on_hand) != 0, func.sum(u.c.d_reserved) != 0))
+    )
+    if site_id is not None:
+        agg = agg.where(u.c.location_id.in_(_site_locations(site_id)))
+
+    db.execute(
+        insert(StockSnapshotLine).from_select(
+            ["snapshot_id", "product_id", "location_id", "qty_on_hand", "qty_reserved"],
+            agg,
+        )
+    )
+    return snap
+
+
+# ---------- Projection ----------
+def _balances_query(
+    db: Session,
+    *,
+    site_id: int | None = None,
+    location_id: int | None = None,
+    pids: list[int] | None = None,
+    as_of: datetime | None = None,
+):
+    """SELECT (product_id, location_id, on_hand, reserved) projeté depuis photo + ledger."""
+    snap = latest_snapshot(db, site_id=site_id, as_of=as_of)
+
+    conditions = []
+    if pids is not None:
+        conditions.append(StockMovement.product_id.in_(pids))
+    if as_of is not None:
+        conditions.append(StockMovement.happened_at <= as_of)
+
+    parts = []
+    if snap is not None:
+        conditions.append(_not_covered_by(snap))
+        parts.append(_snapshot_lines(snap.id, pids, location_id))
+    parts.extend(_movement_deltas(*conditions, location_id=location_id))
+
+    u = union_all(*parts).subquery()
+    stmt = select(
+        u.c.product_id,
+        u.c.location_id,
+        func.sum(u.c.d_on_hand).label("on_hand"),
+        func.sum(u.c.d_reserved).label("reserved"),
+    ).group_by(u.c.product_id, u.c.location_id)
+    if site_id is not None:
+        stmt = stmt.where(u.c.location_id.in_(_site_locations(site_id)))
+    return stmt
+
+
+def project_balances(
+    db: Session,
+    *,
+    site_id: int | None = None,
+    location_id: int | None = None,
+    product_ids: Iterable[int] | None = None,
+    as_of: datetime | None = None,
+) -> dict[StockKey, tuple[int, int]]:
+    """
+    Soldes (on_hand, reserved) par (product_id, location_id), dérivés du ledger.
+    as_of=None -> solde courant ; sinon solde à l'instant as_of (happened_at <= as_of).
+    location_id : une seule location, filtrée en SQL (photo et mouvements).
+    Les clés à (0, 0) peuvent être absentes.
+    """
+    pids = sorted({int(p) for p in product_ids}) if product_ids is not None else None
+    stmt = _balances_query(db, site_id=site_id, location_id=location_id, pids=pids, as_of=as_of)
+    return {
+        (int(pid), int(lid)): (int(on_hand), int(reserved))
+        for pid, lid, on_hand, reserved in db.execute(stmt).all()
+    }
+
+
+def find_drift(
+    db: Session,
+    product_ids: Iterable[int],
+    *,
+    site_id: int | None = None,
+) -> list[dict]:
+    """
+    Écarts StockLevel vs ledger pour ces produits, calculés côté SQL (FULL OUTER JOIN) :
+    seules les clés en écart remontent. Lecture seule, sans verrou : une seule
+    instruction, donc une seule photo MVCC (mouvement et StockLevel commités ensemble).
+    StockLevel des couples chauds : valeurs effectives (shards compris).
+    """
+    pids = sorted({int(p) for p in product_ids})
+    if not pids:
+        return []
+
+    proj = _balances_query(db, site_id=site_id, pids=pids).subquery()
+    t = shard_totals().subquery()
+    lvl = (
+        select(
+            StockLevel.product_id,
+            StockLevel.location_id,
+            (StockLevel.qty_on_hand - func.coalesce(t.c.issued, 0)).label("on_hand"),
+            (StockLevel.qty_reserved - func.coalesce(t.c.escrowed, 0) + func.coalesce(t.c.reserved, 0)).label("reserved"),
+        )
+        .outerjoin(
+            t,
+            (t.c.product_id == StockLevel.product_id) & (t.c.location_id == StockLevel.location_id),
+        )
+        .where(StockLevel.product_id.in_(pids))
+    )
+    if site_id is not None:
+        lvl = lvl.where(StockLevel.location_id.in_(_site_locations(site_id)))
+    lvl = lvl.subquery()
+
+    expected_on_hand = func.coalesce(proj.c.on_hand, 0)
+    expected_reserved = func.coalesce(proj.c.reserved, 0)
+    actual_on_hand = func.coalesce(lvl.c.on_hand, 0)
+    actual_reserved = func.coalesce(lvl.c.reserved, 0)
+
+    product_id = func.coalesce(proj.c.product_id, lvl.c.product_id)
+    location_id = func.coalesce(proj.c.location_id, lvl.c.location_id)
+    rows = db.execute(
+        select(
+            product_id,
+            location_id,
+            expected_on_hand,
+            expected_reserved,
+            actual_on_hand,
+            actual_reserved,
+        )
+        .select_from(
+            proj.join(
+                lvl,
+                (proj.c.product_id == lvl.c.product_id) & (proj.c.location_id == lvl.c.location_id),
+                full=True,
+            )
+        )
+        .where(or_(expected_on_hand != actual_on_hand, expected_reserved != actual_reserved))
+        .order_by(product_id, location_id)
+    ).all()
+    return [
+        {
+            "product_id": int(pid),
+            "location_id": int(lid),
+            "expected_on_hand": int(eo),
+            "expected_reserved": int(er),
+            "qty_on_hand": int(ao),
+            "qty_reserved": int(ar),
+        }
+        for pid, lid, eo, er, ao, ar in rows
+    ]
+
+
+def rebuild_stock_levels(
+    db: Session,
+    product_ids: Iterable[int],
+    *,
+    site_id: int | None = None,
+) -> dict:
+    """
+    Réécrit qty_on_hand / qty_reserved des StockLevel de ces produits depuis le ledger.
+    (qty_on_order n'est pas concerné : il dérive des PO.)
+
+    Verrou AVANT projection : un écrivain concurrent sur ces lignes a soit déjà commité
+    (donc visible de la projection), soit attend notre commit.
+    Les clés dont la projection viole les contraintes de stock_levels sont laissées
+    intactes et remontées dans "invalid" (ledger incomplet à investiguer).
+    """
+    pids = sorted({int(p) for p in product_ids})
+    if not pids:
+        return {"changed": 0, "invalid": []}
+
+    existing = select(StockLevel.product_id, StockLevel.location_id).where(StockLevel.product_id.in_(pids))
+    if site_id is not None:
+        existing = existing.where(StockLevel.location_id.in_(_site_locations(site_id)))
+    levels = lock_stock_levels(db, [(int(p), int(l)) for p, l in db.execute(existing).all()])
+
+    balances = project_balances(db, site_id=site_id, product_ids=pids)
+
+    # clés présentes dans le ledger mais sans StockLevel (historique ancien)
+    extra = [k for k in balances if k not in levels]
+    if extra:
+        levels.update(lock_stock_levels(db, extra))
+
+    changed = 0
+    invalid = []
+    for key, sl in levels.items():
+        on_hand, reserved = balances.get(key, (0, 0))
+        if on_hand < 0 or reserved < 0 or reserved > on_hand:
+            invalid.append({"product_id": key[0], "location_id": key[1], "qty_on_hand": on_hand, "qty_reserved": reserved})
+            continue
+        if (sl.qty_on_hand, sl.qty_reserved) != (on_hand, reserved):
+            sl.qty_on_hand = on_hand
+            sl.qty_reserved = reserved
+            changed += 1
+
+    db.flush()
+    return {"changed": changed, "invalid": invalid}
+
+
+# ---------- Rebuild parallèle par partition de produits ----------
+def _init_worker() -> None:
+    # process forké : ne jamais réutiliser les connexions du pool parent
+    engine.dispose(close=False)
+
+
+def rebuild_partition(partition: int, partitions: int, chunk_size: int = 500) -> dict:
+    """Rebuild des produits où product_id % partitions == partition (session dédiée, commit par lot)."""
+    db = SessionLocal()
+    try:
+        product_ids = (
+            db.execute(
+                select(Product.id)
+                .where(Product.id % partitions == partition)
+                .order_by(Product.id)
+            )
+            .scalars()
+            .all()
+        )
+        report = {"partition": partition, "products": len(product_ids), "changed": 0, "invalid": []}
+        for i in range(0, len(product_ids), chunk_size):
+            res = rebuild_stock_levels(db, product_ids[i : i + chunk_size])
+            db.commit()
+            report["changed"] += res["changed"]
+            report["invalid"].extend(res["invalid"])
+        return report
+    finally:
+        db.close()
+
+
+def rebuild_all(partitions: int = 4, workers: int | None = None) -> list[dict]:
+    """Rebuild de tout le stock, une partition de produits par process."""
+    with ProcessPoolExecutor(max_workers=workers or partitions, initializer=_init_worker) as pool:
+        return list(pool.map(rebuild_partition, range(partitions), [partitions] * partitions))
+
+
+# ---------- Réconciliation parallèle (lecture seule, repair optionnel) ----------
+def reconcile_chunk(product_ids: list[int], site_id: int | None = None, repair: bool = False) -> dict:
+    """
+    Écarts d'un lot de produits (session dédiée). repair=True : rebuild_stock_levels des
+    produits en écart uniquement (re-projection sous verrou, commit).
+    """
+    db = SessionLocal()
+    try:
+        drift = find_drift(db, product_ids, site_id=site_id)
+        db.rollback()
+        report = {"products": len(product_ids), "drift": drift, "repaired": 0, "invalid": []}
+        if repair and drift:
+            res = rebuild_stock_levels(db, {d["product_id"] for d in drift}, site_id=site_id)
+            db.commit()
+            report["repaired"] = res["changed"]
+            report["invalid"] = res["invalid"]
+        return report
+    finally:
+        db.close()
+
+
+def reconcile_all(
+    *,
+    site_id: int | None = None,
+    workers: int = 4,
+    chunk_size: int = 500,
+    repair: bool = False,
+) -> dict:
+    """Réconciliation de tout le stock (ou d'un site) : lots de produits répartis sur un pool de process."""
+    db = SessionLocal()
+    try:
+        product_ids = [int(p) for p in db.execute(select(Product.id).order_by(Product.id)).scalars()]
+    finally:
+        db.close()
+
+    chunks = [product_ids[i : i + chunk_size] for i in range(0, len(product_ids), chunk_size)]
+    total = {"products": len(product_ids), "chunks": len(chunks), "drift": [], "repaired": 0, "invalid": []}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for r in pool.map(
+            reconcile_chunk,
+            chunks,
+            [site_id] * len(chunks),
+            [repair] * len(chunks),
+        ):
+            total["drift"].extend(r["drift"])
+            total["repaired"] += r["repaired"]
+            total["invalid"].extend(r["invalid"])
+    return total
@@ -0,0 +1,147 @@
+"""
+Topologie sites / locations en mémoire (cache process).
+
+Les locations ne changent presque jamais, mais chaque réception, rebuild on_order ou
+réception de conteneur les résolvait en base (db.get, recherche de la DOCK inbound).
+Le registre charge toute la table une fois et l'indexe :
+
+- par id                 -> get_location()
+- par (site, type)       -> locations_of_type(), inbound_dock_location_id()
+- par (site, nom)        -> location_by_name()
+
+Invalidation :
+- écriture ORM sur Location (add / modif / delete, ou insert/update/delete ORM-enabled)
+  dans ce process : registre invalidé au flush, puis à nouveau en fin de transaction
+  (commit ou rollback) pour ne garder ni location non commitée ni location annulée
+- écriture par un autre process : rechargement au plus tard après REGISTRY_TTL_SECONDS,
+  ou tout de suite sur une clé absente (au plus une fois par MISS_RELOAD_SECONDS)
+
+Un rechargement commencé avant une invalidation n'est pas installé (compteur de génération).
+"""
+from __future__ import annotations
+
+import time
+from typing import NamedTuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import Location
+from backend.app.db.models.core_types import LocationType
+
+INBOUND_DOCK_NAME = "TAH-DOCK"
+REGISTRY_TTL_SECONDS = 300
+MISS_RELOAD_SECONDS = 1.0
+
+
+class LocationRef(NamedTuple):
+    id: int
+    site_id: int
+    name: str
+    type: LocationType
+
+
+class LocationRegistry:
+    def __init__(self, locations: list[LocationRef]):
+        self.by_id: dict[int, LocationRef] = {}
+        self.by_site_type: dict[tuple[int, LocationType], tuple[LocationRef, ...]] = {}
+        self.by_site_name: dict[tuple[int, str], LocationRef] = {}
+        grouped: dict[tuple[int, LocationType], list[LocationRef]] = {}
+        for loc in sorted(locations):
+            self.by_id[loc.id] = loc
+            self.by_site_name[(loc.site_id, loc.name)] = loc
+            grouped.setdefault((loc.site_id, loc.type), []).append(loc)
+        self.by_site_type = {key: tuple(locs) for key, locs in grouped.items()}
+        self.loaded_at = time.monotonic()
+
+    def site_locations(self, site_id: int) -> list[LocationRef]:
+        return sorted(loc for loc in self.by_id.values() if loc.site_id == site_id)
+
+    def inbound_dock(self, site_id: int) -> LocationRef | None:
+        """DOCK nommée INBOUND_DOCK_NAME si présente, sinon première DOCK du site (id)."""
+        loc = self.by_site_name.get((site_id, INBOUND_DOCK_NAME))
+        if loc is not None and loc.type == LocationType.dock:
+            return loc
+        docks = self.by_site_type.get((site_id, LocationType.dock), ())
+        return docks[0] if docks else None
+
+
+_registry: LocationRegistry | None = None
+_generation = 0
+
+
+def invalidate_location_registry() -> None:
+    global _registry, _generation
+    _generation += 1
+    _registry = None
+
+
+def _load(db: Session) -> LocationRegistry:
+    global _registry
+    generation = _generation
+    rows = db.execute(select(Location.id, Location.site_id, Location.name, Location.type)).all()
+    registry = LocationRegistry([LocationRef(int(i), int(s), n, t) for i, s, n, t in rows])
+    if generation == _generation:
+        _registry = registry
+    return registry
+
+
+def location_registry(db: Session) -> LocationRegistry:
+    """Registre courant ; (re)chargé via db s'il est absent, invalidé ou expiré."""
+    registry = _registry
+    if registry is None or time.monotonic() - registry.loaded_at > REGISTRY_TTL_SECONDS:
+        registry = _load(db)
+    return registry
+
+
+def _lookup(db: Session, find):
+    """find(registry) ; sur absence, un rechargement (location créée par un autre process)."""
+    registry = location_registry(db)
+    found = find(registry)
+    if found is None and time.monotonic() - registry.loaded_at > MISS_RELOAD_SECONDS:
+        found = find(_load(db))
+    return found
+
+
+def get_location(db: Session, location_id: int) -> LocationRef | None:
+    return _lookup(db, lambda r: r.by_id.get(int(location_id)))
+
+
+def location_by_name(db: Session, site_id: int, name: str) -> LocationRef | None:
+    return _lookup(db, lambda r: r.by_site_name.get((int(site_id), name)))
+
+
+def locations_of_type(db: Session, site_id: int, location_type: LocationType) -> tuple[LocationRef, ...]:
+    return _lookup(db, lambda r: r.by_site_type.get((int(site_id), location_type))) or ()
+
+
+def inbound_dock_location_id(db: Session, site_id: int) -> int:
+    loc = _lookup(db, lambda r: r.inbound_dock(int(site_id)))
+    if loc is None:
+        raise ValueError("No DOCK location found for this site (LocationType.dock)")
+    return loc.id
+
+
+# ---------- invalidation sur écriture ----------
+
+_WRITTEN = "locations_written"
+
+
+@event.listens_for(Session, "after_flush")
+def _locations_flushed(session, flush_context):
+    if any(isinstance(obj, Location) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info[_WRITTEN] = True
+        invalidate_location_registry()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _locations_bulk_written(state):
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is Location.__mapper__:
+        state.session.info[_WRITTEN] = True
+        invalidate_location_registry()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _locations_transaction_end(session, transaction):
+    if transaction.parent is None and session.info.pop(_WRITTEN, False):
+        invalidate_location_registry()
@@ -0,0 +1,291 @@
+"""
+Stock par lot / péremption (stock_lots) et allocation FEFO (first-expired-first-out).
+
+StockLevel reste la référence de disponibilité (gardes du fast path, verrou canonique) ;
+stock_lots en détaille la répartition par lot. Chaque mouvement déjà appliqué au
+StockLevel est répercuté ici, dans la même transaction :
+
+    RECEIPT   : lot reçu qty_on_hand += q                       (receive)
+    RESERVE   : lots les plus proches de péremption, disponible  (reserve)
+    UNRESERVE : lots réservés, péremption la plus lointaine d'abord (unreserve)
+    ISSUE     : lots réservés, FEFO ; on_hand et reserved -= q   (issue)
+    TRANSFER  : lots disponibles FEFO, recréés à destination     (transfer)
+                (reste non alloué : lot non suivi à destination)
+
+Une allocation = UNE instruction : les lots candidats du couple sont lus via
+ix_stock_lots_fefo (product_id, location_id, expiration_date, id) et verrouillés
+FOR UPDATE SKIP LOCKED (au plus `quantity` lots), le cumul (window function) découpe
+la quantité, l'UPDATE ... FROM applique les prélèvements. Un lot verrouillé par une
+transaction concurrente (couple chaud, sans verrou StockLevel) est sauté sans attente
+et l'allocation rejouée pour le reste.
+
+Tous les lots libres pris ailleurs :
+- wait=True (couple sérialisé par son StockLevel) : une passe qui attend les verrous
+- wait=False (mouvement servi par les shards) : le reste est noté dans stock_lot_pending
+  et alloué plus tard par allocate_pending (hot_stock.rebalance), sans attente
+
+Lots insuffisants (stock antérieur non ventilé) : le reste n'est pas alloué par lot,
+le mouvement n'est jamais refusé ici.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import StockLot, StockLotPending, StockMovement, StockMovementLot
+from backend.app.db.models.core_types import MovementType
+
+LotKey = tuple[str | None, date | None]  # (lot_code, expiration_date)
+
+
+
+def _fefo(lot) -> tuple:
+    return (lot.expiration_date.asc().nulls_last(), lot.id.asc())
+
+
+def _lefo(lot) -> tuple:
+    return (lot.expiration_date.desc().nulls_first(), lot.id.desc())
+
+
+FEFO_ORDER = _fefo(StockLot)
+LEFO_ORDER = _lefo(StockLot)
+
+
+def _allocate_once(
+    db: Session, product_id: int, location_id: int, quantity: int, available, order, values, *, skip_locked: bool
+) -> list:
+    # verrou sans window function (interdit avec FOR UPDATE) : au plus un lot par unité
+    free = (
+        select(StockLot.id, StockLot.expiration_date, available.label("avail"))
+        .where(StockLot.product_id == product_id)
+        .where(StockLot.location_id == location_id)
+        .where(available > 0)
+        .order_by(*order(StockLot))
+        .limit(quantity)
+        .with_for_update(skip_locked=skip_locked)
+        .cte("free")
+    )
+    cand = select(
+        free.c.id,
+        free.c.avail,
+        func.sum(free.c.avail).over(order_by=order(free.c)).label("cum"),
+    ).cte("cand")
+    pick = (
+        select(cand.c.id, func.least(cand.c.avail, quantity - (cand.c.cum - cand.c.avail)).label("take"))
+        .where(cand.c.cum - cand.c.avail < quantity)
+        .cte("pick")
+    )
+    take = pick.c.take
+    return db.execute(
+        update(StockLot)
+        .where(StockLot.id == pick.c.id)
+        .where(available >= take)
+        .values(**{col: fn(take) for col, fn in values.items()}, updated_at=func.now())
+        .returning(StockLot.id, StockLot.lot_code, StockLot.expiration_date, take)
+    ).all()
+
+
+def _allocate(
+    db: Session,
+    movement_id: int,
+    product_id: int,
+    location_id: int,
+    quantity: int,
+    *,
+    movement_type: MovementType,
+    wait: bool,
+) -> list[tuple[int, LotKey, int]]:
+    """Prélève jusqu'à `quantity` sur les lots du couple ; enregistre stock_movement_lots."""
+    available, order, values = _ALLOCATIONS[movement_type]
+    taken: dict[int, list] = {}
+    remaining = quantity
+    for skip_locked in (True, False) if wait else (True,):
+        while remaining > 0:
+            rows = _allocate_once(
+                db, product_id, location_id, remaining, available, order, values, skip_locked=skip_locked
+            )
+            if not rows:
+                break
+            for lot_id, lot_code, expiration_date, take in rows:
+                entry = taken.setdefault(int(lot_id), [(lot_code, expiration_date), 0])
+                entry[1] += int(take)
+                remaining -= int(take)
+
+    if taken:
+        # cumul : un reste différé peut retomber sur un lot déjà pris par le mouvement
+        ins = pg_insert(StockMovementLot)
+        db.execute(
+            ins.on_conflict_do_update(
+                index_elements=["movement_id", "lot_id"],
+                set_={"quantity": StockMovementLot.quantity + ins.excluded.quantity},
+            ),
+            [{"movement_id": movement_id, "lot_id": lot_id, "quantity": q} for lot_id, (_, q) in sorted(taken.items())],
+        )
+    if remaining > 0 and not wait and _has_free_lot(db, product_id, location_id, available):
+        db.execute(
+            pg_insert(StockLotPending).values(
+                movement_id=movement_id,
+                product_id=product_id,
+                location_id=location_id,
+                movement_type=movement_type,
+                quantity=remaining,
+            )
+        )
+    return [(lot_id, key, q) for lot_id, (key, q) in taken.items()]
+
+
+def _has_free_lot(db: Session, product_id: int, location_id: int, available) -> bool:
+    """Reste dû aux verrous (lot disponible mais pris) et non à des lots insuffisants ?"""
+    return db.scalar(
+        select(StockLot.id)
+        .where(StockLot.product_id == product_id)
+        .where(StockLot.location_id == location_id)
+        .where(available > 0)
+        .limit(1)
+    ) is not None
+
+
+def receive(db: Session, product_id: int, location_id: int, quantities: dict[LotKey, int]) -> None:
+    """Entrées de stock par lot (upsert, clés triées)."""
+    receive_many(db, location_id, {(product_id, key): q for key, q in quantities.items()})
+
+
+def receive_many(db: Session, location_id: int, quantities: dict[tuple[int, LotKey], int]) -> None:
+    rows = [
+        {
+            "product_id": pid,
+            "location_id": location_id,
+            "lot_code": lot_code,
+            "expiration_date": expiration_date,
+            "qty_on_hand": q,
+            "qty_reserved": 0,
+        }
+        for (pid, (lot_code, expiration_date)), q in sorted(
+            quantities.items(), key=lambda kv: (kv[0][0], kv[0][1][1] or date.max, kv[0][1][0] or "")
+        )
+        if q > 0
+    ]
+    if not rows:
+        return
+    upsert = pg_insert(StockLot)
+    db.execute(
+        upsert.on_conflict_do_update(
+            constraint="uq_stock_lot",
+            set_={"qty_on_hand": StockLot.qty_on_hand + upsert.excluded.qty_on_hand, "updated_at": func.now()},
+        ),
+        rows,
+    )
+
+
+_ALLOCATIONS = {
+    MovementType.reserve: (
+        StockLot.qty_on_hand - StockLot.qty_reserved,
+        _fefo,
+        {"qty_reserved": lambda take: StockLot.qty_reserved + take},
+    ),
+    # libère d'abord les lots les plus lointains : les plus proches restent réservés
+    MovementType.unreserve: (
+        StockLot.qty_reserved,
+        _lefo,
+        {"qty_reserved": lambda take: StockLot.qty_reserved - take},
+    ),
+    MovementType.issue: (
+        StockLot.qty_reserved,
+        _fefo,
+        {
+            "qty_reserved": lambda take: StockLot.qty_reserved - take,
+            "qty_on_hand": lambda take: StockLot.qty_on_hand - take,
+        },
+    ),
+    MovementType.transfer: (
+        StockLot.qty_on_hand - StockLot.qty_reserved,
+        _fefo,
+        {"qty_on_hand": lambda take: StockLot.qty_on_hand - take},
+    ),
+}
+
+
+def reserve(db: Session, movement_id: int, product_id: int, location_id: int, quantity: int, *, wait: bool = True) -> list:
+    return _allocate(
+        db, movement_id, product_id, location_id, quantity, movement_type=MovementType.reserve, wait=wait
+    )
+
+
+def unreserve(db: Session, movement_id: int, product_id: int, location_id: int, quantity: int, *, wait: bool = True) -> list:
+    return _allocate(
+        db, movement_id, product_id, location_id, quantity, movement_type=MovementType.unreserve, wait=wait
+    )
+
+
+def issue(db: Session, movement_id: int, product_id: int, location_id: int, quantity: int, *, wait: bool = True) -> list:
+    return _allocate(
+        db, movement_id, product_id, location_id, quantity, movement_type=MovementType.issue, wait=wait
+    )
+
+
+def transfer(
+    db: Session,
+    movement_id: int,
+    product_id: int,
+    from_location_id: int,
+    to_location_id: int,
+    quantity: int,
+) -> list:
+    taken = _allocate(
+        db, movement_id, product_id, from_location_id, quantity, movement_type=MovementType.transfer, wait=True
+    )
+    moved: dict[LotKey, int] = defaultdict(int)
+    for _, key, q in taken:
+        moved[key] += q
+    # lots source insuffisants : le reste arrive quand même (StockLevel), en non suivi
+    moved[(None, None)] += quantity - sum(moved.values())
+    receive(db, product_id, to_location_id, moved)
+    return taken
+
+
+def apply_movement(db: Session, mv: StockMovement) -> list:
+    """Répercute un mouvement ORM déjà flushé (endpoint batch)."""
+    if mv.movement_type == MovementType.transfer:
+        return transfer(db, mv.id, mv.product_id, mv.from_location_id, mv.to_location_id, mv.quantity)
+    allocate = {MovementType.reserve: reserve, MovementType.unreserve: unreserve, MovementType.issue: issue}
+    return allocate[mv.movement_type](db, mv.id, mv.product_id, mv.from_location_id, mv.quantity)
+
+
+def release_many(db: Session, releases: Iterable[tuple[int, int, int, int]]) -> None:
+    """UNRESERVE en série (movement_id, product_id, location_id, quantity) — sweeper d'expiration."""
+    for movement_id, product_id, location_id, quantity in sorted(releases, key=lambda r: (r[1], r[2], r[0])):
+        unreserve(db, movement_id, product_id, location_id, quantity)
+
+
+def allocate_pending(db: Session, product_id: int, location_id: int, *, wait: bool = False) -> int:
+    """
+    Alloue les restes différés d'un couple (ordre des mouvements). wait=False : ce qui
+    tombe encore sur des lots verrouillés reste en attente. Retourne le nombre traité.
+    """
+    pending = db.execute(
+        delete(StockLotPending)
+        .where(StockLotPending.product_id == product_id)
+        .where(StockLotPending.location_id == location_id)
+        .returning(StockLotPending.movement_id, StockLotPending.movement_type, StockLotPending.quantity)
+    ).all()
+    for movement_id, movement_type, quantity in sorted(pending):
+        _allocate(
+            db, movement_id, product_id, location_id, quantity, movement_type=movement_type, wait=wait
+        )
+    return len(pending)
+
+
+def movement_lots(db: Session, movement_id: int) -> list[dict]:
+    """Lots d'un mouvement, FEFO (réponse des endpoints, y compris au rejeu)."""
+    rows = db.execute(
+        select(StockLot.lot_code, StockLot.expiration_date, StockMovementLot.quantity)
+        .join(StockMovementLot, StockMovementLot.lot_id == StockLot.id)
+        .where(StockMovementLot.movement_id == movement_id)
+        .order_by(*FEFO_ORDER)
+    ).all()
+    return [{"lot_code": c, "expiration_date": e, "quantity": int(q)} for c, e, q in rows]
@@ -0,0 +1,112 @@
+"""
+Lecture en flux d'un manifeste de conteneur (CSV ou NDJSON) et découpage en réceptions par PO.
+
+Colonnes / clés attendues : po_id, product_id, qty_received
+    CSV    : ligne d'en-tête obligatoire, séparateur ","
+    NDJSON : un objet JSON par ligne
+
+Mémoire constante : le corps est lu par morceaux, ligne à ligne ; seules les lignes
+pas encore comptabilisées restent en mémoire (au plus chunk_size produits par PO ouvert).
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+from typing import AsyncIterable, AsyncIterator
+
+MANIFEST_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+MANIFEST_FIELDS = ("po_id", "product_id", "qty_received")
+MANIFEST_CHUNK_SIZE = 500
+
+ManifestRow = tuple[int, int, int, int]  # (line_no, po_id, product_id, qty_received)
+
+
+def manifest_format(content_type: str | None) -> str | None:
+    return MANIFEST_FORMATS.get((content_type or "").split(";")[0].strip().lower())
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Lignes texte (UTF-8, BOM toléré) d'un flux d'octets, sans jamais le charger en entier."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def _row(line_no: int, values: dict) -> ManifestRow:
+    try:
+        po_id, product_id, qty = (int(values[f]) for f in MANIFEST_FIELDS)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"line {line_no}: expected integer {', '.join(MANIFEST_FIELDS)}")
+    if qty <= 0:
+        raise ValueError(f"line {line_no}: qty_received must be > 0")
+    return line_no, po_id, product_id, qty
+
+
+async def iter_manifest_rows(lines: AsyncIterable[str], fmt: str) -> AsyncIterator[ManifestRow]:
+    """Lignes validées du manifeste. ValueError au premier enregistrement invalide."""
+    header: list[str] | None = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                values = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"line {line_no}: invalid JSON")
+            if not isinstance(values, dict):
+                raise ValueError(f"line {line_no}: expected a JSON object")
+            yield _row(line_no, values)
+            continue
+
+        fields = next(csv.reader([line]))
+        if header is None:
+            header = [f.strip() for f in fields]
+            missing = [f for f in MANIFEST_FIELDS if f not in header]
+            if missing:
+                raise ValueError(f"CSV header is missing {', '.join(missing)}")
+            continue
+        yield _row(line_no, dict(zip(header, fields)))
+
+
+class ManifestSplitter:
+    """
+    Regroupe les lignes par PO (quantités cumulées par produit) et rend un lot
+    (po_id, chunk_no, lignes) dès qu'un PO atteint chunk_size produits.
+    chunk_no est déterministe pour un même manifeste : il entre dans la clé
+    d'idempotence de la réception (rejeu = lots déjà comptabilisés ignorés).
+    """
+
+    def __init__(self, chunk_size: int = MANIFEST_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._open: dict[int, dict[int, int]] = {}
+        self._next_chunk: dict[int, int] = {}
+
+    def add(self, po_id: int, product_id: int, qty: int) -> tuple[int, int, list[tuple[int, int]]] | None:
+        lines = self._open.setdefault(po_id, {})
+        lines[product_id] = lines.get(product_id, 0) + qty
+        if len(lines) >= self.chunk_size:
+            return self._take(po_id)
+        return None
+
+    def drain(self) -> list[tuple[int, int, list[tuple[int, int]]]]:
+        return [self._take(po_id) for po_id in sorted(self._open)]
+
+    def _take(self, po_id: int) -> tuple[int, int, list[tuple[int, int]]]:
+        lines = self._open.pop(po_id)
+        chunk_no = self._next_chunk.get(po_id, 0)
+        self._next_chunk[po_id] = chunk_no + 1
+        return po_id, chunk_no, sorted(lines.items())
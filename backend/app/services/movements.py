@@ -0,0 +1,349 @@
+"""
+Fast path SQL des mouvements de stock (RESERVE / UNRESERVE / ISSUE / TRANSFER).
+
+Au lieu du cycle ORM (SELECT FOR UPDATE -> contrôle Python -> flush de l'objet sale),
+chaque mouvement est UNE instruction :
+
+    WITH upd AS (
+        UPDATE stock_levels SET ... WHERE <clé> AND <garde de disponibilité> RETURNING ...
+    )
+    INSERT INTO stock_movements (...) SELECT ... FROM upd RETURNING id
+
+- la garde (ex: qty_on_hand - qty_reserved >= :q) est évaluée sous le verrou de ligne
+  pris par l'UPDATE : pas de fenêtre entre contrôle et écriture
+- 0 ligne retournée = garde refusée (ou StockLevel inexistant) : rien n'a été écrit
+- le verrou n'est tenu que le temps de l'instruction + commit
+
+Couples chauds (StockLevel.shard_count > 0) : la garde principale porte aussi
+shard_count = 0 ; en cas de refus on bascule sur les shards (services.hot_stock),
+sans verrou sur le StockLevel.
+
+Chaque mouvement appliqué est répercuté sur stock_lots (allocation FEFO, services.lots) ;
+sur un couple chaud, sans attendre les verrous de lot.
+
+Les erreurs métier remontent en ValueError (message identique aux endpoints historiques).
+"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import ColumnElement, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import StockLevel, StockMovement
+from backend.app.db.models.core_types import MovementType
+from backend.app.services import hot_stock, lots
+from backend.app.services.stock_levels import ensure_stock_levels, lock_stock_levels
+
+MOVEMENT_COLUMNS = [
+    "product_id",
+    "from_location_id",
+    "to_location_id",
+    "movement_type",
+    "quantity",
+    "reason",
+    "happened_at",
+    "created_by",
+    "idempotency_key",
+    "created_at",
+]
+
+
+def _guarded_update(
+    product_id: int,
+    location_id: int,
+    guard: ColumnElement[bool] | None,
+    **values,
+):
+    stmt = (
+        update(StockLevel)
+        .where(StockLevel.product_id == product_id)
+        .where(StockLevel.location_id == location_id)
+    )
+    if guard is not None:
+        stmt = stmt.where(guard)
+    return stmt.values(**values, updated_at=func.now()).returning(
+        StockLevel.product_id,
+        StockLevel.location_id,
+    )
+
+
+def _apply_with_movement(
+    db: Session,
+    upd,
+    *,
+    movement_type: MovementType,
+    from_location_id: int | None,
+    to_location_id: int | None,
+    quantity: int,
+    reason: str | None,
+    happened_at: datetime,
+    created_by: int,
+    idempotency_key: str,
+) -> int | None:
+    """UPDATE gardé + INSERT du mouvement dans la même instruction. Retourne l'id ou None."""
+    upd_cte = upd.cte("upd")
+    sel = select(
+        upd_cte.c.product_id,
+        literal(from_location_id, StockMovement.from_location_id.type),
+        literal(to_location_id, StockMovement.to_location_id.type),
+        literal(movement_type, StockMovement.movement_type.type),
+        literal(quantity, StockMovement.quantity.type),
+        literal(reason, StockMovement.reason.type),
+        literal(happened_at, StockMovement.happened_at.type),
+        literal(created_by, StockMovement.created_by.type),
+        literal(idempotency_key, StockMovement.idempotency_key.type),
+        func.now(),
+    )
+    stmt = insert(StockMovement).from_select(MOVEMENT_COLUMNS, sel).returning(StockMovement.id)
+    mv_id = db.execute(stmt).scalar_one_or_none()
+    return int(mv_id) if mv_id is not None else None
+
+
+def _read_levels(db: Session, product_id: int, location_id: int) -> tuple[int, int]:
+    """(on_hand, reserved) sans verrou — uniquement pour le message d'erreur."""
+    return hot_stock.effective_levels(db, product_id, location_id)
+
+
+def _is_hot(db: Session, product_id: int, location_id: int) -> bool:
+    return bool(
+        db.scalar(
+            select(StockLevel.shard_count)
+            .where(StockLevel.product_id == product_id)
+            .where(StockLevel.location_id == location_id)
+        )
+    )
+
+
+def _lots_wait(db: Session, product_id: int, location_id: int) -> bool:
+    """Couple chaud : l'allocation par lot n'attend pas les verrous de lot (reste différé)."""
+    return not hot_stock.is_hot(db, product_id, location_id)
+
+
+def _apply_on_shards(db: Session, shard_update, product_id: int, location_id: int, **mv) -> int | None:
+    """Shard libre d'abord (SKIP LOCKED) ; si tous sont pris, on attend un shard éligible."""
+    for skip_locked in (True, False):
+        upd = shard_update(product_id, location_id, mv["quantity"], skip_locked=skip_locked)
+        mv_id = _apply_with_movement(db, upd, **mv)
+        if mv_id is not None:
+            return mv_id
+    return None
+
+
+def _drained_update(db: Session, product_id: int, location_id: int, guard, **values):
+    """Repli d'un couple chaud sur le StockLevel : verrou + drain des shards, puis UPDATE gardé."""
+    lock_stock_levels(db, [(product_id, location_id)])
+    return _guarded_update(product_id, location_id, guard, **values)
+
+
+def _apply_level_or_shards(
+    db: Session,
+    shard_update,
+    product_id: int,
+    location_id: int,
+    guard: ColumnElement[bool],
+    values: dict,
+    mv: dict,
+    *,
+    rebalance_after_drain: bool = False,
+) -> int | None:
+    """
+    1) couple connu comme chaud (cache) : shards d'abord
+    2) UPDATE gardé du StockLevel, refusé si shard_count > 0 (cache périmé sans risque)
+    3) couple chaud mais shards insuffisants : StockLevel drainé sous verrou
+    """
+    tried_shards = hot_stock.is_hot(db, product_id, location_id)
+    if tried_shards:
+        mv_id = _apply_on_shards(db, shard_update, product_id, location_id, **mv)
+        if mv_id is not None:
+            return mv_id
+
+    mv_id = _apply_with_movement(
+        db, _guarded_update(product_id, location_id, guard & (StockLevel.shard_count == 0), **values), **mv
+    )
+    if mv_id is not None or not _is_hot(db, product_id, location_id):
+        return mv_id
+
+    if not tried_shards:
+        mv_id = _apply_on_shards(db, shard_update, product_id, location_id, **mv)
+        if mv_id is not None:
+            return mv_id
+
+    mv_id = _apply_with_movement(db, _drained_update(db, product_id, location_id, guard, **values), **mv)
+    if mv_id is not None and rebalance_after_drain:
+        # on tient déjà le verrou : redistribue le quota pour les suivants
+        hot_stock.rebalance(db, product_id, location_id)
+    return mv_id
+
+
+def reserve(
+    db: Session,
+    *,
+    product_id: int,
+    location_id: int,
+    quantity: int,
+    happened_at: datetime,
+    reason: str | None,
+    idempotency_key: str,
+    created_by: int = 1,
+) -> int:
+    mv = dict(
+        movement_type=MovementType.reserve,
+        from_location_id=location_id,
+        to_location_id=None,
+        quantity=quantity,
+        reason=reason,
+        happened_at=happened_at,
+        created_by=created_by,
+        idempotency_key=idempotency_key,
+    )
+    guard = StockLevel.qty_on_hand - StockLevel.qty_reserved >= quantity
+    values = dict(qty_reserved=StockLevel.qty_reserved + quantity)
+
+    # shards épuisés : réservation sur le StockLevel drainé puis rebalance synchrone
+    mv_id = _apply_level_or_shards(
+        db, hot_stock.reserve_update, product_id, location_id, guard, values, mv, rebalance_after_drain=True
+    )
+    if mv_id is None:
+        on_hand, reserved = _read_levels(db, product_id, location_id)
+        raise ValueError(f"Insufficient available stock (available={on_hand - reserved})")
+    lots.reserve(db, mv_id, product_id, location_id, quantity, wait=_lots_wait(db, product_id, location_id))
+    return mv_id
+
+
+def unreserve(
+    db: Session,
+    *,
+    product_id: int,
+    location_id: int,
+    quantity: int,
+    happened_at: datetime,
+    reason: str | None,
+    idempotency_key: str,
+    created_by: int = 1,
+) -> int:
+    mv = dict(
+        movement_type=MovementType.unreserve,
+        from_location_id=location_id,
+        to_location_id=None,
+        quantity=quantity,
+        reason=reason,
+        happened_at=happened_at,
+        created_by=created_by,
+        idempotency_key=idempotency_key,
+    )
+    guard = StockLevel.qty_reserved >= quantity
+    values = dict(qty_reserved=StockLevel.qty_reserved - quantity)
+
+    # réservation répartie sur plusieurs shards : repli sur le StockLevel drainé
+    mv_id = _apply_level_or_shards(db, hot_stock.unreserve_update, product_id, location_id, guard, values, mv)
+    if mv_id is None:
+        _, reserved = _read_levels(db, product_id, location_id)
+        raise ValueError(f"Insufficient reserved stock (reserved={reserved})")
+    lots.unreserve(db, mv_id, product_id, location_id, quantity, wait=_lots_wait(db, product_id, location_id))
+    return mv_id
+
+
+def issue(
+    db: Session,
+    *,
+    product_id: int,
+    location_id: int,
+    quantity: int,
+    happened_at: datetime,
+    reason: str | None,
+    idempotency_key: str,
+    created_by: int = 1,
+) -> int:
+    mv = dict(
+        movement_type=MovementType.issue,
+        from_location_id=location_id,
+        to_location_id=None,
+        quantity=quantity,
+        reason=reason,
+        happened_at=happened_at,
+        created_by=created_by,
+        idempotency_key=idempotency_key,
+    )
+    # règle simple: on consomme d'abord le réservé (picking)
+    guard = (StockLevel.qty_reserved >= quantity) & (StockLevel.qty_on_hand >= quantity)
+    values = dict(
+        qty_reserved=StockLevel.qty_reserved - quantity,
+        qty_on_hand=StockLevel.qty_on_hand - quantity,
+    )
+
+    mv_id = _apply_level_or_shards(db, hot_stock.issue_update, product_id, location_id, guard, values, mv)
+    if mv_id is None:
+        on_hand, reserved = _read_levels(db, product_id, location_id)
+        if reserved < quantity:
+            raise ValueError(f"Not enough reserved to issue (reserved={reserved})")
+        raise ValueError(f"Not enough on hand to issue (on_hand={on_hand})")
+    lots.issue(db, mv_id, product_id, location_id, quantity, wait=_lots_wait(db, product_id, location_id))
+    return mv_id
+
+
+def transfer(
+    db: Session,
+    *,
+    product_id: int,
+    from_location_id: int,
+    to_location_id: int,
+    quantity: int,
+    happened_at: datetime,
+    reason: str | None,
+    idempotency_key: str,
+    created_by: int = 1,
+) -> int:
+    """
+    Deux UPDATE dans l'ordre canonique (location_id croissant, cf. services.stock_levels) ;
+    le second porte l'INSERT du mouvement. Si la garde source refuse, on lève ValueError :
+    l'appelant doit rollback (l'éventuel crédit destination déjà appliqué est annulé).
+
+    Source chaude : l'escrow compte comme réservé ; si la garde refuse, on draine
+    les shards de la source et on rejoue uniquement la partie refusée.
+    """
+    ensure_stock_levels(db, [(product_id, to_location_id)])
+
+    debit = _guarded_update(
+        product_id,
+        from_location_id,
+        StockLevel.qty_on_hand - StockLevel.qty_reserved >= quantity,
+        qty_on_hand=StockLevel.qty_on_hand - quantity,
+    )
+    credit = _guarded_update(
+        product_id,
+        to_location_id,
+        None,
+        qty_on_hand=StockLevel.qty_on_hand + quantity,
+    )
+    first, last = (debit, credit) if from_location_id < to_location_id else (credit, debit)
+
+    def apply_last():
+        return _apply_with_movement(
+            db,
+            last,
+            movement_type=MovementType.transfer,
+            from_location_id=from_location_id,
+            to_location_id=to_location_id,
+            quantity=quantity,
+            reason=reason,
+            happened_at=happened_at,
+            created_by=created_by,
+            idempotency_key=idempotency_key,
+        )
+
+    mv_id = None
+    first_done = db.execute(first).first() is not None
+    if first_done:
+        mv_id = apply_last()
+    if mv_id is None and _is_hot(db, product_id, from_location_id):
+        lock_stock_levels(db, [(product_id, from_location_id)])
+        if not first_done:
+            first_done = db.execute(first).first() is not None
+        if first_done:
+            mv_id = apply_last()
+    if mv_id is None:
+        on_hand, reserved = _read_levels(db, product_id, from_location_id)
+        raise ValueError(f"Insufficient available stock (available={on_hand - reserved})")
+    lots.transfer(db, mv_id, product_id, from_location_id, to_location_id, quantity)
+    return mv_id
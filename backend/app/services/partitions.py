@@ -0,0 +1,53 @@
+"""
+Partitions mensuelles des tables append-only (cf. migration 18609885a39c).
+
+    stock_movements -> happened_at ; shipment_events -> event_time ; audit_log -> created_at
+
+ensure_partitions() crée à l'avance les partitions des mois à venir (fonction SQL
+ensure_monthly_partition : déplace au besoin les lignes déjà tombées dans la
+partition DEFAULT, puis ATTACH). Sans effet sur une base non partitionnée (create_all).
+"""
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+PARTITIONED_TABLES = ("stock_movements", "shipment_events", "audit_log")
+MONTHS_AHEAD = 3
+
+
+def _add_months(d: date, months: int) -> date:
+    y, m = divmod(d.month - 1 + months, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def partitioned_tables(db: Session) -> list[str]:
+    return list(
+        db.execute(
+            text(
+                "SELECT c.relname FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = ANY(:names) ORDER BY c.relname"
+            ),
+            {"names": list(PARTITIONED_TABLES)},
+        ).scalars()
+    )
+
+
+def ensure_partitions(db: Session, *, months_ahead: int = MONTHS_AHEAD, today: date | None = None) -> list[str]:
+    """
+    Crée les partitions du mois courant et des months_ahead suivants. Ne commit pas.
+    lock_timeout court : l'ATTACH ne doit pas faire la queue derrière le trafic.
+    """
+    start = (today or date.today()).replace(day=1)
+    db.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+    created = []
+    for table in partitioned_tables(db):
+        for k in range(months_ahead + 1):
+            month = _add_months(start, k)
+            if db.scalar(text("SELECT ensure_monthly_partition(:t, :m)"), {"t": table, "m": month}):
+                created.append(f"{table}_p{month:%Y%m}")
+    return created
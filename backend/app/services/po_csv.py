@@ -0,0 +1,85 @@
+"""
+Import CSV de PO (une ligne CSV = une ligne de PO), pour services.purchase_orders.create_pos.
+
+    po_number,supplier_id,site_id,expected_eta,shipment_id,product_id,qty_ordered,unit_cost
+    ASIA-2026-41,12,1,2026-11-20,,3001,240,4.15
+    ASIA-2026-41,12,1,2026-11-20,,3002,120,7.80
+
+Obligatoires : po_number, supplier_id, product_id, qty_ordered, unit_cost.
+Optionnelles : site_id (1 par défaut), expected_eta (AAAA-MM-JJ), shipment_id.
+Les colonnes d'en-tête de PO doivent être identiques sur toutes les lignes d'un même
+po_number ; les PO sont rendus dans l'ordre de première apparition.
+"""
+from __future__ import annotations
+
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Iterable
+
+from backend.app.services.purchase_orders import POSpec
+
+PO_CSV_REQUIRED = ("po_number", "supplier_id", "product_id", "qty_ordered", "unit_cost")
+PO_CSV_HEADER_FIELDS = ("supplier_id", "site_id", "expected_eta", "shipment_id")
+DEFAULT_SITE_ID = 1
+
+
+def _int(line_no: int, field: str, raw: str | None, default: int | None = None) -> int | None:
+    raw = (raw or "").strip()
+    if not raw:
+        if default is None and field in PO_CSV_REQUIRED:
+            raise ValueError(f"line {line_no}: {field} is required")
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"line {line_no}: {field} must be an integer")
+
+
+def _header(line_no: int, row: dict) -> dict:
+    eta = (row.get("expected_eta") or "").strip()
+    try:
+        expected_eta = date.fromisoformat(eta) if eta else None
+    except ValueError:
+        raise ValueError(f"line {line_no}: expected_eta must be YYYY-MM-DD")
+    return {
+        "supplier_id": _int(line_no, "supplier_id", row.get("supplier_id")),
+        "site_id": _int(line_no, "site_id", row.get("site_id"), DEFAULT_SITE_ID),
+        "expected_eta": expected_eta,
+        "shipment_id": _int(line_no, "shipment_id", row.get("shipment_id")),
+    }
+
+
+def parse_po_csv(lines: Iterable[str]) -> list[POSpec]:
+    """PO décrits par le CSV. ValueError (numéro de ligne) au premier enregistrement invalide."""
+    reader = csv.DictReader(lines)
+    header = [f.strip() for f in reader.fieldnames or []]
+    missing = [f for f in PO_CSV_REQUIRED if f not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing {', '.join(missing)}")
+    reader.fieldnames = header
+
+    pos: dict[str, POSpec] = {}
+    for row in reader:
+        line_no = reader.line_num
+        if not any((v or "").strip() for v in row.values()):
+            continue
+        po_number = (row["po_number"] or "").strip()
+        if not po_number or len(po_number) > 64:
+            raise ValueError(f"line {line_no}: po_number must be 1 to 64 characters")
+        head = _header(line_no, row)
+        po = pos.get(po_number)
+        if po is None:
+            po = pos[po_number] = {"po_number": po_number, **head, "lines": []}
+        elif any(po[f] != head[f] for f in PO_CSV_HEADER_FIELDS):
+            raise ValueError(f"line {line_no}: PO {po_number} header differs from its first line")
+
+        try:
+            unit_cost = Decimal((row["unit_cost"] or "").strip())
+        except InvalidOperation:
+            raise ValueError(f"line {line_no}: unit_cost must be a number")
+        qty = _int(line_no, "qty_ordered", row["qty_ordered"])
+        if qty <= 0 or not unit_cost.is_finite() or unit_cost < 0:
+            raise ValueError(f"line {line_no}: qty_ordered must be > 0 and unit_cost >= 0")
+        po["lines"].append((_int(line_no, "product_id", row["product_id"]), qty, unit_cost))
+    return list(pos.values())
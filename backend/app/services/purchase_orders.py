@@ -0,0 +1,298 @@
+"""
+Cycle de vie des PO et maintenance incrémentale de qty_on_order (services.inventory).
+
+    draft -> approved -> shipped -> partial -> closed
+      \\________\\___________\\_________\\-----> cancelled
+
+Un changement de statut qui fait entrer un PO dans ENGAGED_PO_STATUSES (ou l'en fait sortir)
+réaligne le qty_on_order des produits de ses lignes (services.inventory). Ne commit pas.
+
+approve_pos : approbation en masse (commande hebdomadaire d'un bateau) — un UPDATE pour
+tous les PO, puis UNE resynchronisation qty_on_order pour l'ensemble de leurs produits.
+
+Reçu par ligne de PO : PurchaseOrderLine.qty_received / qty_damaged cumulent les lignes
+des réceptions POSTED (receive_po_lines, appelé par services.receiving.post_receipt_lines).
+reste ouvert = GREATEST(qty_ordered - (qty_received - qty_damaged), 0), lu par clé primaire.
+Chaque réception fait avancer un PO engagé : du reçu -> partial, plus rien d'ouvert -> closed.
+rebuild_po_line_received : réparation depuis les réceptions.
+
+create_pos : création en masse (PO consolidés de plus de 1 000 lignes, lots de PO, CSV) —
+références validées par une requête IN par table, en-têtes en un INSERT ... RETURNING,
+lignes en INSERT multi-VALUES par paquets de PO_LINE_INSERT_CHUNK.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Mapping, Sequence, TypedDict
+
+from sqlalchemy import BigInteger, Integer, column, func, insert, select, update, values
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import (
+    GoodsReceipt,
+    GoodsReceiptLine,
+    Product,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    Shipment,
+    Site,
+    Supplier,
+)
+from backend.app.db.models.core_types import POStatus, ReceiptStatus
+from backend.app.services.inventory import ENGAGED_PO_STATUSES, sync_po_qty_on_order
+
+FINAL_PO_STATUSES = {POStatus.closed, POStatus.cancelled}
+
+MAX_BATCH_LINES = 20_000
+# 4 paramètres par ligne : reste loin de la limite de 65 535 paramètres par instruction
+PO_LINE_INSERT_CHUNK = 5_000
+
+POLineSpec = tuple[int, int, Decimal]  # (product_id, qty_ordered, unit_cost)
+
+
+class POSpec(TypedDict):
+    po_number: str
+    supplier_id: int
+    site_id: int
+    expected_eta: date | None
+    shipment_id: int | None
+    lines: Sequence[POLineSpec]
+
+
+class PONumberConflict(ValueError):
+    """po_number déjà utilisé (en base ou deux fois dans le lot)."""
+
+
+def _missing(db: Session, model, ids: set[int]) -> list[int]:
+    if not ids:
+        return []
+    found = set(db.scalars(select(model.id).where(model.id.in_(sorted(ids)))))
+    return sorted(ids - found)
+
+
+def _validate(db: Session, pos: Sequence[POSpec]) -> None:
+    numbers = [p["po_number"] for p in pos]
+    repeated = sorted(n for n, c in Counter(numbers).items() if c > 1)
+    if repeated:
+        raise PONumberConflict(f"PO number repeated in batch: {repeated[:20]}")
+    taken = db.scalars(
+        select(PurchaseOrder.po_number).where(PurchaseOrder.po_number.in_(numbers)).order_by(PurchaseOrder.po_number)
+    ).all()
+    if taken:
+        raise PONumberConflict(f"PO number already exists: {taken[:20]}")
+
+    if sum(len(p["lines"]) for p in pos) > MAX_BATCH_LINES:
+        raise ValueError(f"Too many lines in batch (max {MAX_BATCH_LINES})")
+    for p in pos:
+        dup = sorted(pid for pid, c in Counter(pid for pid, _, _ in p["lines"]).items() if c > 1)
+        if dup:
+            raise ValueError(f"PO {p['po_number']}: product_id repeated {dup[:20]}")
+        for pid, qty, cost in p["lines"]:
+            if qty <= 0 or cost < 0:
+                raise ValueError(f"PO {p['po_number']}: invalid qty_ordered / unit_cost for product_id {pid}")
+
+    # une requête IN par table référencée, quelle que soit la taille du lot
+    for label, model, ids in (
+        ("supplier_id", Supplier, {p["supplier_id"] for p in pos}),
+        ("site_id", Site, {p["site_id"] for p in pos}),
+        ("shipment_id", Shipment, {p["shipment_id"] for p in pos if p["shipment_id"] is not None}),
+        ("product_id", Product, {pid for p in pos for pid, _, _ in p["lines"]}),
+    ):
+        missing = _missing(db, model, ids)
+        if missing:
+            raise ValueError(f"Invalid {label} {missing[:20]}")
+
+
+def create_pos(db: Session, pos: Sequence[POSpec]) -> list[tuple[int, str]]:
+    """
+    Crée ces PO (draft) et leurs lignes, tout ou rien. Retourne [(id, po_number)] dans
+    l'ordre reçu. PONumberConflict / ValueError avant toute écriture. Ne commit pas.
+    """
+    if not pos:
+        return []
+    _validate(db, pos)
+
+    created = db.execute(
+        insert(PurchaseOrder).returning(PurchaseOrder.id, PurchaseOrder.po_number, sort_by_parameter_order=True),
+        [
+            {
+                "po_number": p["po_number"],
+                "supplier_id": p["supplier_id"],
+                "site_id": p["site_id"],
+                "status": POStatus.draft,
+                "expected_eta": p["expected_eta"],
+                "shipment_id": p["shipment_id"],
+            }
+            for p in pos
+        ],
+    ).all()
+
+    rows = [
+        {"po_id": po_id, "product_id": pid, "qty_ordered": qty, "unit_cost": cost}
+        for (po_id, _), p in zip(created, pos)
+        for pid, qty, cost in sorted(p["lines"])
+    ]
+    for i in range(0, len(rows), PO_LINE_INSERT_CHUNK):
+        db.execute(insert(PurchaseOrderLine.__table__).values(rows[i : i + PO_LINE_INSERT_CHUNK]))
+    return [(int(po_id), po_number) for po_id, po_number in created]
+
+
+def set_po_status(db: Session, po: PurchaseOrder, status: POStatus) -> bool:
+    """Applique le statut et le delta qty_on_order associé. False si déjà dans ce statut."""
+    if po.status == status:
+        return False
+    if po.status in FINAL_PO_STATUSES:
+        raise ValueError(f"PO {po.id} is {po.status.name}")
+
+    was_engaged = po.status in ENGAGED_PO_STATUSES
+    po.status = status
+    db.flush()
+
+    if was_engaged != (status in ENGAGED_PO_STATUSES):
+        # on_order_summary suit le statut (trigger) ; reste à réaligner la DOCK
+        sync_po_qty_on_order(db, [po.id])
+    return True
+
+
+def approve_po(db: Session, po: PurchaseOrder, *, approved_by: int = 1) -> bool:
+    if po.status != POStatus.draft:
+        if po.status in FINAL_PO_STATUSES:
+            raise ValueError(f"PO {po.id} is {po.status.name}")
+        return False
+    po.approved_at = datetime.utcnow()
+    po.approved_by = approved_by
+    return set_po_status(db, po, POStatus.approved)
+
+
+def approve_pos(db: Session, po_ids: Iterable[int], *, approved_by: int = 1) -> dict[int, bool]:
+    """
+    draft -> approved pour tous ces PO, tout ou rien. Retourne {po_id: changé ?}
+    (False : déjà approuvé / expédié / partiel). Ne commit pas.
+
+    PO verrouillés dans l'ordre des id ; LookupError si un PO n'existe pas, ValueError si
+    un PO est clos / annulé. Un seul UPDATE : les triggers de on_order_summary passent
+    une fois pour tout le lot, puis un seul sync_po_qty_on_order.
+    """
+    po_ids = sorted({int(x) for x in po_ids})
+    statuses = dict(
+        db.execute(
+            select(PurchaseOrder.id, PurchaseOrder.status)
+            .where(PurchaseOrder.id.in_(po_ids))
+            .order_by(PurchaseOrder.id)
+            .with_for_update()
+        ).all()
+    )
+    missing = [po_id for po_id in po_ids if po_id not in statuses]
+    if missing:
+        raise LookupError(f"PO not found: {missing}")
+    final = [po_id for po_id, status in statuses.items() if status in FINAL_PO_STATUSES]
+    if final:
+        raise ValueError(f"PO closed or cancelled: {final}")
+
+    drafts = [po_id for po_id, status in statuses.items() if status == POStatus.draft]
+    if drafts:
+        db.flush()
+        db.execute(
+            update(PurchaseOrder)
+            .where(PurchaseOrder.id.in_(drafts))
+            .values(status=POStatus.approved, approved_at=datetime.utcnow(), approved_by=approved_by)
+            .execution_options(synchronize_session="fetch")
+        )
+        sync_po_qty_on_order(db, drafts)
+    approved = set(drafts)
+    return {po_id: po_id in approved for po_id in po_ids}
+
+
+def cancel_po(db: Session, po: PurchaseOrder) -> bool:
+    if po.status == POStatus.closed:
+        raise ValueError(f"PO {po.id} is CLOSED")
+    return set_po_status(db, po, POStatus.cancelled)
+
+
+# ---------- reçu par ligne, statuts partial / closed ----------
+
+
+def po_line_open_qty():
+    return func.greatest(
+        PurchaseOrderLine.qty_ordered - (PurchaseOrderLine.qty_received - PurchaseOrderLine.qty_damaged), 0
+    )
+
+
+def advance_po_status(db: Session, po: PurchaseOrder) -> bool:
+    """PO engagé : plus rien d'ouvert -> closed, du reçu -> partial. True si le statut change."""
+    if po.status not in ENGAGED_PO_STATUSES:
+        return False
+    received_any, all_received = db.execute(
+        select(func.bool_or(PurchaseOrderLine.qty_received > 0), func.bool_and(po_line_open_qty() == 0))
+        .where(PurchaseOrderLine.po_id == po.id)
+    ).one()
+    if all_received:
+        return set_po_status(db, po, POStatus.closed)
+    if received_any and po.status != POStatus.partial:
+        return set_po_status(db, po, POStatus.partial)
+    return False
+
+
+def receive_po_lines(db: Session, po_id: int, qty_by_product: Mapping[int, int]) -> bool:
+    """
+    Ajoute une réception POSTED (quantités par produit) aux compteurs des lignes du PO, puis
+    advance_po_status. Produits hors PO ignorés. Ne commit pas.
+
+    Verrouille le PO (FOR UPDATE) : les réceptions d'un même PO se sérialisent ici. À appeler
+    avant de toucher aux StockLevel (ordre PO puis StockLevel, comme approve / cancel).
+    """
+    po = db.execute(
+        select(PurchaseOrder).where(PurchaseOrder.id == po_id).with_for_update()
+    ).scalar_one()
+    if qty_by_product:
+        pol = PurchaseOrderLine.__table__
+        v = values(column("product_id", BigInteger), column("qty", Integer), name="received").data(
+            sorted((int(pid), int(qty)) for pid, qty in qty_by_product.items())
+        )
+        db.execute(
+            update(pol)
+            .where(pol.c.po_id == po_id)
+            .where(pol.c.product_id == v.c.product_id)
+            .values(qty_received=pol.c.qty_received + v.c.qty)
+        )
+        # lignes déjà en session : périmées après l'UPDATE Core
+        for obj in list(db.identity_map.values()):
+            if isinstance(obj, PurchaseOrderLine) and obj.po_id == po_id:
+                db.expire(obj)
+    return advance_po_status(db, po)
+
+
+def rebuild_po_line_received(db: Session, po_ids: Iterable[int] | None = None) -> int:
+    """
+    Recalcule qty_received / qty_damaged depuis les réceptions POSTED (vérification /
+    réparation). Retourne le nombre de lignes corrigées. Ne touche pas aux statuts. Ne commit pas.
+    """
+    pol = PurchaseOrderLine.__table__
+
+    def posted(col):
+        return func.coalesce(
+            select(func.sum(col))
+            .join(GoodsReceipt, GoodsReceipt.id == GoodsReceiptLine.receipt_id)
+            .where(GoodsReceipt.po_id == pol.c.po_id)
+            .where(GoodsReceipt.status == ReceiptStatus.posted)
+            .where(GoodsReceiptLine.product_id == pol.c.product_id)
+            .scalar_subquery(),
+            0,
+        )
+
+    received, damaged = posted(GoodsReceiptLine.qty_received), posted(GoodsReceiptLine.qty_damaged)
+    stmt = (
+        update(pol)
+        .where(pol.c.qty_received.is_distinct_from(received) | pol.c.qty_damaged.is_distinct_from(damaged))
+        .values(qty_received=received, qty_damaged=damaged)
+        .returning(pol.c.po_id)
+    )
+    if po_ids is not None:
+        stmt = stmt.where(pol.c.po_id.in_(sorted({int(x) for x in po_ids})))
+    changed = db.execute(stmt).all()
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, PurchaseOrderLine):
+            db.expire(obj)
+    return len(changed)
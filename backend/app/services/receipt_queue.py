@@ -0,0 +1,179 @@
+"""
+File de comptabilisation des réceptions (scanners de quai).
+
+Le quai enregistre un brouillon (ReceiptStatus.draft + goods_receipt_lines) et rend la
+main aussitôt ; des workers comptabilisent ensuite les brouillons en arrière-plan
+(stock, mouvements, qty_on_order — services.receiving.post_receipt_lines).
+
+- la file = brouillons avec to_location_id (renseigné à la mise en file), éligibles
+  quand post_after <= now() (index partiel ix_goods_receipts_draft_queue)
+- ordre par PO : seul le plus ancien brouillon d'un PO est éligible ; tant qu'il n'est
+  pas comptabilisé (ou annulé), les suivants du même PO attendent
+- claim FOR UPDATE SKIP LOCKED : chaque worker prend un brouillon différent, le verrou
+  est tenu jusqu'au commit de la comptabilisation
+- échec : SAVEPOINT annulé, post_attempts += 1, nouvel essai après un backoff
+  exponentiel ; au-delà de MAX_POST_ATTEMPTS le brouillon sort de la file
+  (post_after NULL, post_error renseigné) et bloque son PO jusqu'à retry() ou annulation
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, aliased
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import GoodsReceipt, GoodsReceiptLine
+from backend.app.db.models.core_types import ReceiptStatus
+from backend.app.services.receiving import post_receipt_lines
+
+logger = logging.getLogger(__name__)
+
+MAX_POST_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+
+
+def queue_state(receipt: GoodsReceipt) -> str:
+    """posted / cancelled / queued / retrying / failed."""
+    if receipt.status != ReceiptStatus.draft:
+        return receipt.status.name
+    if receipt.post_after is None:
+        return "failed" if receipt.post_attempts else "draft"
+    return "retrying" if receipt.post_attempts else "queued"
+
+
+def claim_next(db: Session) -> GoodsReceipt | None:
+    """Plus ancien brouillon éligible d'un PO libre, verrouillé (SKIP LOCKED)."""
+    older = aliased(GoodsReceipt)
+    return db.execute(
+        select(GoodsReceipt)
+        .where(GoodsReceipt.status == ReceiptStatus.draft)
+        .where(GoodsReceipt.post_after <= func.now())
+        .where(
+            ~exists()
+            .where(older.po_id == GoodsReceipt.po_id)
+            .where(older.status == ReceiptStatus.draft)
+            .where(older.to_location_id.is_not(None))
+            .where(older.id < GoodsReceipt.id)
+        )
+        .order_by(GoodsReceipt.id)
+        .limit(1)
+        .with_for_update(skip_locked=True, of=GoodsReceipt)
+        .execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+def post_draft(db: Session, receipt: GoodsReceipt) -> None:
+    """Comptabilise un brouillon (lignes déjà écrites). Ne commit pas."""
+    lines = db.execute(
+        select(
+            GoodsReceiptLine.product_id,
+            GoodsReceiptLine.qty_received,
+            GoodsReceiptLine.lot_code,
+            GoodsReceiptLine.expiration_date,
+        ).where(GoodsReceiptLine.receipt_id == receipt.id)
+    ).all()
+    # statut posted avant le delta qty_on_order, qui ne compte que les réceptions posted
+    receipt.status = ReceiptStatus.posted
+    receipt.post_after = None
+    receipt.post_error = None
+    db.flush()
+    post_receipt_lines(
+        db,
+        receipt,
+        to_location_id=int(receipt.to_location_id),
+        lines=[(int(pid), int(qty)) for pid, qty, _, _ in lines],
+        lots={int(pid): (lot_code, expiration_date) for pid, _, lot_code, expiration_date in lines},
+        record_lines=False,
+    )
+
+
+def work_once(db: Session) -> int | None:
+    """Un brouillon : claim + comptabilisation (ou échec enregistré) + commit. Retourne son id."""
+    receipt = claim_next(db)
+    if receipt is None:
+        db.rollback()
+        return None
+
+    receipt_id = int(receipt.id)
+    try:
+        with db.begin_nested():
+            post_draft(db, receipt)
+    except Exception as e:
+        attempts = receipt.post_attempts + 1
+        delay = min(BACKOFF_BASE_SECONDS ** attempts, BACKOFF_MAX_SECONDS)
+        db.execute(
+            update(GoodsReceipt)
+            .where(GoodsReceipt.id == receipt_id)
+            .values(
+                post_attempts=attempts,
+                post_error=str(e)[:2000],
+                post_after=func.now() + timedelta(seconds=delay) if attempts < MAX_POST_ATTEMPTS else None,
+            )
+        )
+    db.commit()
+    return receipt_id
+
+
+def retry(db: Session, receipt_id: int) -> bool:
+    """Remet un brouillon sorti de la file (échecs répétés) en tête de file. Ne commit pas."""
+    res = db.execute(
+        update(GoodsReceipt)
+        .where(GoodsReceipt.id == receipt_id)
+        .where(GoodsReceipt.status == ReceiptStatus.draft)
+        .values(post_attempts=0, post_after=func.now())
+        .returning(GoodsReceipt.id)
+    ).first()
+    return res is not None
+
+
+def drain(*, max_receipts: int | None = None) -> int:
+    """Comptabilise les brouillons éligibles jusqu'à épuisement (un worker)."""
+    done = 0
+    db = SessionLocal()
+    try:
+        while max_receipts is None or done < max_receipts:
+            if work_once(db) is None:
+                break
+            done += 1
+        return done
+    finally:
+        db.close()
+
+
+def run_workers(*, workers: int = 4, poll_seconds: float = 1.0, stop: threading.Event | None = None) -> None:
+    """
+    Pool de workers (threads, une session chacun) ; attend poll_seconds quand la file est vide.
+    Base indisponible (OperationalError) : journalisé, nouvel essai au tour suivant.
+    Toute autre erreur : journalisée, arrêt du pool et relevée à l'appelant.
+    """
+    stop = stop or threading.Event()
+
+    def loop() -> None:
+        while not stop.is_set():
+            try:
+                if drain():
+                    continue
+            except OperationalError:
+                logger.warning("receipt queue: database unavailable, retrying in %ss", poll_seconds, exc_info=True)
+            except Exception:
+                logger.exception("receipt queue: worker failed, stopping the pool")
+                stop.set()
+                raise
+            stop.wait(poll_seconds)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(loop) for _ in range(workers)]
+        try:
+            while not stop.is_set():
+                time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            stop.set()
+    for fut in futures:
+        fut.result()
@@ -0,0 +1,246 @@
+"""
+Comptabilisation en masse des lignes d'une réception (conteneur de plusieurs centaines de SKU).
+
+Nombre d'instructions constant, quel que soit le nombre de lignes :
+0) compteurs qty_received des lignes du PO + statut partial / closed
+   (services.purchase_orders.receive_po_lines) : PO verrouillé avant les StockLevel
+1) un INSERT ... ON CONFLICT DO UPDATE des StockLevel cibles (clés triées = ordre
+   canonique de lock_stock_levels) : crée les lignes manquantes et verrouille +
+   incrémente qty_on_hand des existantes dans la même instruction
+2) un INSERT des goods_receipt_lines (executemany ; déjà fait pour un brouillon)
+3) un INSERT des stock_movements RECEIPT (executemany)
+4) le delta qty_on_order de la réception (services.inventory.apply_receipt_on_order)
+5) un upsert des stock_lots reçus (lot_code / expiration_date de la ligne, services.lots)
+
+post_receipt() : réception complète (en-tête idempotent + lignes), utilisée par lot
+pour les manifestes de conteneur (services.manifests). Un PO qui a des brouillons en
+file (services.receipt_queue) reçoit un brouillon en file lui aussi : ordre par PO.
+
+Couples chauds (shard_count > 0) : qty_on_hand += q préserve l'invariant escrow
+(on_hand = réel + Σ issued), pas besoin de replier les shards.
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import Mapping, Sequence
+
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import (
+    GoodsReceipt,
+    GoodsReceiptLine,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    StockLevel,
+    StockMovement,
+)
+from backend.app.db.models.core_types import MovementType, ReceiptStatus
+from backend.app.services import lots as stock_lots
+from backend.app.services.inventory import apply_receipt_on_order
+from backend.app.services.purchase_orders import receive_po_lines
+
+
+def movement_key(
+    receipt_key: str,
+    product_id: int,
+    to_location_id: int,
+    received_at: datetime,
+    qty: int,
+) -> str:
+    raw = f"GRMOVE:{receipt_key}:{product_id}:{to_location_id}:{received_at.isoformat()}:{qty}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _qty_by_product(lines: Sequence[tuple[int, int]]) -> dict[int, int]:
+    qty_by_product: dict[int, int] = {}
+    for product_id, qty in lines:
+        if product_id in qty_by_product:
+            raise ValueError(f"product_id {product_id} appears twice in the receipt")
+        qty_by_product[int(product_id)] = int(qty)
+    return qty_by_product
+
+
+def record_receipt_lines(
+    db: Session,
+    receipt: GoodsReceipt,
+    lines: Sequence[tuple[int, int]],
+    lots: Mapping[int, stock_lots.LotKey] | None = None,
+) -> None:
+    """INSERT des goods_receipt_lines (executemany), sans effet sur le stock."""
+    lots = lots or {}
+    qty_by_product = _qty_by_product(lines)
+    if not qty_by_product:
+        return
+    db.execute(
+        insert(GoodsReceiptLine.__table__),
+        [
+            {
+                "receipt_id": receipt.id,
+                "product_id": pid,
+                "qty_received": qty_by_product[pid],
+                "qty_damaged": 0,
+                "lot_code": lots.get(pid, (None, None))[0],
+                "expiration_date": lots.get(pid, (None, None))[1],
+            }
+            for pid in sorted(qty_by_product)
+        ],
+    )
+
+
+def post_receipt_lines(
+    db: Session,
+    receipt: GoodsReceipt,
+    *,
+    to_location_id: int,
+    lines: Sequence[tuple[int, int]],
+    lots: Mapping[int, stock_lots.LotKey] | None = None,
+    record_lines: bool = True,
+) -> None:
+    """
+    Comptabilise les lignes (product_id, qty_received) d'une réception déjà flushée
+    (receipt.id attribué) vers to_location_id. Ne commit pas.
+    lots : (lot_code, expiration_date) par product_id ; absent = stock non suivi par lot.
+    record_lines=False : goods_receipt_lines déjà écrites (brouillon, services.receipt_queue).
+    """
+    lots = lots or {}
+    qty_by_product = _qty_by_product(lines)
+    if not qty_by_product:
+        return
+
+    product_ids = sorted(qty_by_product)
+    receipt_key = receipt.idempotency_key or str(receipt.id)
+
+    db.flush()
+    receive_po_lines(db, receipt.po_id, qty_by_product)
+
+    sl = StockLevel.__table__
+    upsert = pg_insert(sl)
+    db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=[sl.c.product_id, sl.c.location_id],
+            set_={"qty_on_hand": sl.c.qty_on_hand + upsert.excluded.qty_on_hand, "updated_at": func.now()},
+        ),
+        [
+            {
+                "product_id": pid,
+                "location_id": to_location_id,
+                "qty_on_hand": qty_by_product[pid],
+                "qty_reserved": 0,
+                "qty_on_order": 0,
+            }
+            for pid in product_ids
+        ],
+    )
+    # StockLevel déjà en session : périmés après l'UPSERT Core
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, StockLevel) and obj.location_id == to_location_id and obj.product_id in qty_by_product:
+            db.expire(obj)
+
+    if record_lines:
+        record_receipt_lines(db, receipt, lines, lots)
+    db.execute(
+        insert(StockMovement.__table__).values(created_at=func.now()),
+        [
+            {
+                "product_id": pid,
+                "from_location_id": None,
+                "to_location_id": to_location_id,
+                "movement_type": MovementType.receipt,
+                "quantity": qty_by_product[pid],
+                "reason": "GOODS_RECEIPT",
+                "happened_at": receipt.received_at,
+                "created_by": receipt.received_by or 1,
+                "idempotency_key": movement_key(
+                    receipt_key, pid, to_location_id, receipt.received_at, qty_by_product[pid]
+                ),
+            }
+            for pid in product_ids
+        ],
+    )
+
+    apply_receipt_on_order(db, receipt)
+    stock_lots.receive_many(
+        db, to_location_id, {(pid, lots.get(pid, (None, None))): qty_by_product[pid] for pid in product_ids}
+    )
+
+
+def has_pending_drafts(db: Session, po_id: int) -> bool:
+    """Brouillons en file (services.receipt_queue) sur ce PO ?"""
+    return bool(
+        db.scalar(
+            select(
+                exists()
+                .where(GoodsReceipt.po_id == po_id)
+                .where(GoodsReceipt.status == ReceiptStatus.draft)
+                .where(GoodsReceipt.to_location_id.is_not(None))
+            )
+        )
+    )
+
+
+def shipment_po_products(db: Session, po_id: int, *, shipment_id: int, site_id: int) -> frozenset[int]:
+    """Produits commandés d'un PO du shipment / site. ValueError sinon."""
+    po = db.get(PurchaseOrder, po_id)
+    if po is None or po.shipment_id != shipment_id:
+        raise ValueError(f"PO {po_id} is not on shipment {shipment_id}")
+    if po.site_id != site_id:
+        raise ValueError(f"PO {po_id} is not in the receiving site")
+    return frozenset(
+        int(pid) for pid in db.execute(select(PurchaseOrderLine.product_id).where(PurchaseOrderLine.po_id == po_id)).scalars()
+    )
+
+
+def post_receipt(
+    db: Session,
+    *,
+    po_id: int,
+    site_id: int,
+    to_location_id: int,
+    received_at: datetime,
+    idempotency_key: str,
+    lines: Sequence[tuple[int, int]],
+    container_id: int | None = None,
+) -> tuple[int, bool, bool]:
+    """
+    Réception POSTED + lignes, ou brouillon en file si le PO a déjà des brouillons en file
+    (comme POST /goods-receipts). Retourne (receipt_id, created, queued) ; une clé déjà
+    enregistrée rend la réception existante sans rien réécrire. Ne commit pas.
+    """
+    existing = db.execute(
+        select(GoodsReceipt.id, GoodsReceipt.status).where(GoodsReceipt.idempotency_key == idempotency_key)
+    ).first()
+    if existing is not None:
+        return int(existing.id), False, existing.status == ReceiptStatus.draft
+
+    queue = has_pending_drafts(db, po_id)
+    gr = GoodsReceipt(
+        po_id=po_id,
+        site_id=site_id,
+        status=ReceiptStatus.draft if queue else ReceiptStatus.posted,
+        received_at=received_at,
+        received_by=1,
+        container_id=container_id,
+        idempotency_key=idempotency_key,
+        to_location_id=to_location_id,
+        post_after=func.now() if queue else None,
+    )
+    try:
+        with db.begin_nested():
+            db.add(gr)
+            db.flush()
+    except IntegrityError:
+        # rejeu concurrent de la même clé
+        existing = db.execute(
+            select(GoodsReceipt.id, GoodsReceipt.status).where(GoodsReceipt.idempotency_key == idempotency_key)
+        ).one()
+        return int(existing.id), False, existing.status == ReceiptStatus.draft
+
+    if queue:
+        record_receipt_lines(db, gr, lines)
+        return int(gr.id), True, True
+    post_receipt_lines(db, gr, to_location_id=to_location_id, lines=lines)
+    return int(gr.id), True, False
@@ -0,0 +1,235 @@
+"""
+Réapprovisionnement automatique : tous les (site, produit) en une passe vectorisée
+(pandas / NumPy), puis brouillons de PO groupés par (site, fournisseur).
+
+Chargement (4 requêtes set-based, quel que soit le nombre de SKU) :
+- positions  : Σ on_hand / reserved / on_order des StockLevel du site ; couples chauds
+               (services.hot_stock) : valeurs effectives, l'escrow des shards n'est pas du réservé
+- brouillons : Σ qty_ordered des PO draft (déjà proposés, pas encore engagés)
+- demande    : sorties ISSUE par jour sur history_days (locations du site)
+- source     : fournisseur + coût de la dernière ligne de PO non annulée du (site, produit),
+               lead_time_days / reliability_score du fournisseur
+  (le schéma n'a pas de catalogue produit -> fournisseur : un produit jamais commandé
+  sur le site n'est pas proposé)
+
+Calcul (compute_reorders, sans base) :
+    demande/jour      d, écart-type s   (jours sans sortie comptés à 0)
+    délai effectif    L = lead_time_days * (2 - reliability_score / 100)
+    stock de sécurité SS = z * s * sqrt(L)
+    point de commande ROP = d * L + SS
+    niveau cible      S = d * (L + review_days) + SS
+    position          P = on_hand - reserved + on_order + brouillons
+    P < ROP  ->  commander ceil(S - P)
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import distinct_on
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import (
+    Location,
+    Product,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    Site,
+    StockLevel,
+    StockMovement,
+    Supplier,
+)
+from backend.app.db.models.core_types import MovementType, POStatus
+from backend.app.services.hot_stock import shard_totals
+from backend.app.services.purchase_orders import POSpec, create_pos
+
+HISTORY_DAYS = 56
+REVIEW_DAYS = 7  # un bateau par semaine
+SERVICE_Z = 1.65  # ~95 % de taux de service
+
+KEY = ["site_id", "product_id"]
+PLAN_COLUMNS = [
+    "site_id",
+    "product_id",
+    "supplier_id",
+    "unit_cost",
+    "lead_time_days",
+    "position",
+    "demand_per_day",
+    "reorder_point",
+    "order_up_to",
+    "qty",
+]
+
+
+def _frame(db: Session, stmt, columns: list[str]) -> pd.DataFrame:
+    return pd.DataFrame(db.execute(stmt).all(), columns=columns)
+
+
+def load_inputs(db: Session, *, site_ids: list[int] | None = None, history_days: int = HISTORY_DAYS, as_of: datetime | None = None) -> pd.DataFrame:
+    """Une ligne par (site, produit) actif : positions, brouillons, demande, source."""
+    as_of = as_of or datetime.now(timezone.utc)
+    sites = select(Site.id).where(Site.active.is_(True))
+    if site_ids is not None:
+        sites = sites.where(Site.id.in_(site_ids))
+    active = select(Product.id).where(Product.active.is_(True))
+
+    # couples chauds : StockLevel compte l'escrow des shards, on somme le réel
+    t = shard_totals().subquery()
+    positions = _frame(
+        db,
+        select(
+            Location.site_id,
+            StockLevel.product_id,
+            func.sum(StockLevel.qty_on_hand - func.coalesce(t.c.issued, 0)),
+            func.sum(StockLevel.qty_reserved - func.coalesce(t.c.escrowed, 0) + func.coalesce(t.c.reserved, 0)),
+            func.sum(StockLevel.qty_on_order),
+        )
+        .join(Location, Location.id == StockLevel.location_id)
+        .outerjoin(
+            t,
+            (t.c.product_id == StockLevel.product_id) & (t.c.location_id == StockLevel.location_id),
+        )
+        .where(Location.site_id.in_(sites), StockLevel.product_id.in_(active))
+        .group_by(Location.site_id, StockLevel.product_id),
+        KEY + ["on_hand", "reserved", "on_order"],
+    )
+    drafts = _frame(
+        db,
+        select(PurchaseOrder.site_id, PurchaseOrderLine.product_id, func.sum(PurchaseOrderLine.qty_ordered))
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.po_id)
+        .where(PurchaseOrder.status == POStatus.draft, PurchaseOrder.site_id.in_(sites))
+        .group_by(PurchaseOrder.site_id, PurchaseOrderLine.product_id),
+        KEY + ["drafted"],
+    )
+    day = cast(StockMovement.happened_at, Date)
+    daily = _frame(
+        db,
+        select(Location.site_id, StockMovement.product_id, day, func.sum(StockMovement.quantity))
+        .join(Location, Location.id == StockMovement.from_location_id)
+        .where(
+            StockMovement.movement_type == MovementType.issue,
+            StockMovement.happened_at >= as_of - timedelta(days=history_days),
+            StockMovement.happened_at < as_of,
+            Location.site_id.in_(sites),
+            StockMovement.product_id.in_(active),
+        )
+        .group_by(Location.site_id, StockMovement.product_id, day),
+        KEY + ["day", "qty"],
+    )
+    last_line = (
+        select(
+            PurchaseOrder.site_id,
+            PurchaseOrderLine.product_id,
+            PurchaseOrder.supplier_id,
+            PurchaseOrderLine.unit_cost,
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.po_id)
+        .where(PurchaseOrder.status != POStatus.cancelled, PurchaseOrder.site_id.in_(sites))
+        .ext(distinct_on(PurchaseOrder.site_id, PurchaseOrderLine.product_id))
+        .order_by(PurchaseOrder.site_id, PurchaseOrderLine.product_id, PurchaseOrder.id.desc())
+        .subquery()
+    )
+    sources = _frame(
+        db,
+        select(
+            last_line.c.site_id,
+            last_line.c.product_id,
+            last_line.c.supplier_id,
+            last_line.c.unit_cost,
+            Supplier.lead_time_days,
+            Supplier.reliability_score,
+        ).join(Supplier, Supplier.id == last_line.c.supplier_id),
+        KEY + ["supplier_id", "unit_cost", "lead_time_days", "reliability_score"],
+    )
+    # entier nullable : les (site, produit) sans source restent NA sans passer par float64
+    sources["supplier_id"] = sources["supplier_id"].astype("Int64")
+
+    # demande : somme et somme des carrés des jours avec sorties (les autres valent 0)
+    daily["qty"] = daily["qty"].astype("float64")
+    daily["qty_sq"] = daily["qty"] ** 2
+    demand = daily.groupby(KEY, as_index=False)[["qty", "qty_sq"]].sum()
+
+    frame = positions.merge(demand, on=KEY, how="outer").merge(drafts, on=KEY, how="left")
+    frame = frame.merge(sources, on=KEY, how="left")
+    numeric = ["on_hand", "reserved", "on_order", "drafted", "qty", "qty_sq"]
+    frame[numeric] = frame[numeric].fillna(0).astype("float64")
+    frame["history_days"] = history_days
+    return frame
+
+
+def compute_reorders(
+    frame: pd.DataFrame,
+    *,
+    review_days: int = REVIEW_DAYS,
+    service_z: float = SERVICE_Z,
+) -> pd.DataFrame:
+    """
+    Besoins de commande, entièrement vectorisé (aucune boucle par SKU).
+    frame : colonnes de load_inputs. Retourne PLAN_COLUMNS pour les lignes à commander
+    (qty > 0, fournisseur connu), triées par (site, fournisseur, produit).
+    """
+    n = frame["history_days"].to_numpy(dtype="float64")
+    mean = frame["qty"].to_numpy(dtype="float64") / n
+    var = np.maximum(frame["qty_sq"].to_numpy(dtype="float64") / n - mean**2, 0.0)
+    reliability = frame["reliability_score"].to_numpy(dtype="float64") / 100.0
+    lead = frame["lead_time_days"].to_numpy(dtype="float64") * (2.0 - reliability)
+
+    safety = service_z * np.sqrt(var) * np.sqrt(lead)
+    reorder_point = mean * lead + safety
+    order_up_to = mean * (lead + review_days) + safety
+    position = (
+        frame["on_hand"].to_numpy(dtype="float64")
+        - frame["reserved"].to_numpy(dtype="float64")
+        + frame["on_order"].to_numpy(dtype="float64")
+        + frame["drafted"].to_numpy(dtype="float64")
+    )
+    qty = np.where(position < reorder_point, np.ceil(order_up_to - position), 0.0)
+
+    # sans source (NaN) : comparaisons fausses -> qty = 0 ; filtré explicitement quand même
+    need = (qty > 0) & frame["supplier_id"].notna().to_numpy()
+    plan = frame.loc[need, ["site_id", "product_id", "supplier_id", "unit_cost", "lead_time_days"]].copy()
+    plan["position"] = position[need]
+    plan["demand_per_day"] = mean[need]
+    plan["reorder_point"] = reorder_point[need]
+    plan["order_up_to"] = order_up_to[need]
+    plan["qty"] = qty[need].astype("int64")
+    plan[["site_id", "product_id", "supplier_id", "lead_time_days"]] = plan[
+        ["site_id", "product_id", "supplier_id", "lead_time_days"]
+    ].astype("int64")
+    return plan[PLAN_COLUMNS].sort_values(["site_id", "supplier_id", "product_id"], ignore_index=True)
+
+
+def replenishment_po_number(as_of: date, site_id: int, supplier_id: int) -> str:
+    return f"REPL-{as_of:%Y%m%d}-S{site_id}-F{supplier_id}"
+
+
+def draft_replenishment_pos(db: Session, plan: pd.DataFrame, *, as_of: date | None = None) -> dict:
+    """
+    Un PO draft par (site, fournisseur) du plan, via create_pos. Un (site, fournisseur) déjà
+    proposé ce jour (même po_number) est ignoré. Ne commit pas.
+    """
+    as_of = as_of or datetime.now(timezone.utc).date()
+    specs: list[POSpec] = []
+    for (site_id, supplier_id), group in plan.groupby(["site_id", "supplier_id"], sort=True):
+        specs.append(
+            {
+                "po_number": replenishment_po_number(as_of, int(site_id), int(supplier_id)),
+                "supplier_id": int(supplier_id),
+                "site_id": int(site_id),
+                "expected_eta": as_of + timedelta(days=int(group["lead_time_days"].iloc[0])),
+                "shipment_id": None,
+                "lines": [
+                    (int(pid), int(q), Decimal(str(cost)))
+                    for pid, q, cost in zip(group["product_id"], group["qty"], group["unit_cost"])
+                ],
+            }
+        )
+    taken = set(
+        db.scalars(select(PurchaseOrder.po_number).where(PurchaseOrder.po_number.in_([s["po_number"] for s in specs])))
+    )
+    created = create_pos(db, [s for s in specs if s["po_number"] not in taken])
+    return {"created": created, "skipped": sorted(taken)}
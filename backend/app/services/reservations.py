@@ -0,0 +1,209 @@
+"""
+Réservations à durée de vie (TTL) + sweeper d'expiration.
+
+- reserve(..., ttl_seconds)   : RESERVE du fast path + ligne stock_reservations
+- unreserve / issue (..., reservation_id) : décrémente la réservation AVANT le mouvement
+  (UPDATE gardé sur la ligne de réservation, status = active)
+- expire_batch() : libère un lot de réservations échues, set-based :
+    1) claim des réservations échues  FOR UPDATE SKIP LOCKED (ne bloque jamais un
+       picking en cours sur la même réservation ; l'inverse attend au plus un lot)
+    2) verrou des StockLevel concernés dans l'ordre canonique (lock_stock_levels)
+    3) un UPDATE stock_levels (executemany), un INSERT des UNRESERVE, un UPDATE des réservations
+    4) libération des lots réservés (services.lots), une instruction par UNRESERVE
+  -> verrous de ligne tenus le temps de ces quelques instructions ; commit par lot (sweep()).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, cast, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import StockLevel, StockMovement, StockReservation
+from backend.app.db.models.core_types import MovementType, ReservationStatus
+from backend.app.services import lots, movements
+from backend.app.services.stock_levels import lock_stock_levels
+
+SWEEP_BATCH_SIZE = 500
+
+
+def reserve(db: Session, *, ttl_seconds: int, created_by: int = 1, **kwargs) -> int:
+    """RESERVE (fast path) + réservation expirant dans ttl_seconds. Retourne l'id du mouvement."""
+    mv_id = movements.reserve(db, created_by=created_by, **kwargs)
+    db.execute(
+        insert(StockReservation).values(
+            product_id=kwargs["product_id"],
+            location_id=kwargs["location_id"],
+            quantity=kwargs["quantity"],
+            status=ReservationStatus.active,
+            expires_at=func.now() + timedelta(seconds=ttl_seconds),
+            reserve_movement_id=mv_id,
+            created_at=func.now(),
+        )
+    )
+    return mv_id
+
+
+def _consume(db: Session, reservation_id: int, *, product_id: int, location_id: int, quantity: int) -> None:
+    remaining = StockReservation.quantity - quantity
+    status_type = StockReservation.status.type
+    row = db.execute(
+        update(StockReservation)
+        .where(StockReservation.id == reservation_id)
+        .where(StockReservation.product_id == product_id)
+        .where(StockReservation.location_id == location_id)
+        .where(StockReservation.status == ReservationStatus.active)
+        .where(StockReservation.quantity >= quantity)
+        .values(
+            quantity=remaining,
+            status=cast(
+                case(
+                    (remaining == 0, literal(ReservationStatus.closed, status_type)),
+                    else_=literal(ReservationStatus.active, status_type),
+                ),
+                status_type,
+            ),
+            closed_at=case((remaining == 0, func.now()), else_=None),
+        )
+        .returning(StockReservation.id)
+    ).first()
+    if row is None:
+        raise ValueError(f"Reservation {reservation_id} is not active or holds less than {quantity}")
+
+
+def unreserve(db: Session, *, reservation_id: int, **kwargs) -> int:
+    _consume(
+        db,
+        reservation_id,
+        product_id=kwargs["product_id"],
+        location_id=kwargs["location_id"],
+        quantity=kwargs["quantity"],
+    )
+    return movements.unreserve(db, **kwargs)
+
+
+def issue(db: Session, *, reservation_id: int, **kwargs) -> int:
+    _consume(
+        db,
+        reservation_id,
+        product_id=kwargs["product_id"],
+        location_id=kwargs["location_id"],
+        quantity=kwargs["quantity"],
+    )
+    return movements.issue(db, **kwargs)
+
+
+def reservation_for_movement(db: Session, movement_id: int) -> int | None:
+    return db.scalar(select(StockReservation.id).where(StockReservation.reserve_movement_id == movement_id))
+
+
+# ---------- Sweeper ----------
+def expire_batch(
+    db: Session,
+    *,
+    batch_size: int = SWEEP_BATCH_SIZE,
+    now: datetime | None = None,
+    created_by: int = 1,
+) -> dict:
+    """Libère au plus batch_size réservations échues. Ne commit pas."""
+    deadline = now if now is not None else func.now()
+    claimed = db.execute(
+        select(
+            StockReservation.id,
+            StockReservation.product_id,
+            StockReservation.location_id,
+            StockReservation.quantity,
+            StockReservation.expires_at,
+        )
+        .where(StockReservation.status == ReservationStatus.active)
+        .where(StockReservation.expires_at <= deadline)
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not claimed:
+        return {"expired": 0, "released": 0}
+
+    by_key: dict[tuple[int, int], list] = defaultdict(list)
+    for r in claimed:
+        by_key[(int(r.product_id), int(r.location_id))].append(r)
+
+    levels = lock_stock_levels(db, by_key)
+
+    level_updates = []
+    movement_rows = []
+    for key, rows in sorted(by_key.items()):
+        # garde : jamais plus que le réservé courant (unreserve manuel sans reservation_id)
+        left = levels[key].qty_reserved
+        released = 0
+        for r in rows:
+            qty = min(int(r.quantity), left - released)
+            if qty <= 0:
+                continue
+            released += qty
+            movement_rows.append(
+                {
+                    "product_id": key[0],
+                    "from_location_id": key[1],
+                    "to_location_id": None,
+                    "movement_type": MovementType.unreserve,
+                    "quantity": qty,
+                    "reason": "reservation expired",
+                    "happened_at": r.expires_at,
+                    "created_by": created_by,
+                    "idempotency_key": f"expire:{r.id}",
+                }
+            )
+        if released:
+            level_updates.append({"pid": key[0], "lid": key[1], "q": released})
+
+    if level_updates:
+        sl = StockLevel.__table__
+        db.execute(
+            update(sl)
+            .where(sl.c.product_id == bindparam("pid"))
+            .where(sl.c.location_id == bindparam("lid"))
+            .values(qty_reserved=sl.c.qty_reserved - bindparam("q"), updated_at=func.now()),
+            level_updates,
+        )
+        db.expire_all()  # StockLevel verrouillés plus haut : périmés après l'UPDATE Core
+    if movement_rows:
+        inserted = db.execute(
+            insert(StockMovement.__table__)
+            .values(created_at=func.now())
+            .returning(
+                StockMovement.__table__.c.id,
+                StockMovement.__table__.c.product_id,
+                StockMovement.__table__.c.from_location_id,
+                StockMovement.__table__.c.quantity,
+            ),
+            movement_rows,
+        ).all()
+        lots.release_many(db, [(int(m), int(p), int(l), int(q)) for m, p, l, q in inserted])
+
+    db.execute(
+        update(StockReservation)
+        .where(StockReservation.id.in_([int(r.id) for r in claimed]))
+        .values(status=ReservationStatus.expired, quantity=0, closed_at=func.now())
+    )
+    return {"expired": len(claimed), "released": sum(u["q"] for u in level_updates)}
+
+
+def sweep(*, batch_size: int = SWEEP_BATCH_SIZE, max_batches: int | None = None) -> dict:
+    """Boucle de lots (une transaction courte par lot) jusqu'à épuisement des échues."""
+    total = {"batches": 0, "expired": 0, "released": 0}
+    db = SessionLocal()
+    try:
+        while max_batches is None or total["batches"] < max_batches:
+            res = expire_batch(db, batch_size=batch_size)
+            db.commit()
+            if not res["expired"]:
+                break
+            total["batches"] += 1
+            total["expired"] += res["expired"]
+            total["released"] += res["released"]
+        return total
+    finally:
+        db.close()
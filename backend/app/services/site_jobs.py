@@ -0,0 +1,135 @@
+"""
+Recalculs lourds site par site, en parallèle (un process par site).
+
+Tâches, dans cet ordre pour chaque site :
+- on_order  : rebuild_qty_on_order (qty_on_order des DOCK depuis on_order_summary)
+- reconcile : StockLevel vs ledger des locations du site (find_drift), repair optionnel
+- snapshot  : photo des soldes du site (take_snapshot)
+
+Chaque site tourne dans un process du pool (au plus `workers` en même temps), avec UNE
+session à la fois, donc une connexion : le nombre de connexions ouvertes est borné par
+`workers`. Une tâche en échec est annulée (rollback) et notée dans le rapport ; les
+tâches suivantes du site et les autres sites continuent.
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable
+
+from sqlalchemy import select
+
+from backend.app.db.session import SessionLocal, engine
+from backend.app.db.models.models_v1 import Product, Site
+from backend.app.services.inventory import rebuild_qty_on_order
+from backend.app.services.ledger import find_drift, rebuild_stock_levels, take_snapshot
+
+SITE_TASKS = ("on_order", "reconcile", "snapshot")
+RECONCILE_CHUNK_SIZE = 500
+
+
+def _init_worker() -> None:
+    # process forké : ne jamais réutiliser les connexions du pool parent
+    engine.dispose(close=False)
+
+
+def _on_order(db, site_id: int, **_) -> dict:
+    try:
+        changed = rebuild_qty_on_order(db, site_id)
+    except ValueError as e:
+        # site sans DOCK : rien à porter, ce n'est pas un échec
+        db.rollback()
+        return {"skipped": str(e)}
+    return {"changed": len(changed)}
+
+
+def _reconcile(db, site_id: int, *, repair: bool, dry_run: bool) -> dict:
+    product_ids = [int(p) for p in db.scalars(select(Product.id).order_by(Product.id))]
+    report = {"products": len(product_ids), "drift": 0, "repaired": 0, "invalid": 0}
+    for i in range(0, len(product_ids), RECONCILE_CHUNK_SIZE):
+        drift = find_drift(db, product_ids[i : i + RECONCILE_CHUNK_SIZE], site_id=site_id)
+        report["drift"] += len(drift)
+        if repair and drift:
+            res = rebuild_stock_levels(db, {d["product_id"] for d in drift}, site_id=site_id)
+            report["repaired"] += res["changed"]
+            report["invalid"] += len(res["invalid"])
+        # commit par lot : les verrous du repair ne sont pas tenus pendant tout le site
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    return report
+
+
+def _snapshot(db, site_id: int, *, dry_run: bool, **_) -> dict:
+    snap = take_snapshot(db, site_id=site_id)
+    return {"snapshot_id": None if dry_run else snap.id}
+
+
+_RUNNERS = {"on_order": _on_order, "reconcile": _reconcile, "snapshot": _snapshot}
+
+
+def run_site(site_id: int, tasks: Iterable[str] = SITE_TASKS, repair: bool = False, dry_run: bool = False) -> dict:
+    """Tâches d'UN site (session dédiée, commit par tâche ; dry_run : rollback)."""
+    report = {"site_id": site_id, "tasks": {}, "failed": []}
+    t_site = time.perf_counter()
+    db = SessionLocal()
+    try:
+        for name in tasks:
+            t0 = time.perf_counter()
+            try:
+                res = _RUNNERS[name](db, site_id, repair=repair, dry_run=dry_run)
+                if dry_run:
+                    db.rollback()
+                else:
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                res = {"error": str(e).splitlines()[0][:500]}
+                report["failed"].append(name)
+            res["ms"] = round((time.perf_counter() - t0) * 1000)
+            report["tasks"][name] = res
+    finally:
+        db.close()
+    report["ms"] = round((time.perf_counter() - t_site) * 1000)
+    return report
+
+
+def run_sites(
+    site_ids: Iterable[int] | None = None,
+    *,
+    tasks: Iterable[str] = SITE_TASKS,
+    workers: int = 4,
+    repair: bool = False,
+    dry_run: bool = False,
+    on_done=None,
+) -> list[dict]:
+    """
+    run_site sur chaque site (tous les sites si site_ids est None), au plus `workers`
+    process en parallèle. on_done(report) est appelé à chaque site terminé.
+    Rapports triés par site_id.
+    """
+    tasks = [t for t in SITE_TASKS if t in set(tasks)]
+    if site_ids is None:
+        db = SessionLocal()
+        try:
+            site_ids = [int(s) for s in db.scalars(select(Site.id).order_by(Site.id))]
+        finally:
+            db.close()
+    site_ids = sorted({int(s) for s in site_ids})
+    if not site_ids:
+        return []
+
+    reports = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(site_ids))), initializer=_init_worker) as pool:
+        futures = {pool.submit(run_site, site_id, tasks, repair, dry_run): site_id for site_id in site_ids}
+        for fut in as_completed(futures):
+            try:
+                report = fut.result()
+            except Exception as e:
+                # process mort (OOM, kill) : le site est noté en échec, les autres continuent
+                report = {"site_id": futures[fut], "tasks": {}, "failed": ["process"], "error": str(e)[:500], "ms": None}
+            if on_done is not None:
+                on_done(report)
+            reports.append(report)
+    return sorted(reports, key=lambda r: r["site_id"])
@@ -0,0 +1,122 @@
+"""
+Acquisition des StockLevel (couche unique de verrouillage).
+
+Tous les écrivains de stock_levels (mouvements, réceptions, rebuild on_order)
+passent par lock_stock_levels() pour partager UN seul ordre de verrouillage :
+tri croissant sur (product_id, location_id).
+
+=> un transfert A->B et un transfert B->A concurrents ne peuvent plus se bloquer
+   mutuellement : les deux verrouillent d'abord min(A, B).
+
+Couples chauds (shard_count > 0, cf. services.hot_stock) : un StockLevel verrouillé ici
+est toujours EXACT — ses shards sont repliés dedans avant de le rendre (drain).
+Ordre de verrouillage : StockLevel, puis ses shards.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.app.db.models.models_v1 import StockLevel, StockLevelShard
+
+StockKey = tuple[int, int]  # (product_id, location_id)
+
+
+def ensure_stock_levels(db: Session, keys: Iterable[StockKey]) -> None:
+    """
+    Crée les StockLevel manquants (INSERT ... ON CONFLICT DO NOTHING, clés triées).
+    Ne pose aucun verrou sur les lignes existantes.
+    """
+    ordered = sorted({(int(pid), int(lid)) for pid, lid in keys})
+    if not ordered:
+        return
+
+    db.execute(
+        pg_insert(StockLevel)
+        .values(
+            [
+                {
+                    "product_id": pid,
+                    "location_id": lid,
+                    "qty_on_hand": 0,
+                    "qty_reserved": 0,
+                    "qty_on_order": 0,
+                }
+                for pid, lid in ordered
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=[StockLevel.product_id, StockLevel.location_id])
+    )
+
+
+def lock_stock_levels(db: Session, keys: Iterable[StockKey]) -> dict[StockKey, StockLevel]:
+    """
+    Verrouille (FOR UPDATE) les StockLevel demandés, en les créant si besoin.
+
+    Deux instructions, quel que soit le nombre de clés :
+    1) INSERT ... ON CONFLICT DO NOTHING des clés (triées) : crée les lignes manquantes
+       sans poser de verrou sur les lignes existantes (pas de flush() par ligne)
+    2) un seul SELECT ... ORDER BY product_id, location_id FOR UPDATE
+
+    L'insert passe AVANT le verrou : on ne détient jamais un verrou de ligne
+    pendant qu'on attend une insertion concurrente -> ordre global respecté.
+    """
+    ordered = sorted({(int(pid), int(lid)) for pid, lid in keys})
+    if not ordered:
+        return {}
+
+    # populate_existing recharge les objets déjà en session : on pousse d'abord
+    # les modifications en attente pour ne pas les écraser (autoflush=False)
+    db.flush()
+
+    ensure_stock_levels(db, ordered)
+
+    rows = (
+        db.execute(
+            select(StockLevel)
+            .where(tuple_(StockLevel.product_id, StockLevel.location_id).in_(ordered))
+            .order_by(StockLevel.product_id, StockLevel.location_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        .scalars()
+        .all()
+    )
+    levels = {(int(sl.product_id), int(sl.location_id)): sl for sl in rows}
+
+    hot = {k: sl for k, sl in levels.items() if sl.shard_count}
+    if hot:
+        drain_shards(db, hot)
+    return levels
+
+
+def drain_shards(db: Session, levels: dict[StockKey, StockLevel]) -> None:
+    """
+    Replie les shards dans leurs StockLevel (déjà verrouillés par l'appelant).
+
+    Invariant d'un couple chaud : StockLevel.qty_reserved = réservé direct + Σ(quota + issued)
+    et StockLevel.qty_on_hand = réel + Σ issued. Après drain : shards à zéro, StockLevel exact.
+    """
+    shards = (
+        db.execute(
+            select(StockLevelShard)
+            .where(tuple_(StockLevelShard.product_id, StockLevelShard.location_id).in_(sorted(levels)))
+            .order_by(StockLevelShard.product_id, StockLevelShard.location_id, StockLevelShard.shard_no)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        .scalars()
+        .all()
+    )
+    for sh in shards:
+        if not (sh.qty_quota or sh.qty_issued):
+            continue
+        sl = levels[(int(sh.product_id), int(sh.location_id))]
+        sl.qty_on_hand -= sh.qty_issued
+        sl.qty_reserved += sh.qty_reserved - sh.qty_quota - sh.qty_issued
+        sh.qty_quota = sh.qty_reserved = sh.qty_issued = 0
+    db.flush()
+
@@ -0,0 +1,151 @@
+"""
+Benchmark de comptabilisation d'une réception : ORM ligne par ligne vs services.receiving.
+
+    python -m backend.benchmarks.goods_receipt_bulk [--sizes 10 100 1000] [--repeat 3]
+
+"per-line" reproduit l'ancien corps de l'endpoint (un GoodsReceiptLine + un StockMovement
+ORM par ligne) ; "bulk" appelle post_receipt_lines(). Temps = comptabilisation + commit,
+meilleur de --repeat essais. Crée un site / PO / produits de test, puis les supprime.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import (
+    GoodsReceipt,
+    GoodsReceiptLine,
+    Location,
+    Product,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    Site,
+    StockLevel,
+    StockMovement,
+    Supplier,
+)
+from backend.app.db.models.core_types import LocationType, MovementType, POStatus, ReceiptStatus
+from backend.app.services.inventory import rebuild_qty_on_order
+from backend.app.services.receiving import movement_key, post_receipt_lines
+from backend.app.services.stock_levels import lock_stock_levels
+
+
+def _arrange(seed: int, products: int) -> dict:
+    ids = {
+        "site_id": 9_910_000_000_000 + seed,
+        "supplier_id": 8_910_000_000_000 + seed,
+        "product_ids": [7_910_000_000_000 + seed * 10_000 + i for i in range(products)],
+    }
+    db = SessionLocal()
+    try:
+        db.add(Site(id=ids["site_id"], name=f"BENCH-SITE-{ids['site_id']}", timezone="Pacific/Tahiti", active=True))
+        db.add(Supplier(id=ids["supplier_id"], name=f"BENCH-SUP-{ids['supplier_id']}", country="PF", lead_time_days=1, reliability_score=80))
+        db.add_all(
+            [Product(id=pid, sku=f"BENCH-SKU-{pid}", name="BENCH", uom="unit", active=True) for pid in ids["product_ids"]]
+        )
+        db.flush()
+        dock = Location(site_id=ids["site_id"], name="TAH-DOCK", type=LocationType.dock)
+        po = PurchaseOrder(po_number=f"BENCH-PO-{seed}", supplier_id=ids["supplier_id"], site_id=ids["site_id"], status=POStatus.approved)
+        db.add_all([dock, po])
+        db.flush()
+        db.add_all(
+            [PurchaseOrderLine(po_id=po.id, product_id=pid, qty_ordered=1_000_000, unit_cost=1) for pid in ids["product_ids"]]
+        )
+        db.commit()
+        ids["dock_id"] = dock.id
+        ids["po_id"] = po.id
+        return ids
+    finally:
+        db.close()
+
+
+def _cleanup(ids: dict) -> None:
+    db = SessionLocal()
+    try:
+        pids = ids["product_ids"]
+        db.execute(delete(StockMovement).where(StockMovement.product_id.in_(pids)))
+        db.execute(delete(GoodsReceipt).where(GoodsReceipt.po_id == ids["po_id"]))
+        db.execute(delete(PurchaseOrder).where(PurchaseOrder.id == ids["po_id"]))
+        db.execute(delete(StockLevel).where(StockLevel.product_id.in_(pids)))
+        db.execute(delete(Location).where(Location.id == ids["dock_id"]))
+        db.execute(delete(Product).where(Product.id.in_(pids)))
+        db.execute(delete(Supplier).where(Supplier.id == ids["supplier_id"]))
+        db.execute(delete(Site).where(Site.id == ids["site_id"]))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _post_per_line(db, gr: GoodsReceipt, to_location_id: int, lines: list[tuple[int, int]]) -> None:
+    levels = lock_stock_levels(db, [(pid, to_location_id) for pid, _ in lines])
+    for pid, qty in lines:
+        db.add(GoodsReceiptLine(receipt_id=gr.id, product_id=pid, qty_received=qty, qty_damaged=0))
+        levels[(pid, to_location_id)].qty_on_hand += qty
+        db.add(
+            StockMovement(
+                product_id=pid,
+                from_location_id=None,
+                to_location_id=to_location_id,
+                movement_type=MovementType.receipt,
+                quantity=qty,
+                reason="GOODS_RECEIPT",
+                happened_at=gr.received_at,
+                created_by=1,
+                idempotency_key=movement_key(gr.idempotency_key, pid, to_location_id, gr.received_at, qty),
+            )
+        )
+    rebuild_qty_on_order(db, site_id=int(gr.site_id), product_ids=[pid for pid, _ in lines])
+
+
+def _run(label: str, ids: dict, size: int, run: int) -> float:
+    lines = [(pid, 1) for pid in ids["product_ids"][:size]]
+    db = SessionLocal()
+    try:
+        gr = GoodsReceipt(
+            po_id=ids["po_id"],
+            site_id=ids["site_id"],
+            status=ReceiptStatus.posted,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"bench-gr-{ids['po_id']}-{label}-{size}-{run}",
+        )
+        db.add(gr)
+        db.flush()
+
+        t0 = time.perf_counter()
+        if label == "bulk":
+            post_receipt_lines(db, gr, to_location_id=ids["dock_id"], lines=lines)
+        else:
+            _post_per_line(db, gr, ids["dock_id"], lines)
+        db.commit()
+        return time.perf_counter() - t0
+    finally:
+        db.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    seed = int(datetime.now(timezone.utc).timestamp())
+    ids = _arrange(seed, max(args.sizes))
+    try:
+        for size in args.sizes:
+            best = {}
+            for label in ("per-line", "bulk"):
+                best[label] = min(_run(label, ids, size, r) for r in range(args.repeat))
+                print(f"  lines={size:>5} {label:<9} {best[label] * 1000:>8.1f} ms -> {size / best[label]:>9,.0f} lines/s")
+            print(f"  lines={size:>5} speedup x{best['per-line'] / best['bulk']:.1f}")
+        print("BENCH OK")
+    finally:
+        _cleanup(ids)
+
+
+if __name__ == "__main__":
+    main()
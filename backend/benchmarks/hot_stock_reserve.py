@@ -0,0 +1,131 @@
+"""
+Benchmark RESERVE sur un couple (produit, location) chaud : ligne unique vs escrow/shards.
+
+    python -m backend.benchmarks.hot_stock_reserve [--threads 16] [--seconds 5] [--shards 8] [--hold-ms 2]
+
+--hold-ms simule le travail d'une requête entre le mouvement et le commit (verrou tenu).
+Crée un site / produit / location de test, puis les supprime.
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import Location, Product, Site, StockLevel, StockLevelShard, StockMovement
+from backend.app.db.models.core_types import LocationType
+from backend.app.services import hot_stock, movements
+
+
+def _arrange(seed: int) -> tuple[int, int, int]:
+    site_id = 9_900_000_000_000 + seed
+    product_id = 7_900_000_000_000 + seed
+    db = SessionLocal()
+    try:
+        db.add(Site(id=site_id, name=f"BENCH-SITE-{site_id}", timezone="Pacific/Tahiti", active=True))
+        db.add(Product(id=product_id, sku=f"BENCH-SKU-{product_id}", name="BENCH", uom="unit", active=True))
+        db.flush()
+        store = Location(site_id=site_id, name="BENCH-STORE", type=LocationType.store)
+        db.add(store)
+        db.flush()
+        db.add(StockLevel(product_id=product_id, location_id=store.id, qty_on_hand=10_000_000, qty_reserved=0, qty_on_order=0))
+        db.commit()
+        return site_id, product_id, store.id
+    finally:
+        db.close()
+
+
+def _cleanup(site_id: int, product_id: int, location_id: int) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(delete(StockMovement).where(StockMovement.product_id == product_id))
+        db.execute(delete(StockLevelShard).where(StockLevelShard.product_id == product_id))
+        db.execute(delete(StockLevel).where(StockLevel.product_id == product_id))
+        db.execute(delete(Location).where(Location.id == location_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(Site).where(Site.id == site_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _run(label: str, product_id: int, location_id: int, *, threads: int, seconds: float, hold_ms: float) -> float:
+    done = [0] * threads
+    errors = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(i: int) -> None:
+        db = SessionLocal()
+        try:
+            n = 0
+            while time.perf_counter() < stop:
+                n += 1
+                try:
+                    movements.reserve(
+                        db,
+                        product_id=product_id,
+                        location_id=location_id,
+                        quantity=1,
+                        happened_at=datetime.now(timezone.utc),
+                        reason="bench",
+                        idempotency_key=f"bench-{label}-{product_id}-{i}-{n}",
+                    )
+                    if hold_ms:
+                        time.sleep(hold_ms / 1000)
+                    db.commit()
+                    done[i] += 1
+                except Exception:
+                    db.rollback()
+                    errors[i] += 1
+        finally:
+            db.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    rate = sum(done) / elapsed
+    print(f"  {label:<10} reserves={sum(done):>7} errors={sum(errors):>4} -> {rate:,.0f} reserves/s")
+    return rate
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--hold-ms", type=float, default=2)
+    args = parser.parse_args(argv)
+
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    site_id, product_id, location_id = _arrange(seed)
+    try:
+        print(f"threads={args.threads} seconds={args.seconds} hold_ms={args.hold_ms}")
+        single = _run("single", product_id, location_id, threads=args.threads, seconds=args.seconds, hold_ms=args.hold_ms)
+
+        db = SessionLocal()
+        try:
+            hot_stock.enable_sharding(db, product_id, location_id, args.shards)
+            db.commit()
+        finally:
+            db.close()
+
+        sharded = _run(
+            f"shards={args.shards}", product_id, location_id,
+            threads=args.threads, seconds=args.seconds, hold_ms=args.hold_ms,
+        )
+        print(f"BENCH OK: speedup x{sharded / single:.1f}" if single else "BENCH OK")
+    finally:
+        _cleanup(site_id, product_id, location_id)
+
+
+if __name__ == "__main__":
+    main()
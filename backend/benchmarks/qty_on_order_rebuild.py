@@ -0,0 +1,146 @@
+"""
+Benchmark du recalcul qty_on_order d'un site : boucle par produit vs rebuild set-based.
+
+    python -m backend.benchmarks.qty_on_order_rebuild [--sizes 100 1000 5000] [--repeat 3]
+
+"per-product" reproduit l'ancien usage (agrégats + SELECT ... FOR UPDATE + flush, un
+produit à la fois) ; "set-based" appelle rebuild_qty_on_order(db, site_id) : un seul
+INSERT ... SELECT ... ON CONFLICT DO UPDATE pour tout le site. Avant chaque essai les
+qty_on_order sont faussés (tous réécrits). Temps = recalcul + commit, meilleur de
+--repeat essais. Crée un site / PO / produits de test, puis les supprime.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, update
+
+from backend.app.db.session import SessionLocal
+from backend.app.db.models.models_v1 import (
+    Location,
+    Product,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    Site,
+    StockLevel,
+    Supplier,
+)
+from backend.app.db.models.core_types import LocationType, POStatus
+from backend.app.services.inventory import aggregate_qty_on_order, rebuild_qty_on_order
+from backend.app.services.stock_levels import lock_stock_levels
+
+PO_LINES = 500
+
+
+def _arrange(seed: int, products: int) -> dict:
+    ids = {
+        "site_id": 9_920_000_000_000 + seed,
+        "supplier_id": 8_920_000_000_000 + seed,
+        "product_ids": [7_920_000_000_000 + seed * 100_000 + i for i in range(products)],
+        "po_ids": [],
+    }
+    db = SessionLocal()
+    try:
+        db.add(Site(id=ids["site_id"], name=f"BENCH-SITE-{ids['site_id']}", timezone="Pacific/Tahiti", active=True))
+        db.add(Supplier(id=ids["supplier_id"], name=f"BENCH-SUP-{ids['supplier_id']}", country="PF", lead_time_days=1, reliability_score=80))
+        db.add_all(
+            [Product(id=pid, sku=f"BENCH-SKU-{pid}", name="BENCH", uom="unit", active=True) for pid in ids["product_ids"]]
+        )
+        db.flush()
+        dock = Location(site_id=ids["site_id"], name="TAH-DOCK", type=LocationType.dock)
+        db.add(dock)
+        for n, start in enumerate(range(0, products, PO_LINES)):
+            po = PurchaseOrder(
+                po_number=f"BENCH-PO-{seed}-{n}",
+                supplier_id=ids["supplier_id"],
+                site_id=ids["site_id"],
+                status=POStatus.approved,
+            )
+            db.add(po)
+            db.flush()
+            ids["po_ids"].append(po.id)
+            db.add_all(
+                [
+                    PurchaseOrderLine(po_id=po.id, product_id=pid, qty_ordered=10, unit_cost=1)
+                    for pid in ids["product_ids"][start : start + PO_LINES]
+                ]
+            )
+        db.flush()
+        lock_stock_levels(db, [(pid, dock.id) for pid in ids["product_ids"]])
+        db.commit()
+        ids["dock_id"] = dock.id
+        return ids
+    finally:
+        db.close()
+
+
+def _cleanup(ids: dict) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(delete(PurchaseOrder).where(PurchaseOrder.id.in_(ids["po_ids"])))
+        db.execute(delete(StockLevel).where(StockLevel.location_id == ids["dock_id"]))
+        db.execute(delete(Location).where(Location.id == ids["dock_id"]))
+        db.execute(delete(Product).where(Product.id.in_(ids["product_ids"])))
+        db.execute(delete(Supplier).where(Supplier.id == ids["supplier_id"]))
+        db.execute(delete(Site).where(Site.id == ids["site_id"]))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _rebuild_per_product(db, site_id: int, dock_id: int, product_ids: list[int]) -> None:
+    for pid in product_ids:
+        expected = aggregate_qty_on_order(db, site_id, [pid])
+        levels = lock_stock_levels(db, [(pid, dock_id)])
+        levels[(pid, dock_id)].qty_on_order = expected[pid]
+        db.flush()
+
+
+def _run(label: str, ids: dict, size: int) -> float:
+    pids = ids["product_ids"][:size]
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(StockLevel)
+            .where(StockLevel.location_id == ids["dock_id"])
+            .where(StockLevel.product_id.in_(pids))
+            .values(qty_on_order=1)
+        )
+        db.commit()
+
+        t0 = time.perf_counter()
+        if label == "set-based":
+            rebuild_qty_on_order(db, ids["site_id"])
+        else:
+            _rebuild_per_product(db, ids["site_id"], ids["dock_id"], pids)
+        db.commit()
+        return time.perf_counter() - t0
+    finally:
+        db.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    seed = int(datetime.now(timezone.utc).timestamp())
+    for size in args.sizes:
+        # un site par taille : le set-based couvre toujours tout le site
+        ids = _arrange(seed + size, size)
+        try:
+            best = {}
+            for label in ("per-product", "set-based"):
+                best[label] = min(_run(label, ids, size) for _ in range(args.repeat))
+                print(f"  products={size:>6} {label:<11} {best[label] * 1000:>9.1f} ms -> {size / best[label]:>10,.0f} products/s")
+            print(f"  products={size:>6} speedup x{best['per-product'] / best['set-based']:.1f}")
+        finally:
+            _cleanup(ids)
+    print("BENCH OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark du calcul de réapprovisionnement : boucle par SKU vs compute_reorders vectorisé.
+
+    python -m backend.benchmarks.replenishment [--sizes 1000 20000 100000] [--repeat 3]
+
+Entrées synthétiques au format de load_inputs (aucune base) : demande, positions et
+fournisseurs tirés au hasard (graine fixe). "per-sku" applique les mêmes formules ligne
+à ligne en Python ; "vectorized" appelle compute_reorders sur tout le frame. Les deux
+doivent proposer les mêmes quantités. Temps = meilleur de --repeat essais.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.app.services.replenishment import HISTORY_DAYS, REVIEW_DAYS, SERVICE_Z, compute_reorders
+
+
+def _frame(size: int) -> pd.DataFrame:
+    rng = np.random.default_rng(size)
+    days_with_issue = rng.integers(0, HISTORY_DAYS + 1, size)
+    per_day = rng.integers(1, 20, size).astype("float64")
+    return pd.DataFrame(
+        {
+            "site_id": rng.integers(1, 5, size),
+            "product_id": np.arange(size) + 1,
+            "on_hand": rng.integers(0, 500, size).astype("float64"),
+            "reserved": rng.integers(0, 20, size).astype("float64"),
+            "on_order": rng.integers(0, 100, size).astype("float64"),
+            "drafted": 0.0,
+            "qty": days_with_issue * per_day,
+            "qty_sq": days_with_issue * per_day**2,
+            "supplier_id": pd.array(rng.integers(1, 200, size), dtype="Int64"),
+            "unit_cost": 1.0,
+            "lead_time_days": rng.integers(3, 60, size),
+            "reliability_score": rng.integers(50, 101, size),
+            "history_days": HISTORY_DAYS,
+        }
+    )
+
+
+def _per_sku(frame: pd.DataFrame) -> dict:
+    out = {}
+    for row in frame.itertuples(index=False):
+        mean = row.qty / row.history_days
+        std = math.sqrt(max(row.qty_sq / row.history_days - mean**2, 0.0))
+        lead = row.lead_time_days * (2 - row.reliability_score / 100)
+        safety = SERVICE_Z * std * math.sqrt(lead)
+        position = row.on_hand - row.reserved + row.on_order + row.drafted
+        if position < mean * lead + safety:
+            qty = math.ceil(mean * (lead + REVIEW_DAYS) + safety - position)
+            if qty > 0:
+                out[(row.site_id, row.product_id)] = qty
+    return out
+
+
+def _best(fn, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        frame = _frame(size)
+        t_loop, expected = _best(lambda: _per_sku(frame), args.repeat)
+        t_vec, plan = _best(lambda: compute_reorders(frame), args.repeat)
+        got = {(s, p): q for s, p, q in zip(plan["site_id"], plan["product_id"], plan["qty"])}
+        if got != expected:
+            raise SystemExit(f"mismatch at size={size}: {len(got)} vs {len(expected)} lines")
+        for label, t in (("per-sku", t_loop), ("vectorized", t_vec)):
+            print(f"  skus={size:>7} {label:<10} {t * 1000:>9.1f} ms -> {size / t:>12,.0f} skus/s")
+        print(f"  skus={size:>7} lines={len(plan)} speedup x{t_loop / t_vec:.1f}")
+    print("BENCH OK")
+
+
+if __name__ == "__main__":
+    main()
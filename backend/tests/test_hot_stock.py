@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel, StockLevelShard
+from backend.app.db.models.core_types import LocationType
+from backend.app.services import hot_stock, movements
+from backend.app.services.stock_levels import lock_stock_levels
+
+
+def test_sharded_reserve_issue_and_drain(db_session):
+    """
+    GIVEN
+    - on_hand=100 en STORE, couple passé en escrow (4 shards, 80 en quota)
+
+    THEN
+    - RESERVE / ISSUE passent par les shards : le StockLevel n'est pas modifié
+    - les soldes effectifs restent exacts, ck_stock_reserved_le_on_hand tient
+    - RESERVE > quota d'un shard : repli sur le StockLevel puis rebalance
+    - lock_stock_levels rend un StockLevel exact (shards repliés)
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_400_000_000_000 + seed
+    PRODUCT_ID = 7_400_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    db_session.add(store)
+    db_session.flush()
+    db_session.add(StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=100, qty_reserved=0, qty_on_order=0))
+    db_session.flush()
+
+    sl = hot_stock.enable_sharding(db_session, PRODUCT_ID, store.id, shards=4)
+    assert (sl.shard_count, sl.qty_on_hand, sl.qty_reserved) == (4, 100, 80)
+
+    def level():
+        return tuple(
+            db_session.execute(
+                select(StockLevel.qty_on_hand, StockLevel.qty_reserved)
+                .where(StockLevel.product_id == PRODUCT_ID)
+                .where(StockLevel.location_id == store.id)
+            ).one()
+        )
+
+    kw = dict(product_id=PRODUCT_ID, location_id=store.id, happened_at=now, reason=None)
+    movements.reserve(db_session, quantity=5, idempotency_key=f"test-hot-{seed}-1", **kw)
+    movements.issue(db_session, quantity=5, idempotency_key=f"test-hot-{seed}-2", **kw)
+    movements.reserve(db_session, quantity=3, idempotency_key=f"test-hot-{seed}-3", **kw)
+
+    assert level() == (100, 80)  # aucun verrou / écriture sur la ligne chaude
+    assert hot_stock.effective_levels(db_session, PRODUCT_ID, store.id) == (95, 3)
+
+    # 30 > quota d'un shard (20) mais <= disponible réel : repli StockLevel + rebalance
+    movements.reserve(db_session, quantity=30, idempotency_key=f"test-hot-{seed}-4", **kw)
+    assert hot_stock.effective_levels(db_session, PRODUCT_ID, store.id) == (95, 33)
+
+    with pytest.raises(ValueError, match="available=62"):
+        movements.reserve(db_session, quantity=63, idempotency_key=f"test-hot-{seed}-5", **kw)
+
+    levels = lock_stock_levels(db_session, [(PRODUCT_ID, store.id)])
+    sl = levels[(PRODUCT_ID, store.id)]
+    assert (sl.qty_on_hand, sl.qty_reserved) == (95, 33)
+
+    shards = db_session.execute(
+        select(StockLevelShard.qty_quota, StockLevelShard.qty_reserved, StockLevelShard.qty_issued)
+        .where(StockLevelShard.product_id == PRODUCT_ID)
+    ).all()
+    assert all(tuple(s) == (0, 0, 0) for s in shards)
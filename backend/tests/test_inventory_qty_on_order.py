@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import select
+import pytest
+from sqlalchemy import event, select
 
 from backend.app.db.models.models_v1 import (
     Site,
@@ -19,6 +20,9 @@ from backend.app.db.models.core_types import (
     ReceiptStatus,
 )
 from backend.services.procurement import rebuild_qty_on_order
+from backend.app.services.inventory import qty_on_order_drift
+from backend.app.services.purchase_orders import approve_po, approve_pos, cancel_po
+from backend.app.services.receiving import post_receipt_lines
 
 
 def test_rebuild_qty_on_order_before_po_closed(db_session):
@@ -153,3 +157,176 @@ def test_rebuild_qty_on_order_before_po_closed(db_session):
     ).scalar_one()
 
     assert sl.qty_on_order == 5
+
+
+def test_qty_on_order_deltas_match_rebuild(db_session):
+    """
+    GIVEN
+    - PO1 draft de 10, PO2 draft de 3 (même produit)
+
+    THEN (qty_on_order DOCK, maintenu par deltas, jamais en écart avec le recalcul)
+    - approve PO1 -> 10 ; réception 4 -> 6 ; réception 9 (sur-réception) -> 0
+    - approve PO2 -> 3 : la sur-réception de PO1 n'entame pas PO2
+    - cancel PO2 -> 0
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_600_000_000_000 + seed
+    SUPPLIER_ID = 8_600_000_000_000 + seed
+    PRODUCT_ID = 7_600_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    db_session.add(dock)
+    pos = []
+    for n, qty in enumerate((10, 3)):
+        po = PurchaseOrder(po_number=f"TEST-PO-{seed}-{n}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.draft)
+        db_session.add(po)
+        db_session.flush()
+        db_session.add(PurchaseOrderLine(po_id=po.id, product_id=PRODUCT_ID, qty_ordered=qty, unit_cost=1))
+        pos.append(po)
+    db_session.flush()
+    po1, po2 = pos
+
+    def on_order() -> int:
+        assert qty_on_order_drift(db_session, SITE_ID, [PRODUCT_ID]) == []
+        return db_session.scalar(
+            select(StockLevel.qty_on_order)
+            .where(StockLevel.product_id == PRODUCT_ID)
+            .where(StockLevel.location_id == dock.id)
+        )
+
+    def receive(qty: int, n: int) -> None:
+        gr = GoodsReceipt(
+            po_id=po1.id,
+            site_id=SITE_ID,
+            status=ReceiptStatus.posted,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"test-gr-delta-{seed}-{n}",
+        )
+        db_session.add(gr)
+        db_session.flush()
+        post_receipt_lines(db_session, gr, to_location_id=dock.id, lines=[(PRODUCT_ID, qty)])
+
+    approve_po(db_session, po1)
+    assert on_order() == 10
+    receive(4, 0)
+    assert on_order() == 6
+    receive(9, 1)
+    assert on_order() == 0
+
+    approve_po(db_session, po2)
+    assert on_order() == 3
+    cancel_po(db_session, po2)
+    assert on_order() == 0
+
+
+def test_site_rebuild_is_set_based_and_reports_changes(db_session):
+    """
+    GIVEN
+    - PO approved : A x7 ; qty_on_order DOCK faussés : A = 2, B = 5 (B sans PO engagé)
+
+    THEN
+    - rebuild_qty_on_order(site) sans liste de produits corrige A -> 7 et B -> 0
+    - un second passage ne change rien
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_700_000_000_000 + seed
+    SUPPLIER_ID = 8_700_000_000_000 + seed
+    A = 7_700_000_000_000 + seed
+    B = A + 1
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    for pid in (A, B):
+        db_session.add(Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.approved)
+    db_session.add_all([dock, po])
+    db_session.flush()
+    db_session.add(PurchaseOrderLine(po_id=po.id, product_id=A, qty_ordered=7, unit_cost=1))
+    db_session.add_all(
+        [
+            StockLevel(product_id=A, location_id=dock.id, qty_on_hand=0, qty_reserved=0, qty_on_order=2),
+            StockLevel(product_id=B, location_id=dock.id, qty_on_hand=0, qty_reserved=0, qty_on_order=5),
+        ]
+    )
+    db_session.flush()
+
+    assert rebuild_qty_on_order(db_session, site_id=SITE_ID) == [A, B]
+    levels = dict(
+        db_session.execute(
+            select(StockLevel.product_id, StockLevel.qty_on_order).where(StockLevel.location_id == dock.id)
+        ).all()
+    )
+    assert levels == {A: 7, B: 0}
+    assert rebuild_qty_on_order(db_session, site_id=SITE_ID) == []
+
+
+def test_bulk_approve_is_one_update_and_one_on_order_sync(db_session):
+    """
+    GIVEN
+    - 3 PO draft (A x5 + B x2, A x4, B x1) et 1 PO déjà approved (A x3)
+
+    THEN
+    - approve_pos : un seul UPDATE purchase_orders, un seul verrou des StockLevel DOCK
+    - qty_on_order DOCK : A = 12, B = 3 ; le PO déjà approved est rapporté inchangé
+    - un lot contenant un PO annulé est refusé en entier
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_830_000_000_000 + seed
+    SUPPLIER_ID = 8_830_000_000_000 + seed
+    A = 7_830_000_000_000 + seed
+    B = A + 1
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    for pid in (A, B):
+        db_session.add(Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    db_session.add(dock)
+
+    pos = []
+    for n, (status, lines) in enumerate(
+        [
+            (POStatus.draft, {A: 5, B: 2}),
+            (POStatus.draft, {A: 4}),
+            (POStatus.draft, {B: 1}),
+            (POStatus.approved, {A: 3}),
+            (POStatus.cancelled, {A: 100}),
+        ]
+    ):
+        po = PurchaseOrder(po_number=f"TEST-PO-{seed}-{n}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=status)
+        db_session.add(po)
+        db_session.flush()
+        db_session.add_all([PurchaseOrderLine(po_id=po.id, product_id=pid, qty_ordered=q, unit_cost=1) for pid, q in lines.items()])
+        pos.append(po)
+    db_session.flush()
+    cancelled = pos.pop()
+
+    with pytest.raises(ValueError):
+        approve_pos(db_session, [po.id for po in pos] + [cancelled.id])
+    assert pos[0].status == POStatus.draft
+
+    statements = []
+    event.listen(db_session.connection(), "before_cursor_execute", lambda *a: statements.append(a[2]))
+    changed = approve_pos(db_session, [po.id for po in pos])
+
+    assert changed == {pos[0].id: True, pos[1].id: True, pos[2].id: True, pos[3].id: False}
+    assert [po.status for po in pos] == [POStatus.approved] * 4
+    assert sum(st.startswith("UPDATE purchase_orders") for st in statements) == 1
+    assert sum("FROM stock_levels" in st and "FOR UPDATE" in st for st in statements) == 1
+    levels = dict(
+        db_session.execute(
+            select(StockLevel.product_id, StockLevel.qty_on_order).where(StockLevel.location_id == dock.id)
+        ).all()
+    )
+    assert levels == {A: 12, B: 3}
+    assert qty_on_order_drift(db_session, SITE_ID, [A, B]) == []
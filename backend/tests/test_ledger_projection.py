@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel, StockMovement
+from backend.app.db.models.core_types import LocationType, MovementType
+from backend.app.services.ledger import find_drift, project_balances, rebuild_stock_levels, take_snapshot
+
+
+def test_projection_from_snapshot_and_late_movement(db_session):
+    """
+    GIVEN
+    - RECEIPT 10 en DOCK, TRANSFER 4 DOCK->STORE, RESERVE 3 en STORE
+    - une photo, puis un RESERVE 1 tardif (happened_at AVANT la photo) et un ISSUE 2
+
+    THEN
+    - la projection compte le mouvement tardif (id > watermark)
+    - rebuild_stock_levels réécrit les StockLevel faussés
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_300_000_000_000 + seed
+    PRODUCT_ID = 7_300_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TEST-DOCK", type=LocationType.dock)
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    db_session.add_all([dock, store])
+    db_session.flush()
+
+    def mv(n, movement_type, qty, happened_at, from_id=None, to_id=None):
+        db_session.add(
+            StockMovement(
+                product_id=PRODUCT_ID,
+                from_location_id=from_id,
+                to_location_id=to_id,
+                movement_type=movement_type,
+                quantity=qty,
+                happened_at=happened_at,
+                created_by=1,
+                idempotency_key=f"test-ledger-{seed}-{n}",
+            )
+        )
+        db_session.flush()
+
+    mv(1, MovementType.receipt, 10, now - timedelta(hours=3), to_id=dock.id)
+    mv(2, MovementType.transfer, 4, now - timedelta(hours=2), from_id=dock.id, to_id=store.id)
+    mv(3, MovementType.reserve, 3, now - timedelta(hours=2), from_id=store.id)
+
+    take_snapshot(db_session, site_id=SITE_ID)
+
+    mv(4, MovementType.reserve, 1, now - timedelta(hours=1), from_id=store.id)  # tardif
+    mv(5, MovementType.issue, 2, now + timedelta(minutes=1), from_id=store.id)
+
+    balances = project_balances(db_session, site_id=SITE_ID, product_ids=[PRODUCT_ID])
+    assert balances[(PRODUCT_ID, dock.id)] == (6, 0)
+    assert balances[(PRODUCT_ID, store.id)] == (2, 2)
+    for lid, expected in ((dock.id, (6, 0)), (store.id, (2, 2))):
+        only = project_balances(db_session, site_id=SITE_ID, location_id=lid, product_ids=[PRODUCT_ID])
+        assert only == {(PRODUCT_ID, lid): expected}
+
+    # StockLevel faussé -> réparé depuis le ledger
+    db_session.add(StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=50, qty_reserved=0, qty_on_order=0))
+    db_session.flush()
+
+    res = rebuild_stock_levels(db_session, [PRODUCT_ID], site_id=SITE_ID)
+    assert res["invalid"] == []
+
+    rows = db_session.execute(
+        select(StockLevel.location_id, StockLevel.qty_on_hand, StockLevel.qty_reserved)
+        .where(StockLevel.product_id == PRODUCT_ID)
+    ).all()
+    assert {r[0]: (r[1], r[2]) for r in rows} == {dock.id: (6, 0), store.id: (2, 2)}
+
+
+def test_projection_as_of_past_instant(db_session):
+    """
+    GIVEN RECEIPT 10 (H-3), RESERVE 4 (H-2), une photo, puis ISSUE 4 (H-1)
+    THEN le solde "as of" H-90min part de la photo sans compter l'ISSUE postérieur
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_310_000_000_000 + seed
+    PRODUCT_ID = 7_310_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    db_session.add(store)
+    db_session.flush()
+
+    for n, (movement_type, qty, happened_at, from_id, to_id) in enumerate(
+        [
+            (MovementType.receipt, 10, now - timedelta(hours=3), None, store.id),
+            (MovementType.reserve, 4, now - timedelta(hours=2), store.id, None),
+            (MovementType.issue, 4, now - timedelta(hours=1), store.id, None),
+        ]
+    ):
+        db_session.add(
+            StockMovement(
+                product_id=PRODUCT_ID,
+                from_location_id=from_id,
+                to_location_id=to_id,
+                movement_type=movement_type,
+                quantity=qty,
+                happened_at=happened_at,
+                created_by=1,
+                idempotency_key=f"test-ledger-asof-{seed}-{n}",
+            )
+        )
+    db_session.flush()
+
+    take_snapshot(db_session, site_id=SITE_ID)
+
+    key = (PRODUCT_ID, store.id)
+    assert project_balances(db_session, site_id=SITE_ID, product_ids=[PRODUCT_ID], as_of=now - timedelta(minutes=90))[key] == (10, 4)
+    assert project_balances(db_session, site_id=SITE_ID, product_ids=[PRODUCT_ID], as_of=now - timedelta(hours=4)).get(key, (0, 0)) == (0, 0)
+    assert project_balances(db_session, site_id=SITE_ID, product_ids=[PRODUCT_ID])[key] == (6, 0)
+
+
+def test_find_drift_reports_only_mismatched_keys(db_session):
+    """
+    GIVEN RECEIPT 10 en DOCK + StockLevel DOCK exact, StockLevel STORE à 5 sans aucun mouvement
+    THEN find_drift ne remonte que STORE (ledger 0 / 0), DOCK est cohérent
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_320_000_000_000 + seed
+    PRODUCT_ID = 7_320_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TEST-DOCK", type=LocationType.dock)
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    db_session.add_all([dock, store])
+    db_session.flush()
+
+    db_session.add(
+        StockMovement(
+            product_id=PRODUCT_ID,
+            to_location_id=dock.id,
+            movement_type=MovementType.receipt,
+            quantity=10,
+            happened_at=datetime.now(timezone.utc),
+            created_by=1,
+            idempotency_key=f"test-drift-{seed}",
+        )
+    )
+    db_session.add_all(
+        [
+            StockLevel(product_id=PRODUCT_ID, location_id=dock.id, qty_on_hand=10, qty_reserved=0, qty_on_order=0),
+            StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=5, qty_reserved=0, qty_on_order=0),
+        ]
+    )
+    db_session.flush()
+
+    drift = find_drift(db_session, [PRODUCT_ID], site_id=SITE_ID)
+    assert drift == [
+        {
+            "product_id": PRODUCT_ID,
+            "location_id": store.id,
+            "expected_on_hand": 0,
+            "expected_reserved": 0,
+            "qty_on_hand": 5,
+            "qty_reserved": 0,
+        }
+    ]
+
+    rebuild_stock_levels(db_session, [PRODUCT_ID], site_id=SITE_ID)
+    assert find_drift(db_session, [PRODUCT_ID], site_id=SITE_ID) == []
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import event, update
+
+from backend.app.db.models.models_v1 import Site, Location
+from backend.app.db.models.core_types import LocationType
+from backend.app.services.locations import (
+    get_location,
+    inbound_dock_location_id,
+    location_by_name,
+    locations_of_type,
+)
+
+
+def test_location_registry_serves_lookups_and_follows_writes(db_session):
+    """
+    Une fois chargé, le registre répond sans requête ; toute écriture ORM sur Location
+    (flush d'objet ou UPDATE ORM-enabled) l'invalide et la lecture suivante la voit.
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_810_000_000_000 + seed
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.flush()
+    other = Location(site_id=SITE_ID, name="DOCK-B", type=LocationType.dock)
+    shelf = Location(site_id=SITE_ID, name="A-01", type=LocationType.zone)
+    db_session.add_all([other, shelf])
+    db_session.flush()
+
+    assert inbound_dock_location_id(db_session, SITE_ID) == other.id
+
+    statements = []
+    conn = db_session.connection()
+    event.listen(conn, "before_cursor_execute", lambda *a: statements.append(a[2]))
+    assert get_location(db_session, shelf.id).site_id == SITE_ID
+    assert location_by_name(db_session, SITE_ID, "A-01").id == shelf.id
+    assert [l.id for l in locations_of_type(db_session, SITE_ID, LocationType.dock)] == [other.id]
+    assert inbound_dock_location_id(db_session, SITE_ID) == other.id
+    assert statements == []
+
+    # nouvelle DOCK nommée TAH-DOCK : prioritaire
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    db_session.add(dock)
+    db_session.flush()
+    assert inbound_dock_location_id(db_session, SITE_ID) == dock.id
+
+    # UPDATE ORM-enabled : renommage
+    db_session.execute(update(Location).where(Location.id == dock.id).values(name="DOCK-A"))
+    assert location_by_name(db_session, SITE_ID, "TAH-DOCK") is None
+    assert inbound_dock_location_id(db_session, SITE_ID) == other.id
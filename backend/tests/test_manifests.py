@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from backend.app.services.manifests import ManifestSplitter, iter_lines, iter_manifest_rows
+
+
+async def _chunks(data: bytes, size: int = 5):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def _rows(data: bytes, fmt: str) -> list:
+    return [r async for r in iter_manifest_rows(iter_lines(_chunks(data)), fmt)]
+
+
+def test_manifest_stream_split_by_po():
+    """
+    GIVEN un manifeste CSV (BOM, CRLF, morceaux de 5 octets coupant les lignes) sur 2 PO
+    THEN  lignes parsées dans l'ordre ; le splitter rend un lot dès chunk_size produits
+          par PO, cumule les doublons et numérote les lots par PO
+    """
+    csv = "﻿po_id,product_id,qty_received\r\n1,10,2\r\n2,20,1\r\n1,11,3\r\n1,10,4\r\n1,12,1\r\n2,21,5".encode()
+    rows = asyncio.run(_rows(csv, "csv"))
+    assert rows == [(2, 1, 10, 2), (3, 2, 20, 1), (4, 1, 11, 3), (5, 1, 10, 4), (6, 1, 12, 1), (7, 2, 21, 5)]
+
+    splitter = ManifestSplitter(chunk_size=2)
+    batches = [b for _, po_id, pid, qty in rows if (b := splitter.add(po_id, pid, qty))]
+    batches += splitter.drain()
+    assert batches == [
+        (1, 0, [(10, 2), (11, 3)]),
+        (1, 1, [(10, 4), (12, 1)]),
+        (2, 0, [(20, 1), (21, 5)]),
+    ]
+
+    ndjson = b'{"po_id": 1, "product_id": 10, "qty_received": 2}\n\n{"po_id": 1, "product_id": 11, "qty_received": 0}\n'
+    with pytest.raises(ValueError, match="line 3"):
+        asyncio.run(_rows(ndjson, "ndjson"))
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel, StockMovement, StockMovementKey
+from backend.app.db.models.core_types import LocationType, MovementType
+from backend.app.services import movements
+
+
+def _arrange(db_session):
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_200_000_000_000 + seed
+    PRODUCT_ID = 7_200_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    wh = Location(site_id=SITE_ID, name="TEST-WH", type=LocationType.warehouse)
+    db_session.add_all([store, wh])
+    db_session.flush()
+
+    db_session.add(
+        StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=10, qty_reserved=0, qty_on_order=0)
+    )
+    db_session.flush()
+    return seed, PRODUCT_ID, store.id, wh.id
+
+
+def _level(db_session, product_id, location_id):
+    return db_session.execute(
+        select(StockLevel.qty_on_hand, StockLevel.qty_reserved)
+        .where(StockLevel.product_id == product_id)
+        .where(StockLevel.location_id == location_id)
+    ).one()
+
+
+def test_reserve_guard_and_transfer(db_session):
+    """
+    GIVEN
+    - on_hand=10 en STORE, rien en WH
+
+    THEN
+    - RESERVE 8 passe, RESERVE 3 est refusée (available=2) sans rien écrire
+    - TRANSFER 2 STORE->WH crée la ligne WH et écrit un seul mouvement TRANSFER
+    """
+    seed, pid, store_id, wh_id = _arrange(db_session)
+    now = datetime.now(timezone.utc)
+
+    movements.reserve(
+        db_session, product_id=pid, location_id=store_id, quantity=8,
+        happened_at=now, reason=None, idempotency_key=f"test-res-{seed}",
+    )
+    assert tuple(_level(db_session, pid, store_id)) == (10, 8)
+
+    with pytest.raises(ValueError, match="available=2"):
+        movements.reserve(
+            db_session, product_id=pid, location_id=store_id, quantity=3,
+            happened_at=now, reason=None, idempotency_key=f"test-res2-{seed}",
+        )
+    assert tuple(_level(db_session, pid, store_id)) == (10, 8)
+
+    movements.transfer(
+        db_session, product_id=pid, from_location_id=store_id, to_location_id=wh_id, quantity=2,
+        happened_at=now, reason=None, idempotency_key=f"test-tr-{seed}",
+    )
+    assert tuple(_level(db_session, pid, store_id)) == (8, 8)
+    assert tuple(_level(db_session, pid, wh_id)) == (2, 0)
+
+    types = db_session.execute(
+        select(StockMovement.movement_type).where(StockMovement.product_id == pid).order_by(StockMovement.id)
+    ).scalars().all()
+    assert types == [MovementType.reserve, MovementType.transfer]
+
+
+def test_movement_keys_registry(db_session):
+    """Chaque mouvement inséré (fast path) est inscrit dans stock_movement_keys par le trigger."""
+    seed, pid, store_id, _ = _arrange(db_session)
+    now = datetime.now(timezone.utc)
+
+    mv_id = movements.reserve(
+        db_session, product_id=pid, location_id=store_id, quantity=1,
+        happened_at=now, reason=None, idempotency_key=f"test-keys-{seed}",
+    )
+    key = db_session.get(StockMovementKey, f"test-keys-{seed}")
+    assert key is not None
+    assert key.movement_id == mv_id
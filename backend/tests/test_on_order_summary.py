@@ -0,0 +1,215 @@
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, text, update
+
+from backend.app.db.session import SessionLocal, engine
+from backend.app.db.models.models_v1 import (
+    Base,
+    Site,
+    Supplier,
+    Product,
+    Location,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    GoodsReceipt,
+    GoodsReceiptLine,
+    OnOrderSummary,
+)
+from backend.app.db.models.core_types import LocationType, POStatus, ReceiptStatus
+from backend.app.services.inventory import aggregate_qty_on_order, on_order_summary_drift, summary_qty_on_order
+
+
+def test_on_order_summary_matches_aggregates(db_session):
+    """
+    Chaque écriture qui touche au on_order (lignes de PO, statut PO, lignes de réception,
+    statut de réception, suppressions) doit laisser on_order_summary égal aux agrégats
+    d'origine, et ordered - received égal au qty_on_order recalculé.
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_800_000_000_000 + seed
+    SUPPLIER_ID = 8_800_000_000_000 + seed
+    A = 7_800_000_000_000 + seed
+    B = A + 1
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    for pid in (A, B):
+        db_session.add(Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    db_session.add(Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock))
+
+    def check() -> dict[int, int]:
+        db_session.flush()
+        assert on_order_summary_drift(db_session, SITE_ID) == []
+        summary = summary_qty_on_order(db_session, [(SITE_ID, A), (SITE_ID, B)])
+        assert {pid: q for (_, pid), q in summary.items()} == aggregate_qty_on_order(db_session, SITE_ID, [A, B])
+        return {pid: q for (_, pid), q in summary.items()}
+
+    def receipt(po: PurchaseOrder, n: int, status: ReceiptStatus, lines: dict[int, int]) -> GoodsReceipt:
+        gr = GoodsReceipt(
+            po_id=po.id,
+            site_id=SITE_ID,
+            status=status,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"test-gr-summary-{seed}-{n}",
+        )
+        db_session.add(gr)
+        db_session.flush()
+        db_session.add_all(
+            [GoodsReceiptLine(receipt_id=gr.id, product_id=pid, qty_received=q, qty_damaged=0) for pid, q in lines.items()]
+        )
+        return gr
+
+    po1 = PurchaseOrder(po_number=f"TEST-PO-{seed}-1", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.draft)
+    po2 = PurchaseOrder(po_number=f"TEST-PO-{seed}-2", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.approved)
+    db_session.add_all([po1, po2])
+    db_session.flush()
+
+    # lignes de PO : insert sur PO draft (rien) puis sur PO engagé
+    db_session.add_all(
+        [
+            PurchaseOrderLine(po_id=po1.id, product_id=A, qty_ordered=10, unit_cost=1),
+            PurchaseOrderLine(po_id=po1.id, product_id=B, qty_ordered=4, unit_cost=1),
+            PurchaseOrderLine(po_id=po2.id, product_id=A, qty_ordered=3, unit_cost=1),
+        ]
+    )
+    assert check() == {A: 3, B: 0}
+
+    # statut PO : approve
+    po1.status = POStatus.approved
+    assert check() == {A: 13, B: 4}
+
+    # réception POSTED (avec sur-réception de B) puis brouillon
+    first = receipt(po1, 0, ReceiptStatus.posted, {A: 6, B: 9})
+    assert check() == {A: 7, B: 0}
+    draft = receipt(po1, 1, ReceiptStatus.draft, {A: 2})
+    assert check() == {A: 7, B: 0}
+
+    # brouillon -> POSTED ; correction d'une ligne reçue (dommages)
+    draft.status = ReceiptStatus.posted
+    assert check() == {A: 5, B: 0}
+    db_session.execute(
+        update(GoodsReceiptLine)
+        .where(GoodsReceiptLine.receipt_id == draft.id)
+        .values(qty_damaged=1)
+    )
+    assert check() == {A: 6, B: 0}
+
+    # quantité commandée modifiée, ligne supprimée
+    db_session.execute(
+        update(PurchaseOrderLine)
+        .where(PurchaseOrderLine.po_id == po1.id, PurchaseOrderLine.product_id == B)
+        .values(qty_ordered=12)
+    )
+    assert check() == {A: 6, B: 3}
+
+    # compteurs de réception de la ligne seuls : le trigger sort sans réagréger
+    db_session.execute(text("SET LOCAL track_functions = 'all'"))
+
+    def apply_calls():
+        return db_session.scalar(
+            text("SELECT coalesce(sum(calls), 0) FROM pg_stat_xact_user_functions WHERE funcname = 'on_order_summary_apply'")
+        )
+
+    calls = apply_calls()
+    db_session.execute(
+        update(PurchaseOrderLine).where(PurchaseOrderLine.po_id == po1.id).values(qty_received=PurchaseOrderLine.qty_received + 1)
+    )
+    assert apply_calls() == calls
+    assert check() == {A: 6, B: 3}
+    db_session.execute(delete(PurchaseOrderLine).where(PurchaseOrderLine.po_id == po2.id))
+    assert check() == {A: 3, B: 3}
+
+    # suppression d'une réception POSTED, annulation et suppression de PO
+    db_session.delete(draft)
+    assert check() == {A: 4, B: 3}
+    po1.status = POStatus.cancelled
+    assert check() == {A: 0, B: 0}
+    po1.status = POStatus.approved
+    assert check() == {A: 4, B: 3}
+    db_session.delete(first)
+    assert check() == {A: 10, B: 12}
+    db_session.execute(delete(PurchaseOrder).where(PurchaseOrder.id.in_([po1.id, po2.id])))
+    db_session.expunge_all()
+    assert check() == {A: 0, B: 0}
+    assert db_session.get(OnOrderSummary, (SITE_ID, A)).ordered_qty == 0
+
+
+def test_concurrent_over_receipts_count_once():
+    """
+    GIVEN une ligne de PO engagée de 10, données commitées
+    WHEN  deux transactions postent chacune une réception de 8 en même temps
+    THEN  la seconde attend la première (verrou par (po, produit)) puis voit sa réception :
+          received_qty = 10 (borné au commandé), pas 16
+    """
+    Base.metadata.create_all(bind=engine)
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_810_000_000_000 + seed
+    SUPPLIER_ID = 8_810_000_000_000 + seed
+    A = 7_810_000_000_000 + seed
+
+    setup = SessionLocal()
+    setup.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    setup.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    setup.add(Product(id=A, sku=f"TEST-SKU-{A}", name="TEST", uom="unit", active=True))
+    setup.flush()
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.approved)
+    setup.add(po)
+    setup.flush()
+    PO_ID = po.id
+    setup.add(PurchaseOrderLine(po_id=PO_ID, product_id=A, qty_ordered=10, unit_cost=1))
+    setup.commit()
+
+    def post_receipt(db, n: int) -> None:
+        gr = GoodsReceipt(
+            po_id=PO_ID,
+            site_id=SITE_ID,
+            status=ReceiptStatus.posted,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"test-gr-concurrent-{seed}-{n}",
+        )
+        db.add(gr)
+        db.flush()
+        db.add(GoodsReceiptLine(receipt_id=gr.id, product_id=A, qty_received=8, qty_damaged=0))
+        db.flush()
+
+    first, second = SessionLocal(), SessionLocal()
+    errors = []
+
+    def concurrent() -> None:
+        try:
+            post_receipt(second, 2)
+            second.commit()
+        except Exception as e:  # remonté par l'assert du thread principal
+            errors.append(e)
+
+    try:
+        post_receipt(first, 1)
+        worker = threading.Thread(target=concurrent)
+        worker.start()
+        worker.join(timeout=0.5)
+        assert worker.is_alive()  # attend le verrou de la première transaction
+        first.commit()
+        worker.join(timeout=10)
+        assert not worker.is_alive() and errors == []
+
+        summary = setup.get(OnOrderSummary, (SITE_ID, A), populate_existing=True)
+        assert (summary.ordered_qty, summary.received_qty) == (10, 10)
+        assert on_order_summary_drift(setup, SITE_ID) == []
+    finally:
+        first.rollback()
+        second.rollback()
+        first.close()
+        second.close()
+        setup.rollback()
+        setup.execute(delete(GoodsReceipt).where(GoodsReceipt.po_id == PO_ID))
+        setup.execute(delete(PurchaseOrder).where(PurchaseOrder.id == PO_ID))
+        setup.execute(delete(OnOrderSummary).where(OnOrderSummary.site_id == SITE_ID))
+        setup.execute(delete(Product).where(Product.id == A))
+        setup.execute(delete(Supplier).where(Supplier.id == SUPPLIER_ID))
+        setup.execute(delete(Site).where(Site.id == SITE_ID))
+        setup.commit()
+        setup.close()
@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from backend.app.api.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_roundtrip_and_invalid():
+    at = datetime(2026, 10, 1, 8, 30, tzinfo=timezone.utc)
+    cursor = encode_cursor(at, 42)
+
+    assert decode_cursor(cursor, datetime, int) == (at, 42)
+
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor", datetime, int)
+    assert exc.value.status_code == 400
+
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor(at), datetime, int)
+
+
+def test_po_list_pages_by_id_with_filters(db_session):
+    """
+    5 PO du site (3 approved dont 1 hors plage d'ETA, 2 draft) :
+    status=approved + plage d'ETA, limit=1 -> 2 pages, plus récent d'abord, sans doublon.
+    """
+    from datetime import date
+
+    from backend.app.api.v1.endpoints.purchase_orders import list_pos
+    from backend.app.db.models.core_types import POStatus
+    from backend.app.db.models.models_v1 import PurchaseOrder, Site, Supplier
+
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_850_000_000_000 + seed
+    SUPPLIER_ID = 8_850_000_000_000 + seed
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    db_session.flush()
+    pos = [
+        PurchaseOrder(
+            po_number=f"TEST-PO-{seed}-{n}",
+            supplier_id=SUPPLIER_ID,
+            site_id=SITE_ID,
+            status=status,
+            expected_eta=date(2026, 11, day),
+        )
+        for n, (status, day) in enumerate(
+            [(POStatus.approved, 2), (POStatus.draft, 3), (POStatus.approved, 4), (POStatus.approved, 28), (POStatus.draft, 5)]
+        )
+    ]
+    db_session.add_all(pos)
+    db_session.flush()
+
+    def page(cursor):
+        return list_pos(
+            status=[POStatus.approved],
+            supplier_id=SUPPLIER_ID,
+            site_id=SITE_ID,
+            eta_from=date(2026, 11, 1),
+            eta_to=date(2026, 11, 15),
+            order="desc",
+            limit=1,
+            cursor=cursor,
+            db=db_session,
+        )
+
+    first = page(None)
+    assert [r["id"] for r in first["items"]] == [pos[2].id]
+    assert set(first["items"][0]) >= {"po_number", "status", "expected_eta"}
+    second = page(first["next_cursor"])
+    assert [r["id"] for r in second["items"]] == [pos[0].id]
+    assert second["next_cursor"] is None
@@ -0,0 +1,64 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event, func, select
+
+from backend.app.db.models.models_v1 import Site, Supplier, Product, PurchaseOrder, PurchaseOrderLine
+from backend.app.services.po_csv import parse_po_csv
+from backend.app.services.purchase_orders import PONumberConflict, create_pos
+
+
+def test_bulk_po_creation_from_csv_is_set_based(db_session):
+    """
+    GIVEN
+    - un CSV de 2 PO : 1 200 lignes + 3 lignes
+
+    THEN
+    - création en un nombre d'instructions indépendant du nombre de lignes
+    - produit inconnu / po_number déjà pris : refus avant toute écriture
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_840_000_000_000 + seed
+    SUPPLIER_ID = 8_840_000_000_000 + seed
+    first = 7_840_000_000_000 + seed
+    pids = [first + i for i in range(1200)]
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    db_session.add_all([Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True) for pid in pids])
+    db_session.flush()
+
+    csv_lines = ["po_number,supplier_id,site_id,expected_eta,shipment_id,product_id,qty_ordered,unit_cost"]
+    csv_lines += [f"ASIA-{seed},{SUPPLIER_ID},{SITE_ID},2026-11-20,,{pid},10,4.15" for pid in pids]
+    csv_lines += [f"LOCAL-{seed},{SUPPLIER_ID},{SITE_ID},,,{pid},2,0" for pid in pids[:3]]
+    specs = parse_po_csv(csv_lines)
+    assert [(s["po_number"], len(s["lines"]), s["expected_eta"]) for s in specs] == [
+        (f"ASIA-{seed}", 1200, date(2026, 11, 20)),
+        (f"LOCAL-{seed}", 3, None),
+    ]
+    with pytest.raises(ValueError, match="line 3: PO"):
+        parse_po_csv(csv_lines[:2] + [csv_lines[2].replace(",2026-11-20,", ",2026-11-21,")])
+
+    statements = []
+    event.listen(db_session.connection(), "before_cursor_execute", lambda *a: statements.append(a[2]))
+    created = create_pos(db_session, specs)
+    assert len(statements) <= 8
+
+    assert [n for _, n in created] == [f"ASIA-{seed}", f"LOCAL-{seed}"]
+    counts = dict(
+        db_session.execute(
+            select(PurchaseOrderLine.po_id, func.count())
+            .where(PurchaseOrderLine.po_id.in_([i for i, _ in created]))
+            .group_by(PurchaseOrderLine.po_id)
+        ).all()
+    )
+    assert counts == {created[0][0]: 1200, created[1][0]: 3}
+    assert db_session.get(PurchaseOrderLine, (created[0][0], pids[0])).unit_cost == Decimal("4.15")
+
+    with pytest.raises(PONumberConflict):
+        create_pos(db_session, specs[1:])
+    bad = {**specs[1], "po_number": f"BAD-{seed}", "lines": [(first - 1, 1, Decimal(1))]}
+    with pytest.raises(ValueError, match="Invalid product_id"):
+        create_pos(db_session, [bad])
+    assert db_session.scalar(select(func.count()).where(PurchaseOrder.po_number == f"BAD-{seed}")) == 0
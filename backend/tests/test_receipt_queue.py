@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from backend.app.db.models.models_v1 import (
+    Site,
+    Supplier,
+    Product,
+    Location,
+    StockLevel,
+    StockMovement,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    GoodsReceipt,
+)
+from backend.app.db.models.core_types import LocationType, MovementType, POStatus, ReceiptStatus
+from backend.app.services import receipt_queue
+from backend.app.services.receipt_queue import claim_next, post_draft, queue_state
+from backend.app.services.purchase_orders import approve_po
+from backend.app.services.receiving import has_pending_drafts, post_receipt, record_receipt_lines
+
+
+def test_draft_receipts_are_posted_in_po_order(db_session):
+    """
+    GIVEN
+    - un PO approuvé (approve_po) : A x10
+    - deux brouillons en file sur ce PO : A x4 puis A x3
+
+    THEN
+    - seul le plus ancien est éligible (ordre par PO) ; aucun stock avant comptabilisation
+    - post_draft : posted, on_hand A = 4, un RECEIPT, qty_on_order = 6
+    - le second devient éligible ensuite
+    - une réception de manifeste (post_receipt) sur ce PO passe en file derrière lui
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_500_000_000_000 + seed
+    SUPPLIER_ID = 8_500_000_000_000 + seed
+    A = 7_500_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    db_session.add(Product(id=A, sku=f"TEST-SKU-{A}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.draft)
+    db_session.add_all([dock, po])
+    db_session.flush()
+    db_session.add(PurchaseOrderLine(po_id=po.id, product_id=A, qty_ordered=10, unit_cost=1))
+    approve_po(db_session, po)
+
+    drafts = []
+    for n, qty in enumerate((4, 3)):
+        gr = GoodsReceipt(
+            po_id=po.id,
+            site_id=SITE_ID,
+            status=ReceiptStatus.draft,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"test-gr-queue-{seed}-{n}",
+            to_location_id=dock.id,
+            post_after=func.now(),
+        )
+        db_session.add(gr)
+        db_session.flush()
+        record_receipt_lines(db_session, gr, [(A, qty)])
+        drafts.append(gr)
+    db_session.flush()
+    first, second = drafts
+
+    assert has_pending_drafts(db_session, po.id)
+    assert claim_next(db_session) is first
+    assert queue_state(first) == "queued"
+    assert db_session.scalar(select(StockLevel.qty_on_hand).where(StockLevel.product_id == A)) == 0
+
+    post_draft(db_session, first)
+
+    assert queue_state(first) == "posted"
+    level = db_session.execute(select(StockLevel).where(StockLevel.product_id == A)).scalar_one()
+    assert (level.qty_on_hand, level.qty_on_order) == (4, 6)
+    assert (
+        db_session.scalar(
+            select(func.count())
+            .where(StockMovement.product_id == A)
+            .where(StockMovement.movement_type == MovementType.receipt)
+        )
+        == 1
+    )
+
+    assert claim_next(db_session) is second
+
+    # manifeste pendant que `second` attend : mis en file derrière lui, pas comptabilisé
+    receipt_id, created, queued = post_receipt(
+        db_session,
+        po_id=po.id,
+        site_id=SITE_ID,
+        to_location_id=dock.id,
+        received_at=datetime.now(timezone.utc),
+        idempotency_key=f"test-gr-queue-{seed}-manifest",
+        lines=[(A, 2)],
+    )
+    manifest = db_session.get(GoodsReceipt, receipt_id)
+    assert (created, queued, queue_state(manifest)) == (True, True, "queued")
+    db_session.refresh(level)
+    assert level.qty_on_hand == 4
+
+    post_draft(db_session, second)
+    assert claim_next(db_session) is manifest
+    post_draft(db_session, manifest)
+    db_session.refresh(level)
+    assert (level.qty_on_hand, level.qty_on_order) == (9, 1)
+
+
+def test_workers_retry_on_database_errors_and_stop_on_others(monkeypatch, caplog):
+    """
+    drain() en OperationalError : journalisé, nouvel essai ; autre erreur : journalisée
+    avec sa trace, pool arrêté et erreur relevée par run_workers.
+    """
+    calls = []
+
+    def failing_drain():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+        raise RuntimeError("claim bug")
+
+    monkeypatch.setattr(receipt_queue, "drain", failing_drain)
+    with pytest.raises(RuntimeError, match="claim bug"):
+        receipt_queue.run_workers(workers=1, poll_seconds=0.01)
+
+    assert len(calls) == 2
+    assert [r.levelname for r in caplog.records] == ["WARNING", "ERROR"]
+    assert caplog.records[1].exc_info is not None
@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.app.db.models.models_v1 import (
+    Site,
+    Supplier,
+    Product,
+    Location,
+    StockLevel,
+    StockMovement,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    GoodsReceipt,
+    GoodsReceiptLine,
+)
+from backend.app.db.models.core_types import LocationType, MovementType, POStatus, ReceiptStatus
+from backend.app.services.purchase_orders import approve_po, rebuild_po_line_received
+from backend.app.services.receiving import post_receipt_lines
+from backend.app.api.v1.endpoints.purchase_orders import get_po_open_lines
+
+
+def test_post_receipt_lines_bulk(db_session):
+    """
+    GIVEN
+    - un PO approuvé (approve_po) : A x10, B x6 ; StockLevel DOCK existant pour A (on_hand 3)
+    - une réception de A x5, B x4 vers le DOCK
+
+    THEN
+    - on_hand A = 8 (ligne existante incrémentée), B = 4 (ligne créée)
+    - une goods_receipt_line et un RECEIPT par produit
+    - qty_on_order recalculé : A = 5, B = 2
+    - un produit en double est refusé
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_400_000_000_000 + seed
+    SUPPLIER_ID = 8_400_000_000_000 + seed
+    A = 7_400_000_000_000 + seed
+    B = A + 1
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    for pid in (A, B):
+        db_session.add(Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    db_session.add(dock)
+    db_session.flush()
+    db_session.add(StockLevel(product_id=A, location_id=dock.id, qty_on_hand=3, qty_reserved=0, qty_on_order=0))
+
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.draft)
+    db_session.add(po)
+    db_session.flush()
+    db_session.add_all(
+        [
+            PurchaseOrderLine(po_id=po.id, product_id=A, qty_ordered=10, unit_cost=1),
+            PurchaseOrderLine(po_id=po.id, product_id=B, qty_ordered=6, unit_cost=1),
+        ]
+    )
+    approve_po(db_session, po)
+    gr = GoodsReceipt(
+        po_id=po.id,
+        site_id=SITE_ID,
+        status=ReceiptStatus.posted,
+        received_at=datetime.now(timezone.utc),
+        received_by=1,
+        idempotency_key=f"test-gr-bulk-{seed}",
+    )
+    db_session.add(gr)
+    db_session.flush()
+
+    post_receipt_lines(db_session, gr, to_location_id=dock.id, lines=[(B, 4), (A, 5)])
+
+    levels = {
+        int(r.product_id): (r.qty_on_hand, r.qty_on_order)
+        for r in db_session.execute(select(StockLevel).where(StockLevel.location_id == dock.id)).scalars()
+    }
+    assert levels == {A: (8, 5), B: (4, 2)}
+
+    assert db_session.scalar(select(func.count()).where(GoodsReceiptLine.receipt_id == gr.id)) == 2
+    assert (
+        db_session.scalar(
+            select(func.count())
+            .where(StockMovement.product_id.in_([A, B]))
+            .where(StockMovement.movement_type == MovementType.receipt)
+        )
+        == 2
+    )
+
+    with pytest.raises(ValueError):
+        post_receipt_lines(db_session, gr, to_location_id=dock.id, lines=[(A, 1), (A, 2)])
+
+
+def test_po_line_counters_drive_partial_and_closed(db_session):
+    """
+    GIVEN
+    - un PO approuvé : A x10, B x6
+
+    THEN
+    - réception A x4 -> PO partial ; ouvert A = 6, B = 6
+    - réception A x7 (sur-réception), B x6 -> PO closed ; ouvert 0 ; qty_on_order DOCK = 0
+    - les compteurs sont égaux au recalcul depuis les réceptions
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_860_000_000_000 + seed
+    SUPPLIER_ID = 8_860_000_000_000 + seed
+    A = 7_860_000_000_000 + seed
+    B = A + 1
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=1, reliability_score=80))
+    for pid in (A, B):
+        db_session.add(Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.draft)
+    db_session.add_all([dock, po])
+    db_session.flush()
+    db_session.add_all(
+        [
+            PurchaseOrderLine(po_id=po.id, product_id=A, qty_ordered=10, unit_cost=1),
+            PurchaseOrderLine(po_id=po.id, product_id=B, qty_ordered=6, unit_cost=1),
+        ]
+    )
+    approve_po(db_session, po)
+
+    def receive(n: int, lines: list[tuple[int, int]]) -> dict:
+        gr = GoodsReceipt(
+            po_id=po.id,
+            site_id=SITE_ID,
+            status=ReceiptStatus.posted,
+            received_at=datetime.now(timezone.utc),
+            received_by=1,
+            idempotency_key=f"test-gr-open-{seed}-{n}",
+        )
+        db_session.add(gr)
+        db_session.flush()
+        post_receipt_lines(db_session, gr, to_location_id=dock.id, lines=lines)
+        out = get_po_open_lines(po.id, db=db_session)
+        return {"status": out["status"], **{l["product_id"]: (l["qty_received"], l["qty_open"]) for l in out["lines"]}}
+
+    assert receive(0, [(A, 4)]) == {"status": POStatus.partial, A: (4, 6), B: (0, 6)}
+    assert receive(1, [(A, 7), (B, 6)]) == {"status": POStatus.closed, A: (11, 0), B: (6, 0)}
+    assert rebuild_po_line_received(db_session, [po.id]) == 0
+    on_order = db_session.scalars(select(StockLevel.qty_on_order).where(StockLevel.location_id == dock.id)).all()
+    assert on_order and set(on_order) == {0}
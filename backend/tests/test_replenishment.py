@@ -0,0 +1,168 @@
+import math
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import (
+    Location,
+    Product,
+    PurchaseOrder,
+    PurchaseOrderLine,
+    Site,
+    StockLevel,
+    StockMovement,
+    Supplier,
+)
+from backend.app.db.models.core_types import LocationType, MovementType, POStatus
+from backend.app.services import hot_stock, movements
+from backend.app.services.replenishment import compute_reorders, draft_replenishment_pos, load_inputs
+
+
+def test_replenishment_plan_drafts_one_po_per_supplier(db_session):
+    """
+    GIVEN
+    - A : 5 en stock, 4 sorties/jour sur 28 des 56 derniers jours, déjà acheté chez S (délai 10 j)
+    - B : sorties mais jamais acheté sur le site (pas de source)
+    - C : déjà acheté chez S, gros stock, aucune sortie
+
+    THEN
+    - d = 2/j, s = 2 -> SS = 1.65 * 2 * sqrt(10), commande A = ceil(2 * 17 + SS - 5) = 40
+    - un PO draft REPL-... chez S pour A seul ; un second passage ne propose plus rien
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_850_000_000_000 + seed
+    SUPPLIER_ID = 8_850_000_000_000 + seed
+    A, B, C = (7_850_000_000_000 + seed + i for i in range(3))
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=10, reliability_score=100))
+    db_session.add_all([Product(id=pid, sku=f"TEST-SKU-{pid}", name="TEST", uom="unit", active=True) for pid in (A, B, C)])
+    db_session.flush()
+    dock = Location(site_id=SITE_ID, name="TAH-DOCK", type=LocationType.dock)
+    db_session.add(dock)
+    db_session.flush()
+    db_session.add_all(
+        [
+            StockLevel(product_id=A, location_id=dock.id, qty_on_hand=5, qty_reserved=0, qty_on_order=0),
+            StockLevel(product_id=B, location_id=dock.id, qty_on_hand=0, qty_reserved=0, qty_on_order=0),
+            StockLevel(product_id=C, location_id=dock.id, qty_on_hand=1000, qty_reserved=0, qty_on_order=0),
+        ]
+    )
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.closed)
+    db_session.add(po)
+    db_session.flush()
+    db_session.add_all(
+        [
+            PurchaseOrderLine(po_id=po.id, product_id=A, qty_ordered=100, unit_cost=Decimal("2.50")),
+            PurchaseOrderLine(po_id=po.id, product_id=C, qty_ordered=100, unit_cost=Decimal("1.00")),
+        ]
+    )
+    db_session.add_all(
+        [
+            StockMovement(
+                product_id=pid,
+                from_location_id=dock.id,
+                movement_type=MovementType.issue,
+                quantity=4,
+                happened_at=now - timedelta(days=2 * d + 1),
+                created_by=1,
+                idempotency_key=f"test-repl-{seed}-{pid}-{d}",
+            )
+            for pid in (A, B)
+            for d in range(28)
+        ]
+    )
+    db_session.flush()
+
+    frame = load_inputs(db_session, site_ids=[SITE_ID], as_of=now)
+    assert sorted(frame["product_id"]) == [A, B, C]
+    plan = compute_reorders(frame)
+    assert plan[["product_id", "supplier_id", "qty"]].values.tolist() == [[A, SUPPLIER_ID, 40]]
+    assert plan["reorder_point"].iloc[0] == 20 + 1.65 * 2 * math.sqrt(10)
+
+    # sans base : un fournisseur peu fiable allonge le délai effectif (L = 10 * 1.5)
+    synthetic = frame[frame["product_id"] == A].assign(reliability_score=50)
+    assert compute_reorders(synthetic)["qty"].tolist() == [math.ceil(2 * 22 + 1.65 * 2 * np.sqrt(15) - 5)]
+    assert compute_reorders(pd.DataFrame(columns=frame.columns).astype(frame.dtypes)).empty
+
+    res = draft_replenishment_pos(db_session, plan, as_of=now.date())
+    assert [n for _, n in res["created"]] == [f"REPL-{now:%Y%m%d}-S{SITE_ID}-F{SUPPLIER_ID}"]
+    draft = db_session.get(PurchaseOrder, res["created"][0][0])
+    assert (draft.status, draft.expected_eta) == (POStatus.draft, now.date() + timedelta(days=10))
+    assert db_session.execute(
+        select(PurchaseOrderLine.product_id, PurchaseOrderLine.qty_ordered, PurchaseOrderLine.unit_cost).where(
+            PurchaseOrderLine.po_id == draft.id
+        )
+    ).all() == [(A, 40, Decimal("2.50"))]
+
+    # le brouillon compte dans la position ; même (site, fournisseur, jour) : ignoré
+    assert compute_reorders(load_inputs(db_session, site_ids=[SITE_ID], as_of=now)).empty
+    assert draft_replenishment_pos(db_session, plan, as_of=now.date()) == {
+        "created": [],
+        "skipped": [f"REPL-{now:%Y%m%d}-S{SITE_ID}-F{SUPPLIER_ID}"],
+    }
+
+
+def test_sharded_pair_position_uses_effective_levels(db_session):
+    """
+    GIVEN
+    - H : 100 en stock, couple chaud (4 shards, 80 en quota), RESERVE 5 servi par un shard
+    - 4 sorties/jour sur 28 des 56 derniers jours, déjà acheté chez S (délai 10 j)
+
+    THEN
+    - position = 100 - 5 (l'escrow n'est pas du réservé) > ROP = 20 + SS : rien à commander
+      (avec qty_reserved brut = 80, la position tomberait à 20 < ROP)
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_860_000_000_000 + seed
+    SUPPLIER_ID = 8_860_000_000_000 + seed
+    H = 7_860_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Supplier(id=SUPPLIER_ID, name=f"TEST-SUP-{SUPPLIER_ID}", country="PF", lead_time_days=10, reliability_score=100))
+    db_session.add(Product(id=H, sku=f"TEST-SKU-{H}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    store = Location(site_id=SITE_ID, name="TAH-STORE", type=LocationType.store)
+    po = PurchaseOrder(po_number=f"TEST-PO-{seed}", supplier_id=SUPPLIER_ID, site_id=SITE_ID, status=POStatus.closed)
+    db_session.add_all([store, po])
+    db_session.flush()
+    db_session.add(StockLevel(product_id=H, location_id=store.id, qty_on_hand=100, qty_reserved=0, qty_on_order=0))
+    db_session.add(PurchaseOrderLine(po_id=po.id, product_id=H, qty_ordered=100, unit_cost=Decimal("2.50")))
+    db_session.add_all(
+        [
+            StockMovement(
+                product_id=H,
+                from_location_id=store.id,
+                movement_type=MovementType.issue,
+                quantity=4,
+                happened_at=now - timedelta(days=2 * d + 1),
+                created_by=1,
+                idempotency_key=f"test-repl-hot-{seed}-{d}",
+            )
+            for d in range(28)
+        ]
+    )
+    db_session.flush()
+
+    hot_stock.enable_sharding(db_session, H, store.id, shards=4)
+    movements.reserve(
+        db_session,
+        product_id=H,
+        location_id=store.id,
+        quantity=5,
+        happened_at=now,
+        reason=None,
+        idempotency_key=f"test-repl-hot-{seed}-reserve",
+    )
+    assert db_session.execute(
+        select(StockLevel.qty_on_hand, StockLevel.qty_reserved).where(StockLevel.product_id == H)
+    ).one() == (100, 80)
+
+    frame = load_inputs(db_session, site_ids=[SITE_ID], as_of=now)
+    assert frame[["on_hand", "reserved"]].values.tolist() == [[100, 5]]
+    assert compute_reorders(frame).empty
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel, StockMovement, StockReservation
+from backend.app.db.models.core_types import LocationType, MovementType, ReservationStatus
+from backend.app.services import reservations
+
+
+def test_ttl_reservations_expire_in_batch(db_session):
+    """
+    GIVEN
+    - on_hand=20 en STORE, deux RESERVE à TTL (5 et 7), dont 2 unités déjà sorties sur la 1re
+
+    THEN
+    - expire_batch (à une date après l'échéance) libère 3 + 7 en un lot
+    - un UNRESERVE "expire:<id>" par réservation, réservations EXPIRED
+    - une réservation expirée ne peut plus être consommée
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_500_000_000_000 + seed
+    PRODUCT_ID = 7_500_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    db_session.add(store)
+    db_session.flush()
+    db_session.add(StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=20, qty_reserved=0, qty_on_order=0))
+    db_session.flush()
+
+    kw = dict(product_id=PRODUCT_ID, location_id=store.id, happened_at=now, reason=None)
+    mv1 = reservations.reserve(db_session, ttl_seconds=60, quantity=5, idempotency_key=f"test-ttl-{seed}-1", **kw)
+    mv2 = reservations.reserve(db_session, ttl_seconds=60, quantity=7, idempotency_key=f"test-ttl-{seed}-2", **kw)
+    r1 = reservations.reservation_for_movement(db_session, mv1)
+    r2 = reservations.reservation_for_movement(db_session, mv2)
+
+    reservations.issue(db_session, reservation_id=r1, quantity=2, idempotency_key=f"test-ttl-{seed}-3", **kw)
+
+    res = reservations.expire_batch(db_session, now=now + timedelta(minutes=5))
+    assert res["released"] == 10
+    assert res["expired"] >= 2  # d'autres réservations échues peuvent exister en base
+
+    level = db_session.execute(
+        select(StockLevel.qty_on_hand, StockLevel.qty_reserved)
+        .where(StockLevel.product_id == PRODUCT_ID)
+        .where(StockLevel.location_id == store.id)
+    ).one()
+    assert tuple(level) == (18, 0)
+
+    unreserves = db_session.execute(
+        select(StockMovement.idempotency_key, StockMovement.quantity)
+        .where(StockMovement.product_id == PRODUCT_ID)
+        .where(StockMovement.movement_type == MovementType.unreserve)
+    ).all()
+    assert sorted(unreserves) == sorted([(f"expire:{r1}", 3), (f"expire:{r2}", 7)])
+
+    statuses = db_session.execute(
+        select(StockReservation.status).where(StockReservation.id.in_([r1, r2]))
+    ).scalars().all()
+    assert statuses == [ReservationStatus.expired] * 2
+
+    with pytest.raises(ValueError, match="not active"):
+        reservations.unreserve(db_session, reservation_id=r2, quantity=1, idempotency_key=f"test-ttl-{seed}-4", **kw)
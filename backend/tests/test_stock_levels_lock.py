@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel
+from backend.app.db.models.core_types import LocationType
+from backend.app.services.stock_levels import lock_stock_levels
+
+
+def test_lock_stock_levels_creates_missing_and_keeps_existing(db_session):
+    """
+    GIVEN
+    - un StockLevel existant (on_hand=7) et une clé sans ligne
+
+    THEN
+    - les deux clés sont retournées, la ligne manquante est créée à 0
+    - la ligne existante n'est pas modifiée
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_100_000_000_000 + seed
+    PRODUCT_ID = 7_100_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+
+    a = Location(site_id=SITE_ID, name="TEST-A", type=LocationType.warehouse)
+    b = Location(site_id=SITE_ID, name="TEST-B", type=LocationType.store)
+    db_session.add_all([a, b])
+    db_session.flush()
+
+    db_session.add(
+        StockLevel(product_id=PRODUCT_ID, location_id=a.id, qty_on_hand=7, qty_reserved=0, qty_on_order=0)
+    )
+    db_session.flush()
+
+    # ordre "inverse" volontaire : le service trie lui-même
+    levels = lock_stock_levels(db_session, [(PRODUCT_ID, b.id), (PRODUCT_ID, a.id), (PRODUCT_ID, b.id)])
+
+    assert set(levels) == {(PRODUCT_ID, a.id), (PRODUCT_ID, b.id)}
+    assert levels[(PRODUCT_ID, a.id)].qty_on_hand == 7
+    assert levels[(PRODUCT_ID, b.id)].qty_on_hand == 0
+
+    rows = db_session.execute(
+        select(StockLevel).where(StockLevel.product_id == PRODUCT_ID)
+    ).scalars().all()
+    assert len(rows) == 2
@@ -0,0 +1,151 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import delete, select, text, update
+
+from backend.app.db.session import SessionLocal, engine
+from backend.app.db.models.models_v1 import (
+    Base,
+    Location,
+    Product,
+    Site,
+    StockLevel,
+    StockLot,
+    StockLotPending,
+    StockMovement,
+    StockMovementKey,
+)
+from backend.app.db.models.core_types import LocationType
+from backend.app.services import hot_stock, lots, movements
+
+
+def test_fefo_allocation_across_lots(db_session):
+    """
+    GIVEN en STORE : lot A x3 (péremption J+10), lot B x5 (J+2), 2 non suivis ; StockLevel 10
+    WHEN  RESERVE 6, ISSUE 4, TRANSFER 3 vers BACK
+    THEN  RESERVE prend B (5) puis A (1) ; ISSUE consomme B (4) ;
+          TRANSFER prend le disponible FEFO : B (0 dispo) -> A (2), puis non suivi (1),
+          et recrée les lots à destination ; lots source insuffisants : le reste
+          arrive en non suivi à destination
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_500_000_000_000 + seed
+    PRODUCT_ID = 7_500_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+    d2, d10 = date(2030, 1, 2), date(2030, 1, 10)
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    back = Location(site_id=SITE_ID, name="TEST-BACK", type=LocationType.store)
+    db_session.add_all([store, back])
+    db_session.flush()
+    db_session.add(StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=10, qty_reserved=0, qty_on_order=0))
+    db_session.flush()
+    lots.receive(db_session, PRODUCT_ID, store.id, {("A", d10): 3, ("B", d2): 5, (None, None): 2})
+
+    def mv(n: int) -> dict:
+        return dict(happened_at=now, reason=None, idempotency_key=f"test-fefo-{seed}-{n}")
+
+    def picks(mv_id: int) -> list:
+        return [(l["lot_code"], l["quantity"]) for l in lots.movement_lots(db_session, mv_id)]
+
+    r = movements.reserve(db_session, product_id=PRODUCT_ID, location_id=store.id, quantity=6, **mv(1))
+    assert picks(r) == [("B", 5), ("A", 1)]
+
+    i = movements.issue(db_session, product_id=PRODUCT_ID, location_id=store.id, quantity=4, **mv(2))
+    assert picks(i) == [("B", 4)]
+
+    t = movements.transfer(
+        db_session, product_id=PRODUCT_ID, from_location_id=store.id, to_location_id=back.id, quantity=3, **mv(3)
+    )
+    assert picks(t) == [("A", 2), (None, 1)]
+
+    rows = db_session.execute(
+        select(StockLot.location_id, StockLot.lot_code, StockLot.qty_on_hand, StockLot.qty_reserved)
+        .where(StockLot.product_id == PRODUCT_ID)
+    ).all()
+    assert {(l, c): (oh, rs) for l, c, oh, rs in rows} == {
+        (store.id, "B"): (1, 1),
+        (store.id, "A"): (1, 1),
+        (store.id, None): (1, 0),
+        (back.id, "A"): (2, 0),
+        (back.id, None): (1, 0),
+    }
+
+    # stock non ventilé à la source : le reste du transfert arrive en non suivi à destination
+    db_session.execute(
+        update(StockLevel)
+        .where(StockLevel.product_id == PRODUCT_ID, StockLevel.location_id == store.id)
+        .values(qty_on_hand=StockLevel.qty_on_hand + 5)
+    )
+    t = movements.transfer(
+        db_session, product_id=PRODUCT_ID, from_location_id=store.id, to_location_id=back.id, quantity=4, **mv(4)
+    )
+    assert picks(t) == [(None, 1)]
+    back_lots = db_session.execute(
+        select(StockLot.lot_code, StockLot.qty_on_hand)
+        .where(StockLot.product_id == PRODUCT_ID, StockLot.location_id == back.id)
+    ).all()
+    assert dict(back_lots) == {"A": 2, None: 5}
+
+
+def test_hot_pair_lot_allocation_does_not_queue():
+    """
+    GIVEN un couple chaud (4 shards), un seul lot (non suivi) de 100, données commitées
+    WHEN  la transaction A réserve 5 et garde le verrou du lot ; B réserve 5 (lock_timeout 2 s)
+    THEN  B passe sans attendre (lot sauté, reste différé dans stock_lot_pending) ;
+          le rebalance alloue ensuite le reste de B sur le lot
+    """
+    Base.metadata.create_all(bind=engine)
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_510_000_000_000 + seed
+    PRODUCT_ID = 7_510_000_000_000 + seed
+    now = datetime.now(timezone.utc)
+
+    setup = SessionLocal()
+    setup.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    setup.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    setup.flush()
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    setup.add(store)
+    setup.flush()
+    STORE_ID = store.id
+    setup.add(StockLevel(product_id=PRODUCT_ID, location_id=STORE_ID, qty_on_hand=100, qty_reserved=0, qty_on_order=0))
+    setup.flush()
+    lots.receive(setup, PRODUCT_ID, STORE_ID, {(None, None): 100})
+    hot_stock.enable_sharding(setup, PRODUCT_ID, STORE_ID, shards=4)
+    setup.commit()
+
+    a, b = SessionLocal(), SessionLocal()
+    kw = dict(product_id=PRODUCT_ID, location_id=STORE_ID, quantity=5, happened_at=now, reason=None)
+    try:
+        ra = movements.reserve(a, idempotency_key=f"test-fefo-hot-{seed}-a", **kw)
+        assert [l["quantity"] for l in lots.movement_lots(a, ra)] == [5]
+
+        b.execute(text("SET LOCAL lock_timeout = '2s'"))
+        rb = movements.reserve(b, idempotency_key=f"test-fefo-hot-{seed}-b", **kw)
+        assert lots.movement_lots(b, rb) == []
+        a.commit()
+        b.commit()
+
+        hot_stock.rebalance(setup, PRODUCT_ID, STORE_ID)
+        setup.commit()
+        assert [l["quantity"] for l in lots.movement_lots(setup, rb)] == [5]
+        assert setup.scalar(select(StockLot.qty_reserved).where(StockLot.product_id == PRODUCT_ID)) == 10
+        assert setup.scalar(select(StockLotPending.movement_id).where(StockLotPending.product_id == PRODUCT_ID)) is None
+    finally:
+        a.rollback()
+        b.rollback()
+        a.close()
+        b.close()
+        setup.rollback()
+        setup.execute(delete(StockMovementKey).where(StockMovementKey.idempotency_key.like(f"test-fefo-hot-{seed}-%")))
+        setup.execute(delete(StockMovement).where(StockMovement.product_id == PRODUCT_ID))
+        setup.execute(delete(StockLot).where(StockLot.product_id == PRODUCT_ID))
+        setup.execute(delete(StockLevel).where(StockLevel.product_id == PRODUCT_ID))
+        setup.execute(delete(Location).where(Location.id == STORE_ID))
+        setup.execute(delete(Product).where(Product.id == PRODUCT_ID))
+        setup.execute(delete(Site).where(Site.id == SITE_ID))
+        setup.commit()
+        setup.close()
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import delete, select
+
+from backend.app.api.v1.endpoints import stock_movements
+from backend.app.api.v1.endpoints.stock_movements import BatchCreate, _apply_batch
+from backend.app.db.models.models_v1 import Site, Product, Location, StockLevel, StockMovement, StockMovementKey
+from backend.app.db.models.core_types import LocationType, MovementType
+from backend.app.db.session import SessionLocal
+
+
+def test_batch_rejects_per_item_and_replays_concurrent_keys(db_session, monkeypatch):
+    """
+    GIVEN
+    - STORE : on_hand=10
+    - un batch : transfert 4 STORE -> WH, réserve 20 (trop), réserve 3, réserve 2 (clé "race"),
+      puis le transfert répété (même clé)
+    - une requête concurrente enregistre la clé "race" entre la lecture des clés et le flush
+
+    THEN
+    - un résultat par item dans l'ordre de la requête : created, rejected, created, replayed, replayed
+    - les StockLevel sont verrouillés en une passe triée, refaite au rejeu du batch
+    - STORE = (6, 3), WH = 4 ; rejouer le batch ne réapplique rien
+    """
+    seed = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    SITE_ID = 9_870_000_000_000 + seed
+    PRODUCT_ID = 7_870_000_000_000 + seed
+    RACE_MOVEMENT_ID = 6_870_000_000_000 + seed
+
+    db_session.add(Site(id=SITE_ID, name=f"TEST-SITE-{SITE_ID}", timezone="Pacific/Tahiti", active=True))
+    db_session.add(Product(id=PRODUCT_ID, sku=f"TEST-SKU-{PRODUCT_ID}", name="TEST", uom="unit", active=True))
+    db_session.flush()
+    store = Location(site_id=SITE_ID, name="TEST-STORE", type=LocationType.store)
+    wh = Location(site_id=SITE_ID, name="TEST-WH", type=LocationType.warehouse)
+    db_session.add_all([store, wh])
+    db_session.flush()
+    db_session.add(StockLevel(product_id=PRODUCT_ID, location_id=store.id, qty_on_hand=10, qty_reserved=0, qty_on_order=0))
+    db_session.flush()
+
+    now = datetime.now(timezone.utc)
+    key = lambda name: f"test-batch-{seed}-{name}"  # noqa: E731
+    reserve = dict(movement_type=MovementType.reserve, product_id=PRODUCT_ID, location_id=store.id, happened_at=now)
+    transfer = dict(
+        movement_type=MovementType.transfer,
+        product_id=PRODUCT_ID,
+        from_location_id=store.id,
+        to_location_id=wh.id,
+        quantity=4,
+        happened_at=now,
+    )
+    payload = BatchCreate(
+        items=[
+            dict(idempotency_key=key("transfer"), **transfer),
+            dict(idempotency_key=key("too-much"), quantity=20, **reserve),
+            dict(idempotency_key=key("reserve"), quantity=3, **reserve),
+            dict(idempotency_key=key("race"), quantity=2, **reserve),
+            dict(idempotency_key=key("transfer"), **transfer),
+        ]
+    )
+
+    locked = []
+    lock_stock_levels = stock_movements.lock_stock_levels
+
+    def racing_lock(db, keys):
+        locked.append(list(keys))
+        if len(locked) == 1:
+            # requête concurrente : la clé "race" est commitée après la lecture des clés du batch
+            with SessionLocal() as other:
+                other.add(StockMovementKey(idempotency_key=key("race"), movement_id=RACE_MOVEMENT_ID, happened_at=now))
+                other.commit()
+        return lock_stock_levels(db, keys)
+
+    monkeypatch.setattr(stock_movements, "lock_stock_levels", racing_lock)
+    try:
+        res = _apply_batch(db_session, payload)
+
+        assert [(r["idempotency_key"], r["status"]) for r in res["results"]] == [
+            (key("transfer"), "created"),
+            (key("too-much"), "rejected"),
+            (key("reserve"), "created"),
+            (key("race"), "replayed"),
+            (key("transfer"), "replayed"),
+        ]
+        assert res["results"][1]["detail"] == "Insufficient available stock (available=6)"
+        assert res["results"][3]["id"] == RACE_MOVEMENT_ID
+        assert res["results"][4]["id"] == res["results"][0]["id"]
+        assert (res["created"], res["replayed"], res["rejected"]) == (2, 2, 1)
+        assert len(locked) == 2 and sorted(locked[0]) == sorted(locked[1]) == sorted(
+            [(PRODUCT_ID, store.id), (PRODUCT_ID, wh.id)]
+        )
+
+        def levels():
+            rows = db_session.execute(
+                select(StockLevel.location_id, StockLevel.qty_on_hand, StockLevel.qty_reserved)
+                .where(StockLevel.product_id == PRODUCT_ID)
+            ).all()
+            return {loc: (on_hand, reserved) for loc, on_hand, reserved in rows}
+
+        assert levels() == {store.id: (6, 3), wh.id: (4, 0)}
+
+        monkeypatch.setattr(stock_movements, "lock_stock_levels", lock_stock_levels)
+        again = _apply_batch(db_session, payload)
+        assert [r["status"] for r in again["results"]] == ["replayed", "rejected", "replayed", "replayed", "replayed"]
+        assert levels() == {store.id: (6, 3), wh.id: (4, 0)}
+        assert db_session.scalar(
+            select(StockMovement.id).where(StockMovement.product_id == PRODUCT_ID).order_by(StockMovement.id.desc())
+        ) == res["results"][2]["id"]
+    finally:
+        with SessionLocal() as other:
+            other.execute(delete(StockMovementKey).where(StockMovementKey.idempotency_key == key("race")))
+            other.commit()
+
+
+def test_batch_item_key_is_stripped_and_required():
+    """Clé d'item : espaces retirés comme pour l'en-tête ; vide après strip -> 422 sur l'item."""
+    item = dict(
+        movement_type=MovementType.reserve,
+        product_id=1,
+        location_id=1,
+        quantity=1,
+        happened_at=datetime.now(timezone.utc),
+    )
+    assert BatchCreate(items=[dict(idempotency_key="  k-1 ", **item)]).items[0].idempotency_key == "k-1"
+
+    with pytest.raises(ValidationError) as exc:
+        BatchCreate(items=[dict(idempotency_key="k-2", **item), dict(idempotency_key="   ", **item)])
+    assert [e["loc"] for e in exc.value.errors()] == [("items", 1, "idempotency_key")]